@@ -0,0 +1,439 @@
+"""Benchmark the paper API as the library grows.
+
+Runs the app in-process against a fake OpenAI embedding server (or, with
+--embedding-model hashing:<dims> or local:<name>, the app's own CPU encoder),
+fills the ChromaDB collections with synthetic papers up to each requested size
+and measures the main endpoints at every size:
+
+    python benchmark.py --scales 1000,10000,100000 --output results.json
+    python benchmark.py --scales 1000 --compare results.json
+
+Uploads go through the real POST /papers/ endpoint with generated PDFs. The
+bulk of the library is written straight to the collections (the same records
+the ingest path writes) since uploading 100k PDFs one by one would take hours.
+Everything happens in a temporary directory; the real db/ is never touched.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import textwrap
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+
+CATEGORIES = ["nlp", "vision", "rl", "theory", "systems", "robotics"]
+TAGS = ["transformers", "diffusion", "benchmark", "survey", "graphs", "optimization", "privacy", "agents"]
+
+
+class Vocabulary:
+    """Synthetic words plus the embedding dimension each word hashes to."""
+
+    def __init__(self, size: int, dimensions: int, seed: int):
+        rng = random.Random(seed)
+        syllables = ["ka", "lo", "mi", "ra", "te", "su", "no", "vi", "de", "po", "an", "el", "or", "ix"]
+        words = set()
+        while len(words) < size:
+            words.add("".join(rng.choice(syllables) for _ in range(rng.randint(2, 4))))
+        self.words = np.array(sorted(words))
+        self.dimensions = dimensions
+        self.word_dims = np.array([word_dimension(word, dimensions) for word in self.words])
+
+
+def word_dimension(word: str, dimensions: int) -> int:
+    return zlib.crc32(word.encode("utf-8")) % dimensions
+
+
+def embed_text(text: str, dimensions: int) -> List[float]:
+    """Bag-of-words hashing embedding, the same one the fake server returns."""
+    vector = np.zeros(dimensions, dtype=np.float32)
+    for word in text.lower().split():
+        vector[word_dimension(word, dimensions)] += 1.0
+    norm = np.linalg.norm(vector)
+    return (vector / norm if norm else vector).tolist()
+
+
+def start_fake_embedding_server(dimensions: int, latency: float) -> ThreadingHTTPServer:
+    """Serve POST /v1/embeddings like the OpenAI API, on a free local port."""
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            inputs = body["input"] if isinstance(body["input"], list) else [body["input"]]
+            if latency:
+                time.sleep(latency)
+            payload = json.dumps({
+                "object": "list",
+                "model": body.get("model", ""),
+                "data": [
+                    {"object": "embedding", "index": i, "embedding": embed_text(text, dimensions)}
+                    for i, text in enumerate(inputs)
+                ],
+                "usage": {"prompt_tokens": 0, "total_tokens": 0}
+            }).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def make_pdf(pages: List[str]) -> bytes:
+    """A minimal text-only PDF with one Helvetica text block per page."""
+    objects = [b"<< /Type /Catalog /Pages 2 0 R >>", None, b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    kids = []
+    for text in pages:
+        lines = textwrap.wrap(text, 90) or [""]
+        stream = b"BT /F1 9 Tf 40 800 Td 11 TL " + b" ".join(
+            b"(" + line.encode("latin-1", "replace") + b") '" for line in lines
+        ) + b" ET"
+        kids.append(len(objects) + 1)
+        objects.append(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 842] "
+            f"/Resources << /Font << /F1 3 0 R >> >> /Contents {len(objects) + 2} 0 R >>".encode()
+        )
+        objects.append(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+    objects[1] = f"<< /Type /Pages /Kids [{' '.join(f'{kid} 0 R' for kid in kids)}] /Count {len(kids)} >>".encode()
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, obj in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += f"{number} 0 obj\n".encode() + obj + b"\nendobj\n"
+    xref = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    out += b"".join(f"{offset:010d} 00000 n \n".encode() for offset in offsets)
+    out += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode()
+    return bytes(out)
+
+
+class LibraryGenerator:
+    """Deterministic synthetic papers: metadata plus passage text and embeddings."""
+
+    def __init__(self, vocabulary: Vocabulary, folder_ids: List[str], passages_per_paper: int, seed: int):
+        self.vocabulary = vocabulary
+        self.folder_ids = folder_ids
+        self.passages_per_paper = passages_per_paper
+        self.rng = random.Random(seed)
+        self.np_rng = np.random.default_rng(seed)
+
+    def metadata(self, number: int) -> Dict[str, Any]:
+        rng = self.rng
+        return {
+            "title": f"Synthetic paper {number} on {' '.join(rng.sample(list(self.vocabulary.words[:500]), 3))}",
+            "authors": ", ".join(f"Author {rng.randint(1, 5000)}" for _ in range(rng.randint(1, 4))),
+            "year": rng.randint(1995, 2024),
+            "category": rng.choice(CATEGORIES),
+            "tags": rng.sample(TAGS, rng.randint(0, 3)),
+            "abstract": ""
+        }
+
+    def passages(self, words_per_passage: int) -> Tuple[List[str], List[List[float]]]:
+        vocabulary = self.vocabulary
+        # Zipf-like word frequencies so BM25 and the vectors see realistic skew
+        indices = np.minimum(
+            self.np_rng.zipf(1.3, size=(self.passages_per_paper, words_per_passage)) - 1,
+            len(vocabulary.words) - 1
+        )
+        texts = [" ".join(vocabulary.words[row]) for row in indices]
+        embeddings = []
+        for row in indices:
+            vector = np.bincount(vocabulary.word_dims[row], minlength=vocabulary.dimensions).astype(np.float32)
+            embeddings.append((vector / np.linalg.norm(vector)).tolist())
+        return texts, embeddings
+
+    def pdf(self, words: int) -> bytes:
+        indices = self.np_rng.integers(0, len(self.vocabulary.words), size=words)
+        text = " ".join(self.vocabulary.words[indices])
+        return make_pdf([text[i:i + 3000] for i in range(0, len(text), 3000)])
+
+
+def populate(
+    main,
+    generator: LibraryGenerator,
+    start: int,
+    stop: int,
+    batch_size: int = 500,
+    embed: Optional[Callable[[List[str]], List[List[float]]]] = None
+):
+    """Write papers start..stop-1 straight to the collections and in-memory indexes.
+
+    Passages get the generator's bag-of-words vectors unless `embed` is given.
+    """
+    for batch_start in range(start, stop, batch_size):
+        numbers = range(batch_start, min(batch_start + batch_size, stop))
+        ids, metadatas, documents, embeddings = [], [], [], []
+        passage_ids, passage_metadatas, passage_docs, passage_embeddings = [], [], [], []
+        for number in numbers:
+            filename = f"synthetic_{number:07d}.pdf"
+            metadata = main.build_paper_metadata(
+                generator.metadata(number), filename, generator.rng.choice(generator.folder_ids)
+            )
+            texts, vectors = generator.passages(main.CHUNK_TOKENS // 3)
+            if embed is not None:
+                vectors = embed(texts)
+            records = main.passage_records(filename, 0, len(texts), metadata)
+            passage_ids.extend(records["ids"])
+            passage_metadatas.extend(records["metadatas"])
+            passage_docs.extend(texts)
+            passage_embeddings.extend(vectors)
+            metadata["passage_count"] = len(texts)
+            ids.append(filename)
+            metadatas.append(metadata)
+            documents.append(texts[0])
+            embeddings.append(main.mean_embedding(vectors))
+        main.passages.add(ids=passage_ids, documents=passage_docs, embeddings=passage_embeddings, metadatas=passage_metadatas)
+        main.collection.add(ids=ids, documents=documents, embeddings=embeddings, metadatas=metadatas)
+        main.lexical_index.add(passage_ids, passage_docs)
+        if main.vector_store is not None:
+            main.vector_store.add(passage_ids, passage_embeddings)
+        with main.paper_index.batch():
+            for filename, metadata in zip(ids, metadatas):
+                main.paper_index.upsert(filename, metadata)
+
+
+def summarize(latencies: List[float], elapsed: float, errors: int) -> Dict[str, Any]:
+    """Latency percentiles in milliseconds and throughput in requests per second."""
+    ordered = sorted(latencies)
+
+    def percentile(p: float) -> float:
+        if not ordered:
+            return 0.0
+        return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))] * 1000
+
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "throughput_rps": len(latencies) / elapsed if elapsed else 0.0,
+        "mean_ms": statistics.fmean(ordered) * 1000 if ordered else 0.0,
+        "p50_ms": percentile(50),
+        "p95_ms": percentile(95),
+        "p99_ms": percentile(99),
+        "max_ms": ordered[-1] * 1000 if ordered else 0.0
+    }
+
+
+def measure(request: Callable[[int], Any], count: int, concurrency: int) -> Dict[str, Any]:
+    """Call `request(i)` `count` times with `concurrency` client threads."""
+    latencies, errors = [], 0
+    lock = threading.Lock()
+
+    def run(i: int):
+        nonlocal errors
+        started = time.perf_counter()
+        response = request(i)
+        latency = time.perf_counter() - started
+        with lock:
+            latencies.append(latency)
+            if response.status_code >= 400:
+                errors += 1
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(run, range(count)))
+    return summarize(latencies, time.perf_counter() - started, errors)
+
+
+def run_endpoints(http, generator: LibraryGenerator, folder_ids: List[str], args, scale: int) -> Dict[str, Any]:
+    rng = random.Random(args.seed + scale)
+    words = list(generator.vocabulary.words[:2000])
+    count, concurrency = args.requests, args.concurrency
+    results = {}
+
+    # Generated up front so PDF generation isn't part of the measured latency
+    pdfs = [generator.pdf(args.upload_words) for _ in range(args.uploads)]
+
+    def upload(i: int):
+        return http.post(
+            "/papers/",
+            files={"file": ("paper.pdf", pdfs[i], "application/pdf")},
+            data={"metadata": json.dumps({"title": f"Uploaded {scale} {i}"}), "folder_id": rng.choice(folder_ids)}
+        )
+
+    def unique_query(i: int) -> str:
+        # Distinct queries so the search cache doesn't hide the real cost
+        return f"{' '.join(rng.sample(words, 3))} q{scale}x{i}"
+
+    benchmarks = {
+        "upload_paper": (upload, args.uploads),
+        "list_papers": (lambda i: http.get("/papers/", params={"offset": rng.randint(0, scale), "limit": 60}), count),
+        "list_papers_sorted": (lambda i: http.get("/papers/", params={"sort": "year", "order": "desc", "limit": 60}), count),
+        "stats": (lambda i: http.get("/stats"), count),
+        "papers_by_folder": (lambda i: http.get(f"/papers/by-folder/{rng.choice(folder_ids)}", params={"limit": 60}), count),
+        "search_hybrid": (lambda i: http.get("/search/", params={"query": unique_query(i)}), count),
+        "search_vector": (lambda i: http.get("/search/", params={"query": unique_query(i), "mode": "vector"}), count),
+        "search_lexical": (lambda i: http.get("/search/", params={"query": unique_query(i), "mode": "lexical"}), count),
+        "search_filtered": (
+            lambda i: http.get("/search/", params={"query": unique_query(i), "category": rng.choice(CATEGORIES), "year_from": 2010}),
+            count
+        ),
+        "search_repeated": (lambda i: http.get("/search/", params={"query": "kalo mira tesu"}), count)
+    }
+    for name, (request, n) in benchmarks.items():
+        if args.only and name not in args.only:
+            continue
+        results[name] = measure(request, n, concurrency)
+        print(
+            f"  {name:20s} p50 {results[name]['p50_ms']:8.2f} ms  p95 {results[name]['p95_ms']:8.2f} ms  "
+            f"p99 {results[name]['p99_ms']:8.2f} ms  {results[name]['throughput_rps']:8.1f} req/s"
+        )
+    return results
+
+
+def compare(current: Dict[str, Any], baseline_path: str):
+    """Print p50/p95 changes against an earlier results file."""
+    with open(baseline_path, "r") as f:
+        baseline = json.load(f)
+    print(f"\nCompared with {baseline_path} ({baseline['meta'].get('git_commit', 'unknown')}):")
+    for scale, result in current["scales"].items():
+        previous = baseline["scales"].get(scale)
+        if previous is None:
+            continue
+        for name, stats in result["endpoints"].items():
+            before = previous["endpoints"].get(name)
+            if before is None:
+                continue
+            changes = []
+            for key in ("p50_ms", "p95_ms"):
+                delta = (stats[key] - before[key]) / before[key] * 100 if before[key] else 0.0
+                changes.append(f"{key[:3]} {before[key]:8.2f} -> {stats[key]:8.2f} ms ({delta:+6.1f}%)")
+            print(f"  {scale:>7s} {name:20s} " + "  ".join(changes))
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=REPO_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scales", default="1000,10000,100000", help="comma separated library sizes")
+    parser.add_argument("--requests", type=int, default=200, help="requests per endpoint and scale")
+    parser.add_argument("--uploads", type=int, default=20, help="uploads per scale")
+    parser.add_argument("--upload-words", type=int, default=3000, help="words per uploaded PDF")
+    parser.add_argument("--concurrency", type=int, default=1, help="concurrent client threads")
+    parser.add_argument("--passages-per-paper", type=int, default=4)
+    parser.add_argument("--dimensions", type=int, default=256, help="fake embedding dimensions")
+    parser.add_argument("--embedding-latency", type=float, default=0.0, help="seconds added to each fake embedding call")
+    parser.add_argument(
+        "--embedding-model",
+        help="embed with this EMBEDDING_MODEL instead of the fake OpenAI server, e.g. hashing:256 (no network)"
+    )
+    parser.add_argument("--folders", type=int, default=20)
+    parser.add_argument("--only", type=lambda value: value.split(","), help="comma separated endpoint names")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--workdir", help="directory for the temporary library (default: a new temp dir)")
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--compare", help="earlier results file to compare against")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    scales = sorted(int(scale) for scale in args.scales.split(","))
+
+    output = os.path.abspath(args.output)
+    baseline = os.path.abspath(args.compare) if args.compare else None
+
+    local_embeddings = (args.embedding_model or "").split(":")[0] in ("hashing", "local")
+    embedding_server = None
+    if not local_embeddings:
+        embedding_server = start_fake_embedding_server(args.dimensions, args.embedding_latency)
+    workdir = args.workdir or tempfile.mkdtemp(prefix="paper-benchmark-")
+    os.makedirs(workdir, exist_ok=True)
+    os.chdir(workdir)
+    os.environ.update({"OPENAI_API_KEY": "benchmark", "ANONYMIZED_TELEMETRY": "False"})
+    if embedding_server is not None:
+        os.environ["OPENAI_BASE_URL"] = f"http://127.0.0.1:{embedding_server.server_port}/v1"
+    if args.embedding_model:
+        os.environ["EMBEDDING_MODEL"] = args.embedding_model
+    # The app keeps its state relative to the working directory, so import it from here
+    sys.path.insert(0, REPO_DIR)
+    import main as app_module
+    import httpx
+    import uvicorn
+
+    with app_module.folder_store.transaction() as data:
+        for i in range(args.folders):
+            data["folders"].append({
+                "id": f"bench-{i}", "name": f"Benchmark {i}", "parent_id": None, "description": ""
+            })
+    folder_ids = ["default"] + [f"bench-{i}" for i in range(args.folders)]
+
+    vocabulary = Vocabulary(20000, args.dimensions, args.seed)
+    generator = LibraryGenerator(vocabulary, folder_ids, args.passages_per_paper, args.seed)
+
+    server = uvicorn.Server(uvicorn.Config(app_module.app, host="127.0.0.1", port=0, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    port = server.servers[0].sockets[0].getsockname()[1]
+    http = httpx.Client(base_url=f"http://127.0.0.1:{port}", timeout=300)
+    # The app builds its indexes in the background; populating must not race it
+    while http.get("/readyz").status_code != 200:
+        time.sleep(0.05)
+
+    results = {
+        "meta": {
+            "git_commit": git_commit(),
+            "timestamp": str(datetime.now()),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "workdir": workdir,
+            "args": vars(args)
+        },
+        "scales": {}
+    }
+    # Local encoders embed the synthetic passages too, so searches match their vectors
+    embed = app_module.get_embedding_provider().embed if local_embeddings else None
+    populated = 0
+    for scale in scales:
+        print(f"Populating {scale} papers...")
+        started = time.perf_counter()
+        populate(app_module, generator, populated, scale, embed=embed)
+        populate_seconds = time.perf_counter() - started
+        populated = scale
+        print(f"Benchmarking at {scale} papers (populated in {populate_seconds:.1f}s):")
+        results["scales"][str(scale)] = {
+            "papers": app_module.collection.count(),
+            "populate_seconds": populate_seconds,
+            "endpoints": run_endpoints(http, generator, folder_ids, args, scale)
+        }
+
+    server.should_exit = True
+    if embedding_server is not None:
+        embedding_server.shutdown()
+    with open(output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"\nResults written to {output}")
+    if baseline:
+        compare(results, baseline)
+
+
+if __name__ == "__main__":
+    main()
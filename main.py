@@ -1,762 +1,4886 @@
-import os
-from typing import List, Optional, Dict, Any
-from fastapi import FastAPI, File, UploadFile, HTTPException, Form, Body, Query
-from fastapi.responses import FileResponse, HTMLResponse
-from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
-import chromadb
-from pypdf import PdfReader
-import shutil
-from datetime import datetime
-from pydantic import BaseModel
-from openai import OpenAI
-from dotenv import load_dotenv
-import json
-import re
-import uuid
-
-# Load environment variables
-load_dotenv()
-
-# Initialize OpenAI client
-client = OpenAI(
-    api_key=os.getenv("OPENAI_API_KEY"),
-    base_url=os.getenv("OPENAI_BASE_URL")
-)
-
-# Initialize FastAPI app
-app = FastAPI(title="Research Papers Assistant")
-
-# Add CORS middleware
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],  # For development only - configure properly in production
-    allow_credentials=True,
-    allow_methods=["GET", "POST", "PUT", "DELETE"],  # Explicitly list allowed methods
-    allow_headers=["*"],
-)
-
-# Initialize ChromaDB with new configuration
-chroma_client = chromadb.PersistentClient(path="db")
-
-# Create collection for research papers
-collection = chroma_client.get_or_create_collection(name="research_papers")
-
-# Ensure research_papers directory exists
-UPLOAD_DIR = "research_papers"
-os.makedirs(UPLOAD_DIR, exist_ok=True)
-
-# Define models
-class PaperMetadata(BaseModel):
-    title: str
-    authors: str = ""
-    year: Optional[int] = None
-    keywords: List[str] = []
-    tags: List[str] = []
-    category: Optional[str] = None
-    abstract: Optional[str] = ""
-    folder_id: Optional[str] = None  # Reference to folder
-
-class Folder(BaseModel):
-    id: str
-    name: str
-    parent_id: Optional[str] = None
-    description: Optional[str] = ""
-    
-class FolderCreate(BaseModel):
-    name: str
-    parent_id: Optional[str] = None
-    description: Optional[str] = ""
-    
-class FolderUpdate(BaseModel):
-    name: Optional[str] = None
-    parent_id: Optional[str] = None
-    description: Optional[str] = None
-
-# Initialize folder storage
-FOLDER_FILE = "folders.json"
-
-def load_folders():
-    """Load folders from JSON file and ensure Default Library exists"""
-    if os.path.exists(FOLDER_FILE):
-        with open(FOLDER_FILE, "r") as f:
-            folders_data = json.load(f)
-    else:
-        folders_data = {"folders": []}
-
-    # Ensure Default Library exists
-    if not any(f["id"] == "default" for f in folders_data["folders"]):
-        ## add default folder
-        folders_data["folders"].append({
-            "id": "default",
-            "name": "Default",
-            "parent_id": None,
-            "description": "Default folder for papers"
-        })
-        ## add trash folder
-        folders_data["folders"].append({
-            "id": "trash",
-            "name": "Trash",
-            "parent_id": None,
-            "description": "Trash folder for papers"
-        })
-        save_folders(folders_data)
-
-    return folders_data
-
-def save_folders(folders_data):
-    with open(FOLDER_FILE, "w") as f:
-        json.dump(folders_data, f)
-
-# Helper functions
-def clean_text(text: str) -> str:
-    """Clean text to remove problematic characters."""
-    # Replace problematic Unicode surrogates and control characters
-    text = re.sub(r'[\ud800-\udfff]', '', text)
-    text = re.sub(r'[\x00-\x08\x0b\x0c\x0e-\x1f\x7f]', '', text)
-    return text
-
-def extract_text_from_pdf(file_path: str) -> str:
-    """Extract text content from a PDF file."""
-    reader = PdfReader(file_path)
-    text = ""
-    for page in reader.pages:
-        try:
-            page_text = page.extract_text() or ""
-            text += clean_text(page_text) + "\n"
-        except Exception as e:
-            # If extraction fails for a page, continue with whatever we have
-            print(f"Warning: Could not extract text from page: {str(e)}")
-            continue
-    return text
-
-def get_embedding(text: str) -> List[float]:
-    """Generate embeddings using OpenAI's API."""
-    response = client.embeddings.create(
-        model="text-embedding-ada-002",
-        input=text
-    )
-    return response.data[0].embedding
-
-def sanitize_filename(title: str, original_extension: str = ".pdf") -> str:
-    """Convert a title to a valid filename."""
-    # Remove invalid characters and replace spaces with underscores
-    filename = re.sub(r'[<>:"/\\|?*]', '', title)
-    filename = filename.replace(' ', '_')
-    
-    # Ensure the filename ends with .pdf
-    if not filename.lower().endswith(original_extension):
-        filename += original_extension
-        
-    return filename
-
-def ensure_unique_filename(base_filename: str, directory: str) -> str:
-    """Ensure filename is unique by adding a number if necessary."""
-    filename = base_filename
-    counter = 1
-    
-    # Split filename into name and extension
-    name, ext = os.path.splitext(filename)
-    
-    while os.path.exists(os.path.join(directory, filename)):
-        filename = f"{name}_{counter}{ext}"
-        counter += 1
-        
-    return filename
-
-# Serve the main index.html page
-@app.get("/", response_class=HTMLResponse)
-async def read_root():
-    """Serve the main HTML page"""
-    with open("index.html", "r") as f:
-        html_content = f.read()
-    return HTMLResponse(content=html_content)
-
-# Serve static files (JavaScript, CSS)
-app.mount("/static", StaticFiles(directory="."), name="static")
-
-@app.get("/stats")
-async def get_stats():
-    """Get statistics about the paper collection"""
-    try:
-        results = collection.get(include=["metadatas"])
-        papers = results["metadatas"] if results["metadatas"] else []
-    except Exception as e:
-        # Return empty stats if there's an error or empty collection
-        return {
-            "total_papers": 0,
-            "categories": {},
-            "tags": [],
-            "years": {}
-        }
-    
-    # Collect stats
-    total_papers = len(papers)
-    categories = {}
-    tags = set()
-    years = {}
-    
-    for paper in papers:
-        # Count categories
-        category = paper.get("category")
-        if category:
-            categories[category] = categories.get(category, 0) + 1
-            
-        # Collect unique tags - handle JSON string format
-        paper_tags = paper.get("tags", "[]")
-        if isinstance(paper_tags, str):
-            try:
-                # Parse JSON string to list
-                parsed_tags = json.loads(paper_tags)
-                if isinstance(parsed_tags, list):
-                    tags.update(parsed_tags)
-            except json.JSONDecodeError:
-                print(f"Warning: Could not parse tags JSON: {paper_tags}")
-        elif isinstance(paper_tags, list):
-            tags.update(paper_tags)
-        
-        # Count papers by year
-        year = paper.get("year")
-        if year:
-            years[year] = years.get(year, 0) + 1
-    
-    return {
-        "total_papers": total_papers,
-        "categories": categories,
-        "tags": list(tags),
-        "years": years
-    }
-
-@app.get("/papers/by-tag/{tag}")
-async def get_papers_by_tag(tag: str):
-    """Get papers with specific tag"""
-    try:
-        results = collection.get(include=["metadatas"])
-        papers = []
-        for paper in results["metadatas"]:
-            # Skip papers that are in the trash folder
-            if paper.get("folder_id") == "trash":
-                continue
-                
-            paper_tags = paper.get("tags", "[]")
-            # Parse tags if they're stored as JSON string
-            if isinstance(paper_tags, str):
-                try:
-                    parsed_tags = json.loads(paper_tags)
-                    if isinstance(parsed_tags, list) and tag in parsed_tags:
-                        papers.append(paper)
-                except json.JSONDecodeError:
-                    print(f"Warning: Could not parse tags JSON: {paper_tags}")
-            elif isinstance(paper_tags, list) and tag in paper_tags:
-                papers.append(paper)
-    except Exception as e:
-        print(f"Error in get_papers_by_tag: {str(e)}")
-        papers = []
-    return {"papers": papers}
-
-@app.get("/papers/by-category/{category}")
-async def get_papers_by_category(category: str):
-    """Get papers in specific category"""
-    try:
-        results = collection.get(include=["metadatas"])
-        papers = [
-            paper for paper in results["metadatas"]
-            if paper.get("category") == category and paper.get("folder_id") != "trash"
-        ]
-    except Exception:
-        papers = []
-    return {"papers": papers}
-
-async def check_file_exists(filename: str) -> bool:
-    """Check if a file with the given filename exists in any folder."""
-    try:
-        results = collection.get(ids=[filename], include=["metadatas"])
-        return bool(results["ids"])
-    except Exception:
-        return False
-
-@app.post("/papers/")
-async def upload_paper(
-    file: UploadFile = File(...),
-    metadata: Optional[str] = Form(None),
-    folder_id: Optional[str] = Form('default'),  # Default to 'default' folder
-    override: bool = Form(False)  # New parameter to handle overrides
-):
-    """Upload a research paper and store its embedding."""
-    if not file.filename.endswith('.pdf'):
-        raise HTTPException(status_code=400, detail="Only PDF files are accepted")
-    
-    # Validate folder if specified
-    if folder_id:
-        folders_data = load_folders()
-        folder_exists = any(f["id"] == folder_id for f in folders_data["folders"])
-        if not folder_exists:
-            raise HTTPException(status_code=404, detail="Folder not found")
-    
-    # Parse metadata
-    try:
-        metadata_dict = json.loads(metadata) if metadata else {}
-        if not metadata_dict.get('title'):
-            metadata_dict['title'] = os.path.splitext(file.filename)[0]  # Use original filename without extension as title
-    except json.JSONDecodeError:
-        metadata_dict = {'title': os.path.splitext(file.filename)[0]}
-    
-    # Create a sanitized filename from the title
-    original_ext = os.path.splitext(file.filename)[1].lower()
-    sanitized_filename = sanitize_filename(metadata_dict['title'], original_ext)
-    
-    # Check if file exists
-    if await check_file_exists(sanitized_filename):
-        if not override:
-            raise HTTPException(
-                status_code=409,  # Conflict
-                detail={
-                    "message": "File with this name already exists",
-                    "filename": sanitized_filename,
-                    "requires_override": True
-                }
-            )
-        # If override is True, we'll continue and replace the existing file
-    else:
-        # If file doesn't exist, ensure unique filename
-        sanitized_filename = ensure_unique_filename(sanitized_filename, UPLOAD_DIR)
-    
-    # Save the file with the new filename
-    file_path = os.path.join(UPLOAD_DIR, sanitized_filename)
-    with open(file_path, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
-    
-    # Extract text and generate embedding
-    try:
-        text = extract_text_from_pdf(file_path)
-        
-        # Ensure the text is not empty
-        if not text.strip():
-            # Clean up file if text extraction fails
-            os.remove(file_path)
-            raise ValueError("No text could be extracted from the PDF file.")
-        
-        # Truncate text if it's too long (OpenAI has token limits)
-        # Roughly 8000 chars is about 2000 tokens which is a safe limit
-        if len(text) > 8000:
-            text = text[:8000]
-            
-        embedding = get_embedding(text)
-        
-        # Prepare sanitized metadata for ChromaDB
-        sanitized_metadata = {
-            "filename": sanitized_filename,  # Store the new filename
-            "upload_date": str(datetime.now()),
-            "title": metadata_dict.get('title', sanitized_filename),
-            "authors": metadata_dict.get('authors', "")
-        }
-        
-        # Add folder_id to metadata, defaulting to 'default'
-        sanitized_metadata["folder_id"] = folder_id
-        
-        # Handle keywords (convert list to JSON string if needed)
-        keywords = metadata_dict.get('keywords', [])
-        if isinstance(keywords, list):
-            sanitized_metadata["keywords"] = json.dumps(keywords)
-        else:
-            sanitized_metadata["keywords"] = "[]"
-            
-        # Handle tags (convert list to JSON string if needed)
-        tags = metadata_dict.get('tags', [])
-        if isinstance(tags, list):
-            sanitized_metadata["tags"] = json.dumps(tags)
-        else:
-            sanitized_metadata["tags"] = "[]"
-        
-        # Handle abstract
-        sanitized_metadata["abstract"] = metadata_dict.get('abstract', "")
-        
-        # Handle year field (must be int or str, not None)
-        year = metadata_dict.get('year')
-        if year is not None:
-            sanitized_metadata["year"] = year
-        
-        # Handle category field (must be str, not None)
-        category = metadata_dict.get('category')
-        if category is not None and category != "":
-            sanitized_metadata["category"] = category
-
-        # Delete existing document if overriding
-        if override:
-            try:
-                collection.delete(ids=[sanitized_filename])
-            except Exception:
-                pass
-        
-        # Store in ChromaDB
-        collection.add(
-            documents=[text],
-            embeddings=[embedding],
-            metadatas=[sanitized_metadata],
-            ids=[sanitized_filename]  # Use the new filename as ID
-        )
-        return {"message": "Paper uploaded successfully", "filename": sanitized_filename}
-    except Exception as e:
-        # Clean up file if processing fails
-        if os.path.exists(file_path):
-            os.remove(file_path)
-        raise HTTPException(status_code=500, detail=str(e))
-
-@app.put("/papers/{filename}/metadata")
-async def update_paper_metadata(filename: str, metadata: Dict[str, Any]):
-    """Update paper metadata"""
-    try:
-        # Get existing metadata
-        results = collection.get(
-            ids=[filename],
-            include=["metadatas", "documents", "embeddings"]
-        )
-        
-        if not results["ids"]:
-            raise HTTPException(status_code=404, detail="Paper not found")
-        
-        # Update metadata while preserving existing data
-        existing_metadata = results["metadatas"][0]
-        
-        # Convert None values to appropriate types for ChromaDB
-        updated_metadata = {
-            "filename": filename,
-            "upload_date": existing_metadata["upload_date"],
-            "title": metadata.get("title") or existing_metadata.get("title", ""),
-            "authors": metadata.get("authors") or existing_metadata.get("authors", ""),
-            "year": metadata.get("year") if metadata.get("year") is not None else existing_metadata.get("year", ""),
-            "category": metadata.get("category") or existing_metadata.get("category", ""),
-            "tags": json.dumps(metadata.get("tags", [])),  # Convert tags list to JSON string
-            "abstract": metadata.get("abstract") or existing_metadata.get("abstract", ""),
-            "folder_id": metadata.get("folder_id") or existing_metadata.get("folder_id", "default")
-        }
-        
-        # Update in ChromaDB
-        collection.update(
-            ids=[filename],
-            metadatas=[updated_metadata]
-        )
-        
-        return {"message": "Metadata updated successfully"}
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
-
-@app.get("/papers/")
-async def list_papers():
-    """List all stored papers."""
-    try:
-        results = collection.get(include=["metadatas"])
-        return {"papers": results["metadatas"] if results["metadatas"] else []}
-    except Exception:
-        return {"papers": []}
-
-@app.get("/papers/{filename}")
-async def get_paper(filename: str):
-    """Download a specific paper."""
-    file_path = os.path.join(UPLOAD_DIR, filename)
-    if not os.path.exists(file_path):
-        raise HTTPException(status_code=404, detail="Paper not found")
-    return FileResponse(file_path)
-
-@app.get("/papers/{filename}/metadata")
-async def get_paper_metadata(filename: str):
-    """Get metadata for a specific paper."""
-    try:
-        results = collection.get(
-            ids=[filename],
-            include=["metadatas"]
-        )
-        
-        if not results["ids"]:
-            raise HTTPException(status_code=404, detail="Paper not found")
-            
-        return results["metadatas"][0]
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
-
-@app.delete("/papers/{filename}")
-async def delete_paper(filename: str, soft_delete: bool = True):
-    """Delete a paper. If soft_delete=True, moves it to trash folder, otherwise permanently deletes it."""
-    try:
-        # Get existing metadata first
-        results = collection.get(
-            ids=[filename],
-            include=["metadatas"]
-        )
-        
-        if not results["ids"]:
-            raise HTTPException(status_code=404, detail="Paper not found")
-        
-        current_metadata = results["metadatas"][0]
-        file_path = os.path.join(UPLOAD_DIR, filename)
-        
-        if soft_delete and current_metadata.get("folder_id") != "trash":
-            # Store original folder_id and move to trash
-            current_metadata["original_folder_id"] = current_metadata.get("folder_id")
-            current_metadata["folder_id"] = "trash"
-            collection.update(
-                ids=[filename],
-                metadatas=[current_metadata]
-            )
-            return {"message": "Paper moved to trash"}
-        else:
-            # Hard delete - remove from database and file system
-            collection.delete(ids=[filename])
-            if os.path.exists(file_path):
-                os.remove(file_path)
-            return {"message": "Paper permanently deleted"}
-            
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
-
-@app.get("/search/")
-async def search_papers(query: str, n_results: int = 5):
-    """Search papers by similarity."""
-    if not query:
-        raise HTTPException(status_code=400, detail="Query cannot be empty")
-        
-    try:
-        query_embedding = get_embedding(query)
-        
-        # Handle empty collection gracefully
-        try:
-            results = collection.query(
-                query_embeddings=[query_embedding],
-                n_results=n_results,
-                include=["metadatas", "documents"]
-            )
-            
-            return {
-                "results": [
-                    {
-                        "metadata": meta,
-                        "content": doc[:1000] + "..." if len(doc) > 1000 else doc
-                    }
-                    for meta, doc in zip(results["metadatas"][0], results["documents"][0])
-                ]
-            }
-        except Exception as query_error:
-            # If collection is empty or other error
-            return {"results": []}
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
-
-# Folder Management Endpoints
-@app.get("/folders/")
-async def list_folders():
-    """List all folders"""
-    folders_data = load_folders()
-    return folders_data
-
-@app.post("/folders/", response_model=Folder)
-async def create_folder(folder: FolderCreate):
-    """Create a new folder"""
-    folders_data = load_folders()
-    
-    # Check if folder with same name already exists at the same level
-    existing_folders = folders_data["folders"]
-    for existing_folder in existing_folders:
-        if existing_folder["name"].lower() == folder.name.lower() and existing_folder["parent_id"] == folder.parent_id:
-            raise HTTPException(
-                status_code=409,
-                detail="A folder with this name already exists at this level"
-            )
-    
-    # Create new folder with UUID
-    new_folder = {
-        "id": str(uuid.uuid4()),
-        "name": folder.name,
-        "parent_id": folder.parent_id,
-        "description": folder.description
-    }
-    
-    folders_data["folders"].append(new_folder)
-    save_folders(folders_data)
-    
-    return new_folder
-
-@app.put("/folders/{folder_id}", response_model=Folder)
-async def update_folder(folder_id: str, folder_update: FolderUpdate):
-    """Update a folder"""
-    if folder_id == "default":
-        raise HTTPException(status_code=400, detail="Cannot modify Default Library")
-        
-    folders_data = load_folders()
-    
-    # Find the folder to update
-    folder_index = None
-    for i, folder in enumerate(folders_data["folders"]):
-        if folder["id"] == folder_id:
-            folder_index = i
-            break
-    
-    if folder_index is None:
-        raise HTTPException(status_code=404, detail="Folder not found")
-    
-    # Get folder's current state
-    current_folder = folders_data["folders"][folder_index]
-    
-    # Check for duplicate name only if name is being updated
-    if folder_update.name is not None and folder_update.name != current_folder["name"]:
-        parent_id = folder_update.parent_id if folder_update.parent_id is not None else current_folder["parent_id"]
-        for existing_folder in folders_data["folders"]:
-            if (existing_folder["name"].lower() == folder_update.name.lower() and 
-                existing_folder["parent_id"] == parent_id and 
-                existing_folder["id"] != folder_id):
-                raise HTTPException(
-                    status_code=409,
-                    detail="A folder with this name already exists at this level"
-                )
-    
-    # Update folder fields
-    if folder_update.name is not None:
-        current_folder["name"] = folder_update.name
-    
-    if folder_update.description is not None:
-        current_folder["description"] = folder_update.description
-    
-    if folder_update.parent_id is not None:
-        # Validate parent folder if specified
-        if folder_update.parent_id:
-            parent_exists = any(f["id"] == folder_update.parent_id for f in folders_data["folders"])
-            if not parent_exists:
-                raise HTTPException(status_code=404, detail="Parent folder not found")
-            
-            # Check for circular reference
-            if folder_update.parent_id == folder_id:
-                raise HTTPException(status_code=400, detail="Folder cannot be its own parent")
-        
-        current_folder["parent_id"] = folder_update.parent_id
-    
-    folders_data["folders"][folder_index] = current_folder
-    save_folders(folders_data)
-    
-    return current_folder
-
-@app.delete("/folders/{folder_id}")
-async def delete_folder(
-    folder_id: str, 
-    trash_folder_id: Optional[str] = Query(None),
-    move_papers: bool = True
-):
-    """Delete a folder and move its papers to the trash folder"""
-    if folder_id == "default":
-        raise HTTPException(status_code=400, detail="Cannot delete Default Library")
-    
-    if folder_id == "trash":
-        raise HTTPException(status_code=400, detail="Cannot delete the Trash folder")
-        
-    folders_data = load_folders()
-    
-    # Check if folder exists and get it
-    folder_exists = False
-    for i, folder in enumerate(folders_data["folders"]):
-        if folder["id"] == folder_id:
-            folder_exists = True
-            folders_data["folders"].pop(i)
-            break
-    
-    if not folder_exists:
-        raise HTTPException(status_code=404, detail="Folder not found")
-
-    # Always use trash folder by default, override if specific trash_folder_id provided
-    destination_folder_id = "trash"
-    if trash_folder_id and trash_folder_id != "trash":
-        if any(f["id"] == trash_folder_id for f in folders_data["folders"]):
-            destination_folder_id = trash_folder_id
-        else:
-            raise HTTPException(status_code=404, detail="Specified destination folder not found")
-    
-    # Move papers to trash folder
-    if move_papers:
-        try:
-            # Get all papers first
-            results = collection.get(include=["metadatas", "documents", "embeddings"])
-            if results and results["ids"]:
-                for i, metadata in enumerate(results["metadatas"]):
-                    if metadata.get("folder_id") == folder_id:
-                        # Create updated metadata with new folder_id
-                        updated_metadata = dict(metadata)
-                        updated_metadata["folder_id"] = destination_folder_id
-                        
-                        # Update the paper in ChromaDB
-                        collection.update(
-                            ids=[results["ids"][i]],
-                            metadatas=[updated_metadata],
-                            documents=[results["documents"][i]],
-                            embeddings=[results["embeddings"][i]]
-                        )
-        except Exception as e:
-            print(f"Error moving papers: {str(e)}")
-            raise HTTPException(status_code=500, detail=f"Failed to move papers: {str(e)}")
-    
-    # Update child folders to be under trash folder too
-    for folder in folders_data["folders"]:
-        if folder.get("parent_id") == folder_id:
-            folder["parent_id"] = destination_folder_id
-    
-    save_folders(folders_data)
-    
-    return {"message": "Folder deleted successfully"}
-
-@app.get("/papers/by-folder/{folder_id}")
-async def get_papers_by_folder(folder_id: str):
-    """Get papers in a specific folder"""
-    try:
-        results = collection.get(include=["metadatas"])
-        papers = []
-        
-        for paper in results["metadatas"]:
-            # Check if paper is in this folder
-            paper_folder_id = paper.get("folder_id")
-            if paper_folder_id == folder_id:
-                papers.append(paper)
-    except Exception:
-        papers = []
-        
-    return {"papers": papers}
-
-@app.put("/papers/{filename}/move")
-async def move_paper(filename: str, folder_id: Optional[str] = None):
-    """Move a paper to a different folder"""
-    # Validate folder if specified
-    if folder_id:
-        folders_data = load_folders()
-        folder_exists = any(f["id"] == folder_id for f in folders_data["folders"])
-        if not folder_exists:
-            raise HTTPException(status_code=404, detail="Folder not found")
-    
-    try:
-        # Get existing metadata
-        results = collection.get(
-            ids=[filename],
-            include=["metadatas"]
-        )
-        
-        if not results["ids"]:
-            raise HTTPException(status_code=404, detail="Paper not found")
-        
-        # Update metadata with new folder
-        metadata = results["metadatas"][0]
-        
-        # If moving to trash, store original folder
-        if folder_id == "trash" and metadata.get("folder_id") != "trash":
-            metadata["original_folder_id"] = metadata.get("folder_id")
-        # If moving out of trash, remove original folder reference
-        elif metadata.get("folder_id") == "trash":
-            metadata.pop("original_folder_id", None)
-            
-        metadata["folder_id"] = folder_id
-        
-        collection.update(
-            ids=[filename],
-            metadatas=[metadata]
-        )
-        
-        return {"message": "Paper moved successfully"}
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
-
-if __name__ == "__main__":
-    import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
+import os
+import asyncio
+import itertools
+import math
+import random
+import hashlib
+import sqlite3
+import threading
+import time
+import unicodedata
+import tempfile
+import zipfile
+import zlib
+import signal
+import glob
+import sys
+from collections import Counter, OrderedDict, deque
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    import fcntl
+except ImportError:  # Windows, locking falls back to the in-process lock only
+    fcntl = None
+from array import array
+from typing import List, Optional, Dict, Any, Iterable, Iterator, Tuple
+from fastapi import FastAPI, File, UploadFile, HTTPException, Form, Body, Query, Depends, Request
+from fastapi.responses import FileResponse, HTMLResponse, JSONResponse, Response, StreamingResponse
+from fastapi.middleware.cors import CORSMiddleware
+from fastapi.staticfiles import StaticFiles
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter as MetricCounter, Gauge, Histogram, generate_latest, multiprocess
+)
+import numpy as np
+from pypdf import PdfReader
+import shutil
+from datetime import datetime
+from email.utils import formatdate, parsedate_to_datetime
+from pydantic import BaseModel
+from dotenv import load_dotenv
+import httpx
+import json
+import re
+import uuid
+
+# Load environment variables
+load_dotenv()
+
+# Caches, indexes, locks and job state live in DATA_DIR. The library itself
+# stays where it always was: ChromaDB in db/, PDFs in research_papers/ and
+# the folders in folders.json.
+DATA_DIR = os.getenv("DATA_DIR", "data")
+os.makedirs(DATA_DIR, exist_ok=True)
+
+def data_path(name: str) -> str:
+    return os.path.join(DATA_DIR, name)
+
+# OpenAI client (retries are handled by the embedding batcher). Its keep-alive
+# connection pool is shared by every thread making embedding calls. It is
+# created on first use, so a library on a local embedding model never imports openai.
+EMBEDDING_MAX_CONNECTIONS = int(os.getenv("EMBEDDING_MAX_CONNECTIONS", "20"))
+EMBEDDING_TIMEOUT = float(os.getenv("EMBEDDING_TIMEOUT", "60"))
+client = None
+client_lock = threading.Lock()
+
+def get_openai_client():
+    global client
+    with client_lock:
+        if client is None:
+            from openai import OpenAI
+            client = OpenAI(
+                api_key=os.getenv("OPENAI_API_KEY"),
+                base_url=os.getenv("OPENAI_BASE_URL"),
+                max_retries=0,
+                http_client=httpx.Client(
+                    limits=httpx.Limits(
+                        max_connections=EMBEDDING_MAX_CONNECTIONS,
+                        max_keepalive_connections=EMBEDDING_MAX_CONNECTIONS,
+                        keepalive_expiry=30
+                    ),
+                    timeout=httpx.Timeout(EMBEDDING_TIMEOUT, connect=10)
+                )
+            )
+    return client
+
+def is_transient_embedding_error(error: Exception) -> bool:
+    """Rate limits, timeouts and server errors of the OpenAI API, which are worth retrying."""
+    openai = sys.modules.get("openai")
+    return openai is not None and isinstance(
+        error, (openai.RateLimitError, openai.APIConnectionError, openai.APITimeoutError, openai.InternalServerError)
+    )
+
+# Embedding settings. Concurrent requests are coalesced into one API call if they
+# arrive within EMBEDDING_BATCH_WINDOW seconds of each other.
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "text-embedding-ada-002")
+EMBEDDING_BATCH_WINDOW = float(os.getenv("EMBEDDING_BATCH_WINDOW", "0.01"))
+EMBEDDING_MAX_BATCH_SIZE = int(os.getenv("EMBEDDING_MAX_BATCH_SIZE", "256"))
+EMBEDDING_MAX_BATCH_TOKENS = int(os.getenv("EMBEDDING_MAX_BATCH_TOKENS", "100000"))
+EMBEDDING_MAX_RETRIES = int(os.getenv("EMBEDDING_MAX_RETRIES", "5"))
+
+# EMBEDDING_MODEL is "<provider>:<model>", a bare model name means OpenAI.
+# "hashing:<dimensions>" embeds with signed feature hashing and needs no files,
+# "local:<name>" loads a hashed TF-IDF + SVD encoder from LOCAL_EMBEDDING_DIR/<name>.npz
+# (see `python main.py fit-encoder`). Local encoders run in a pool of
+# LOCAL_EMBEDDING_WORKERS processes; batches smaller than LOCAL_EMBEDDING_MIN_BATCH
+# per worker are encoded in the calling thread.
+LOCAL_EMBEDDING_DIR = os.getenv("LOCAL_EMBEDDING_DIR", data_path("embedding_models"))
+LOCAL_EMBEDDING_WORKERS = int(os.getenv("LOCAL_EMBEDDING_WORKERS", str(os.cpu_count() or 1)))
+LOCAL_EMBEDDING_MIN_BATCH = int(os.getenv("LOCAL_EMBEDDING_MIN_BATCH", "32"))
+
+# Persistent embedding cache, evicted least-recently-used once the stored
+# vectors exceed EMBEDDING_CACHE_MAX_BYTES
+EMBEDDING_CACHE_FILE = os.getenv("EMBEDDING_CACHE_FILE", data_path("embedding_cache.sqlite3"))
+EMBEDDING_CACHE_MAX_BYTES = int(os.getenv("EMBEDDING_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Accept requests at once and build and warm this worker's state in the background."""
+    global worker_built, warmup_task
+    worker_built = asyncio.Event()
+    startup_status.update(status="starting", error=None, seconds=None)
+    warmup_task = asyncio.create_task(warm_up())
+    try:
+        yield
+    finally:
+        for task in (warmup_task, related_task):
+            if task is not None:
+                task.cancel()
+
+# Initialize FastAPI app
+app = FastAPI(title="Research Papers Assistant", lifespan=lifespan)
+
+# Add CORS middleware
+app.add_middleware(
+    CORSMiddleware,
+    allow_origins=["*"],  # For development only - configure properly in production
+    allow_credentials=True,
+    allow_methods=["GET", "POST", "PUT", "DELETE"],  # Explicitly list allowed methods
+    allow_headers=["*"],
+)
+
+# Prometheus metrics, served on /metrics
+STAGE_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+HTTP_REQUESTS = MetricCounter("papers_http_requests_total", "HTTP requests", ["method", "handler", "status"])
+HTTP_REQUEST_SECONDS = Histogram(
+    "papers_http_request_duration_seconds", "HTTP request latency", ["method", "handler"], buckets=STAGE_BUCKETS
+)
+HTTP_IN_FLIGHT = Gauge("papers_http_requests_in_flight", "HTTP requests being handled", multiprocess_mode="livesum")
+STAGE_SECONDS = Histogram(
+    "papers_stage_duration_seconds", "Time spent in each stage of request handling", ["stage"], buckets=STAGE_BUCKETS
+)
+STAGE_FAILURES = MetricCounter("papers_stage_failures_total", "Stages that raised an exception", ["stage"])
+CHROMA_SECONDS = Histogram(
+    "papers_chroma_operation_duration_seconds", "ChromaDB call latency", ["collection", "operation"], buckets=STAGE_BUCKETS
+)
+CHROMA_ROWS = MetricCounter(
+    "papers_chroma_rows_returned_total", "Rows returned by ChromaDB reads", ["collection", "operation"]
+)
+CHROMA_FAILURES = MetricCounter("papers_chroma_operation_failures_total", "Failed ChromaDB calls", ["collection", "operation"])
+EMBEDDING_RETRIES = MetricCounter("papers_embedding_retries_total", "Embedding API calls retried after a transient error")
+
+# Per-stage timings of the request being handled, returned as a Server-Timing header
+request_timings: ContextVar[Optional[Dict[str, float]]] = ContextVar("request_timings", default=None)
+
+def record_timing(name: str, seconds: float):
+    timings = request_timings.get()
+    if timings is not None:
+        timings[name] = timings.get(name, 0.0) + seconds
+
+@contextmanager
+def stage_timer(stage: str):
+    """Time a stage of request handling into the stage histogram and Server-Timing."""
+    started = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        STAGE_FAILURES.labels(stage).inc()
+        raise
+    finally:
+        elapsed = time.perf_counter() - started
+        STAGE_SECONDS.labels(stage).observe(elapsed)
+        record_timing(stage, elapsed)
+
+class InstrumentedCollection:
+    """A ChromaDB collection whose calls are timed and whose reads count the rows
+    they return, so full-collection scans show up in the metrics. The collection
+    is opened on first use; its name is known without asking ChromaDB."""
+
+    OPERATIONS = ("add", "get", "query", "update", "upsert", "delete", "count", "peek", "modify")
+
+    def __init__(self, name: str, kind: str):
+        self.name = name
+        self._kind = kind
+        self._collection = None
+        self._lock = threading.Lock()
+
+    def _open(self):
+        with self._lock:
+            if self._collection is None:
+                self._collection = get_chroma_client().get_or_create_collection(name=self.name)
+        return self._collection
+
+    def __getattr__(self, name: str):
+        attribute = getattr(self._open(), name)
+        if name not in self.OPERATIONS:
+            return attribute
+
+        def instrumented(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                result = attribute(*args, **kwargs)
+            except Exception:
+                CHROMA_FAILURES.labels(self._kind, name).inc()
+                raise
+            finally:
+                elapsed = time.perf_counter() - started
+                CHROMA_SECONDS.labels(self._kind, name).observe(elapsed)
+                record_timing(f"chroma_{self._kind}_{name}", elapsed)
+            if name == "get":
+                CHROMA_ROWS.labels(self._kind, name).inc(len(result["ids"]))
+            elif name == "query":
+                CHROMA_ROWS.labels(self._kind, name).inc(sum(len(ids) for ids in result["ids"]))
+            return result
+        return instrumented
+
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    """Count and time every request and report its stage timings in a Server-Timing header."""
+    timings: Dict[str, float] = {}
+    token = request_timings.set(timings)
+    HTTP_IN_FLIGHT.inc()
+    started = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+    finally:
+        elapsed = time.perf_counter() - started
+        HTTP_IN_FLIGHT.dec()
+        request_timings.reset(token)
+        # The router records the matched endpoint in the scope; label by it to keep cardinality bounded
+        endpoint = request.scope.get("endpoint")
+        handler = getattr(endpoint, "__name__", "unmatched")
+        HTTP_REQUESTS.labels(request.method, handler, str(status)).inc()
+        HTTP_REQUEST_SECONDS.labels(request.method, handler).observe(elapsed)
+    response.headers["Server-Timing"] = ", ".join(
+        [f"{name};dur={seconds * 1000:.1f}" for name, seconds in timings.items()] + [f"total;dur={elapsed * 1000:.1f}"]
+    )
+    return response
+
+# Deployment: WEB_CONCURRENCY uvicorn workers share the data directory. Several
+# workers need ChromaDB running as a server (CHROMA_HOST), since an embedded
+# client keeps its vector index in the memory of the process that wrote it.
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", "1"))
+CHROMA_HOST = os.getenv("CHROMA_HOST")
+CHROMA_PORT = int(os.getenv("CHROMA_PORT", "8000"))
+
+# ChromaDB client, created on first use since importing chromadb is slow
+chroma_client = None
+chroma_client_lock = threading.Lock()
+
+def get_chroma_client():
+    global chroma_client
+    with chroma_client_lock:
+        if chroma_client is None:
+            import chromadb
+            if CHROMA_HOST:
+                chroma_client = chromadb.HttpClient(host=CHROMA_HOST, port=CHROMA_PORT)
+            else:
+                chroma_client = chromadb.PersistentClient(path="db")
+    return chroma_client
+
+# The live collections and the embedding model they were built with. A reindex
+# builds new collections and then points this file at them.
+COLLECTIONS_FILE = data_path("collections.json")
+
+def load_active_collections() -> Dict[str, Any]:
+    try:
+        with open(COLLECTIONS_FILE, "r") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {"papers": "research_papers", "passages": "paper_passages", "embedding_model": EMBEDDING_MODEL}
+
+def save_active_collections(active: Dict[str, Any]):
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(COLLECTIONS_FILE)))
+    with os.fdopen(fd, "w") as f:
+        json.dump(active, f, indent=2)
+    os.replace(temp_path, COLLECTIONS_FILE)
+
+active_collections = load_active_collections()
+if active_collections["embedding_model"] != EMBEDDING_MODEL:
+    print(
+        f"Warning: The library is indexed with {active_collections['embedding_model']}, "
+        f"not EMBEDDING_MODEL={EMBEDDING_MODEL}. Run a reindex to switch models."
+    )
+    EMBEDDING_MODEL = active_collections["embedding_model"]
+
+def open_collections(active: Dict[str, Any]) -> Tuple[InstrumentedCollection, InstrumentedCollection]:
+    return (
+        InstrumentedCollection(active["papers"], "papers"),
+        InstrumentedCollection(active["passages"], "passages")
+    )
+
+# Create collection for research papers. Passages (overlapping chunks of each
+# paper's full text) live in their own collection so the paper listings only
+# ever see one record per paper
+collection, passages = open_collections(active_collections)
+
+# Passage chunking settings. Tokens are approximated by whitespace-separated words,
+# which keeps every passage well inside the embedding model's input limit.
+CHUNK_TOKENS = int(os.getenv("CHUNK_TOKENS", "300"))
+CHUNK_OVERLAP = int(os.getenv("CHUNK_OVERLAP", "50"))
+# Recorded on every paper so a reindex knows which papers to extract again.
+# Bump it whenever text extraction changes; the chunk settings are part of it.
+EXTRACTOR_VERSION = f"1:{CHUNK_TOKENS}:{CHUNK_OVERLAP}"
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "64"))
+# How many passages to fetch per requested search result before collapsing to papers
+PASSAGE_OVERSAMPLE = 4
+
+# Hybrid search: rank constant of reciprocal rank fusion, and how long to wait for
+# the query embedding before answering with lexical results only
+RRF_K = 60
+HYBRID_EMBEDDING_TIMEOUT = float(os.getenv("HYBRID_EMBEDDING_TIMEOUT", "2"))
+
+# Search responses are cached for SEARCH_CACHE_TTL seconds, at most
+# SEARCH_CACHE_SIZE of them, and dropped as soon as any paper changes
+SEARCH_CACHE_SIZE = int(os.getenv("SEARCH_CACHE_SIZE", "1024"))
+SEARCH_CACHE_TTL = float(os.getenv("SEARCH_CACHE_TTL", "300"))
+
+# PDF text extraction runs in a process pool of PDF_WORKERS processes. Large PDFs
+# are split into ranges of PDF_PAGES_PER_TASK pages, and a page that takes longer
+# than PDF_PAGE_TIMEOUT seconds to extract is skipped.
+PDF_WORKERS = int(os.getenv("PDF_WORKERS", str(os.cpu_count() or 1)))
+PDF_PAGES_PER_TASK = int(os.getenv("PDF_PAGES_PER_TASK", "8"))
+PDF_PAGE_TIMEOUT = float(os.getenv("PDF_PAGE_TIMEOUT", "10"))
+
+# Near-duplicate detection: MinHash signatures of MINHASH_SIZE values over word
+# shingles, indexed with LSH in MINHASH_BANDS bands. Papers whose estimated
+# similarity reaches NEAR_DUPLICATE_THRESHOLD count as near-duplicates.
+NEAR_DUPLICATE_FILE = os.getenv("NEAR_DUPLICATE_FILE", data_path("near_duplicates.sqlite3"))
+NEAR_DUPLICATE_THRESHOLD = float(os.getenv("NEAR_DUPLICATE_THRESHOLD", "0.7"))
+MINHASH_SIZE = 128
+MINHASH_BANDS = 32
+MINHASH_SHINGLE_WORDS = 3
+
+# Exact vector search: with VECTOR_STORE=float16 or int8, passage embeddings are
+# mirrored into a memory-mapped file under VECTOR_STORE_DIR and searched by brute
+# force instead of ChromaDB's HNSW index. int8 candidates, VECTOR_RERANK_FACTOR
+# times as many as needed, are re-ranked with their float32 embeddings.
+VECTOR_STORE = os.getenv("VECTOR_STORE", "chroma")
+VECTOR_STORE_DIR = os.getenv("VECTOR_STORE_DIR", data_path("vectors"))
+VECTOR_RERANK_FACTOR = int(os.getenv("VECTOR_RERANK_FACTOR", "4"))
+if VECTOR_STORE not in ("chroma", "float16", "int8"):
+    print(f"Warning: Unknown VECTOR_STORE={VECTOR_STORE}, using chroma")
+    VECTOR_STORE = "chroma"
+
+# Related papers: the RELATED_NEIGHBOURS nearest papers of each paper, updated
+# in the background every RELATED_UPDATE_INTERVAL seconds by one worker
+# process at a time, the one holding RELATED_LOCK_FILE
+RELATED_FILE = os.getenv("RELATED_FILE", data_path("related.sqlite3"))
+RELATED_NEIGHBOURS = int(os.getenv("RELATED_NEIGHBOURS", "20"))
+RELATED_UPDATE_INTERVAL = float(os.getenv("RELATED_UPDATE_INTERVAL", "5"))
+RELATED_LOCK_FILE = data_path("related.lock")
+
+# Paper counts behind /stats, kept up to date by every write
+STATS_FILE = os.getenv("STATS_FILE", data_path("stats.sqlite3"))
+
+# State shared by the worker processes: a log of paper changes, which each
+# worker replays into its in-memory indexes, and background job progress.
+# Writes that read before they write hold the lock on WRITE_LOCK_FILE.
+SHARED_STATE_FILE = os.getenv("SHARED_STATE_FILE", data_path("shared_state.sqlite3"))
+WRITE_LOCK_FILE = data_path("write.lock")
+CHANGE_LOG_RETENTION = int(os.getenv("CHANGE_LOG_RETENTION", "100000"))
+JOB_PUBLISH_INTERVAL = 0.5
+
+# Bulk ingestion settings: at most INGEST_CONCURRENCY files are in flight per job
+# and paper records are written to ChromaDB INGEST_ADD_BATCH_SIZE at a time. The
+# files of one bulk upload, zip members decompressed, may take up to
+# MAX_BULK_UPLOAD_BYTES in the staging directory (0 disables the limit).
+INGEST_STAGING_DIR = data_path("ingest_staging")
+MAX_BULK_UPLOAD_BYTES = int(os.getenv("MAX_BULK_UPLOAD_BYTES", str(10 * 1024 * 1024 * 1024)))
+INGEST_CONCURRENCY = int(os.getenv("INGEST_CONCURRENCY", str(2 * (os.cpu_count() or 1))))
+INGEST_ADD_BATCH_SIZE = int(os.getenv("INGEST_ADD_BATCH_SIZE", "50"))
+MAX_FINISHED_JOBS = 100
+
+# Ensure research_papers directory exists
+UPLOAD_DIR = "research_papers"
+os.makedirs(UPLOAD_DIR, exist_ok=True)
+
+# Uploads are streamed to disk UPLOAD_CHUNK_SIZE bytes at a time and rejected
+# once they grow past MAX_UPLOAD_BYTES (0 disables the limit)
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", str(100 * 1024 * 1024)))
+
+# Downloads are streamed DOWNLOAD_CHUNK_SIZE bytes at a time. First-page
+# thumbnails are rendered on first request and cached in THUMBNAIL_DIR.
+DOWNLOAD_CHUNK_SIZE = 256 * 1024
+THUMBNAIL_DIR = data_path("thumbnails")
+THUMBNAIL_WIDTH = 240
+os.makedirs(THUMBNAIL_DIR, exist_ok=True)
+
+# Define models
+class PaperMetadata(BaseModel):
+    title: str
+    authors: str = ""
+    year: Optional[int] = None
+    keywords: List[str] = []
+    tags: List[str] = []
+    category: Optional[str] = None
+    abstract: Optional[str] = ""
+    folder_id: Optional[str] = None  # Reference to folder
+
+class PaperBatch(BaseModel):
+    filenames: List[str]
+
+class PaperBatchMove(PaperBatch):
+    folder_id: str
+
+class Folder(BaseModel):
+    id: str
+    name: str
+    parent_id: Optional[str] = None
+    description: Optional[str] = ""
+    
+class FolderCreate(BaseModel):
+    name: str
+    parent_id: Optional[str] = None
+    description: Optional[str] = ""
+    
+class FolderUpdate(BaseModel):
+    name: Optional[str] = None
+    parent_id: Optional[str] = None
+    description: Optional[str] = None
+
+class FolderStore:
+    """Folder tree kept in memory and persisted to FOLDER_FILE.
+
+    Keeps an id map and a children index for O(1) lookups. Mutations run in
+    `transaction()`, which holds a thread lock plus an exclusive lock on a
+    lock file in DATA_DIR (so several uvicorn workers can share the data
+    directory), reloads the file if another process changed it, and writes
+    the result to a temp file that is atomically renamed over the original.
+    """
+
+    def __init__(self, path: str, lock_path: str):
+        self.path = path
+        self.lock_path = lock_path
+        self.lock = threading.RLock()
+        self.folders: Dict[str, Dict[str, Any]] = {}
+        self.children: Dict[Optional[str], Dict[str, None]] = {}
+        self._file_stamp = None
+        # Logs the folders each transaction changed, for the change feed
+        self.shared: Optional["SharedState"] = None
+
+    def _stat(self):
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+
+    @contextmanager
+    def _file_lock(self):
+        if fcntl is None:
+            yield
+            return
+        with open(self.lock_path, "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _set(self, folders: List[Dict[str, Any]]):
+        self.folders = {folder["id"]: folder for folder in folders}
+        self.children = {}
+        for folder in folders:
+            self.children.setdefault(folder.get("parent_id"), {})[folder["id"]] = None
+
+    def _refresh(self):
+        """Reload the folders if the file changed since we last read or wrote it."""
+        stamp = self._stat()
+        if stamp is not None and stamp == self._file_stamp:
+            return
+        if stamp is None:
+            folders_data = {"folders": []}
+        else:
+            with open(self.path, "r") as f:
+                folders_data = json.load(f)
+
+        # Ensure Default Library exists
+        if not any(f["id"] == "default" for f in folders_data["folders"]):
+            ## add default folder
+            folders_data["folders"].append({
+                "id": "default",
+                "name": "Default",
+                "parent_id": None,
+                "description": "Default folder for papers"
+            })
+            ## add trash folder
+            folders_data["folders"].append({
+                "id": "trash",
+                "name": "Trash",
+                "parent_id": None,
+                "description": "Trash folder for papers"
+            })
+            self._write(folders_data)
+        else:
+            self._set(folders_data["folders"])
+            self._file_stamp = stamp
+
+    def _write(self, folders_data: Dict[str, Any]):
+        directory = os.path.dirname(os.path.abspath(self.path))
+        with tempfile.NamedTemporaryFile("w", dir=directory, prefix=".folders-", suffix=".tmp", delete=False) as f:
+            json.dump(folders_data, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(f.name, self.path)
+        self._set(folders_data["folders"])
+        self._file_stamp = self._stat()
+
+    def load(self) -> Dict[str, Any]:
+        """Return a copy of all folders in the {"folders": [...]} file format."""
+        with self.lock:
+            if self._file_stamp is None or self._stat() != self._file_stamp:
+                with self._file_lock():
+                    self._refresh()
+            return {"folders": [dict(folder) for folder in self.folders.values()]}
+
+    def exists(self, folder_id: str) -> bool:
+        with self.lock:
+            if self._file_stamp is None or self._stat() != self._file_stamp:
+                with self._file_lock():
+                    self._refresh()
+            return folder_id in self.folders
+
+    def descendants(self, folder_id: str) -> List[str]:
+        """Ids of every folder below a folder."""
+        with self.lock:
+            result, pending = [], [folder_id]
+            while pending:
+                for child_id in self.children.get(pending.pop(), {}):
+                    if child_id not in result and child_id != folder_id:
+                        result.append(child_id)
+                        pending.append(child_id)
+            return result
+
+    @contextmanager
+    def transaction(self):
+        """Yield an up to date copy of the folders to modify. It is saved when
+        the block exits normally and discarded if it raises."""
+        with self.lock, self._file_lock():
+            self._refresh()
+            previous = self.folders
+            folders_data = {"folders": [dict(folder) for folder in self.folders.values()]}
+            yield folders_data
+            self._write(folders_data)
+            changed = [
+                folder_id for folder_id in {**previous, **self.folders}
+                if previous.get(folder_id) != self.folders.get(folder_id)
+            ]
+            if changed and self.shared is not None:
+                self.shared.record_changes([(folder_id, "folder") for folder_id in changed])
+
+# Initialize folder storage
+FOLDER_FILE = "folders.json"
+folder_store = FolderStore(FOLDER_FILE, data_path("folders.json.lock"))
+
+def load_folders():
+    """Load folders and ensure Default Library exists"""
+    return folder_store.load()
+
+# Helper functions
+# Problematic Unicode surrogates and control characters
+SURROGATES_RE = re.compile(r'[\ud800-\udfff]')
+CONTROL_CHARS_RE = re.compile(r'[\x00-\x08\x0b\x0c\x0e-\x1f\x7f]')
+
+def clean_text(text: str) -> str:
+    """Clean text to remove problematic characters."""
+    text = SURROGATES_RE.sub('', text)
+    text = CONTROL_CHARS_RE.sub('', text)
+    return text
+
+class PageTimeoutError(Exception):
+    pass
+
+def _raise_page_timeout(signum, frame):
+    raise PageTimeoutError()
+
+@contextmanager
+def page_timeout(seconds: float):
+    """Abort the enclosed block after `seconds` using SIGALRM.
+
+    Signals can only be handled in the main thread, which is where process pool
+    workers run their tasks. Elsewhere the block runs without a timeout.
+    """
+    if (
+        seconds <= 0
+        or not hasattr(signal, "setitimer")
+        or threading.current_thread() is not threading.main_thread()
+    ):
+        yield
+        return
+    previous_handler = signal.signal(signal.SIGALRM, _raise_page_timeout)
+    signal.setitimer(signal.ITIMER_REAL, seconds)
+    try:
+        yield
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous_handler)
+
+def extract_page_text(page, page_number: int) -> str:
+    """Extract and clean the text of one page, returning "" if it fails or times out."""
+    try:
+        with page_timeout(PDF_PAGE_TIMEOUT):
+            page_text = page.extract_text() or ""
+        return clean_text(page_text)
+    except PageTimeoutError:
+        print(f"Warning: Timed out extracting text from page {page_number + 1}")
+    except Exception as e:
+        # If extraction fails for a page, continue with whatever we have
+        print(f"Warning: Could not extract text from page {page_number + 1}: {str(e)}")
+    return ""
+
+def extract_page_range(file_path: str, start: int, stop: int) -> List[str]:
+    """Extract the cleaned text of pages [start, stop). Runs inside the PDF process pool."""
+    reader = PdfReader(file_path)
+    return [extract_page_text(reader.pages[i], i) for i in range(start, stop)]
+
+def iter_pdf_pages_serial(file_path: str) -> Iterator[str]:
+    """Yield the cleaned text of each page of a PDF file in the current process."""
+    reader = PdfReader(file_path)
+    for i, page in enumerate(reader.pages):
+        yield extract_page_text(page, i)
+
+def iter_pdf_pages(file_path: str) -> Iterator[str]:
+    """Yield the cleaned text of each page of a PDF file, one page at a time.
+
+    Page ranges are extracted in parallel by the PDF process pool and yielded in
+    order. Only a couple of ranges per worker are in flight at once, so memory
+    stays flat regardless of the document size.
+    """
+    page_count = len(PdfReader(file_path).pages)
+    ranges = iter([
+        (start, min(start + PDF_PAGES_PER_TASK, page_count))
+        for start in range(0, page_count, PDF_PAGES_PER_TASK)
+    ])
+    pool = get_pdf_process_pool()
+    in_flight = deque(
+        pool.submit(extract_page_range, file_path, start, stop)
+        for start, stop in itertools.islice(ranges, 2 * PDF_WORKERS)
+    )
+    try:
+        while in_flight:
+            future = in_flight.popleft()
+            for start, stop in itertools.islice(ranges, 1):
+                in_flight.append(pool.submit(extract_page_range, file_path, start, stop))
+            yield from future.result()
+    finally:
+        # The consumer may stop early, don't leave work queued in the pool
+        for future in in_flight:
+            future.cancel()
+
+def extract_text_from_pdf(file_path: str) -> str:
+    """Extract text content from a PDF file."""
+    return "".join(page_text + "\n" for page_text in iter_pdf_pages(file_path))
+
+def iter_passages(
+    pages: Iterable[str],
+    max_tokens: int = CHUNK_TOKENS,
+    overlap: int = CHUNK_OVERLAP
+) -> Iterator[str]:
+    """Split a stream of page texts into overlapping, token-bounded passages.
+
+    Only the current window of words is kept in memory, so the cost does not
+    grow with the size of the document.
+    """
+    overlap = max(0, min(overlap, max_tokens - 1))
+    window: List[str] = []
+    fresh = 0  # words in the window not yet emitted in a passage
+    for page_text in pages:
+        for word in page_text.split():
+            window.append(word)
+            fresh += 1
+            if len(window) >= max_tokens:
+                yield " ".join(window)
+                window = window[max_tokens - overlap:]
+                fresh = 0
+    if fresh:
+        yield " ".join(window)
+
+def create_embeddings(texts: List[str], model: Optional[str] = None) -> List[List[float]]:
+    """Generate embeddings for several texts with a single OpenAI API call (blocking)."""
+    response = get_openai_client().embeddings.create(
+        model=model or EMBEDDING_MODEL,
+        input=texts
+    )
+    return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+
+EMBEDDING_WORD_RE = re.compile(r"\w+")
+
+class HashedTfidfEncoder:
+    """CPU text encoder: hashed TF-IDF with an optional linear projection.
+
+    Words and adjacent word pairs are hashed into `features` signed buckets and
+    weighted by sublinear term frequency times `idf`. A fitted `projection`
+    (features x dimensions, from a truncated SVD) maps that sparse vector to a
+    dense one. Vectors are L2 normalized.
+    """
+
+    def __init__(self, features: int, idf: Optional[np.ndarray] = None, projection: Optional[np.ndarray] = None):
+        self.features = features
+        self.idf = idf
+        self.projection = projection
+
+    @property
+    def dimensions(self) -> int:
+        return self.features if self.projection is None else self.projection.shape[1]
+
+    @classmethod
+    def load(cls, path: str) -> "HashedTfidfEncoder":
+        with np.load(path) as data:
+            return cls(int(data["features"]), data["idf"].astype(np.float32), data["projection"].astype(np.float32))
+
+    def save(self, path: str):
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), suffix=".npz")
+        with os.fdopen(fd, "wb") as f:
+            np.savez(f, features=self.features, idf=self.idf, projection=self.projection)
+        os.replace(temp_path, path)
+
+    def term_weights(self, text: str) -> Tuple[np.ndarray, np.ndarray]:
+        """Hash buckets of a text and their signed sublinear term frequencies."""
+        words = EMBEDDING_WORD_RE.findall(text.lower())
+        counts = Counter(words)
+        counts.update(f"{first} {second}" for first, second in zip(words, words[1:]))
+        weights: Dict[int, float] = {}
+        for term, count in counts.items():
+            hashed = zlib.crc32(term.encode("utf-8"))
+            bucket = hashed % self.features
+            sign = 1.0 if hashed & 0x80000000 else -1.0
+            weights[bucket] = weights.get(bucket, 0.0) + sign * (1.0 + math.log(count))
+        return np.fromiter(weights.keys(), np.int64, len(weights)), np.fromiter(weights.values(), np.float32, len(weights))
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        vectors = np.zeros((len(texts), self.dimensions), dtype=np.float32)
+        for row, text in enumerate(texts):
+            buckets, weights = self.term_weights(text)
+            if self.idf is not None:
+                weights *= self.idf[buckets]
+            if self.projection is None:
+                vectors[row, buckets] = weights
+            else:
+                vectors[row] = weights @ self.projection[buckets]
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.where(norms == 0, 1.0, norms)
+
+    @classmethod
+    def fit(cls, texts: List[str], dimensions: int, features: int = 2 ** 16, seed: int = 0) -> "HashedTfidfEncoder":
+        """Fit IDF weights and a randomized truncated SVD of the TF-IDF matrix of `texts`."""
+        encoder = cls(features)
+        rows = [encoder.term_weights(text) for text in texts]
+        document_frequency = np.zeros(features, dtype=np.float64)
+        for buckets, _ in rows:
+            document_frequency[buckets] += 1
+        encoder.idf = (np.log((1 + len(rows)) / (1 + document_frequency)) + 1).astype(np.float32)
+
+        def tfidf(chunk: List[Tuple[np.ndarray, np.ndarray]]) -> np.ndarray:
+            matrix = np.zeros((len(chunk), features), dtype=np.float32)
+            for i, (buckets, weights) in enumerate(chunk):
+                matrix[i, buckets] = weights * encoder.idf[buckets]
+            norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+            return matrix / np.where(norms == 0, 1.0, norms)
+
+        # X @ m and X.T @ m over row chunks, the dense TF-IDF matrix doesn't fit in memory
+        def multiply(m: np.ndarray) -> np.ndarray:
+            return np.vstack([tfidf(rows[i:i + 256]) @ m for i in range(0, len(rows), 256)])
+
+        def multiply_transposed(m: np.ndarray) -> np.ndarray:
+            total = np.zeros((features, m.shape[1]), dtype=np.float32)
+            for i in range(0, len(rows), 256):
+                total += tfidf(rows[i:i + 256]).T @ m[i:i + 256]
+            return total
+
+        dimensions = min(dimensions, len(rows))
+        rank = min(dimensions + 10, len(rows))
+        basis = np.random.default_rng(seed).standard_normal((features, rank)).astype(np.float32)
+        basis = np.linalg.qr(multiply_transposed(multiply(basis)))[0]  # One power iteration
+        q = np.linalg.qr(multiply(basis))[0]
+        _, _, vt = np.linalg.svd(multiply_transposed(q).T, full_matrices=False)
+        encoder.projection = np.ascontiguousarray(vt[:dimensions].T, dtype=np.float32)
+        return encoder
+
+def local_encoder_path(name: str) -> str:
+    return os.path.join(LOCAL_EMBEDDING_DIR, f"{name}.npz")
+
+# Encoders loaded by this process, keyed by the provider name
+local_encoders: Dict[str, HashedTfidfEncoder] = {}
+
+def get_local_encoder(name: str) -> HashedTfidfEncoder:
+    """Return the encoder for a `hashing:` or `local:` provider name, loading it on first use."""
+    encoder = local_encoders.get(name)
+    if encoder is None:
+        kind, _, model = name.split("@")[0].partition(":")
+        if kind == "hashing":
+            encoder = HashedTfidfEncoder(int(model))
+        else:
+            encoder = HashedTfidfEncoder.load(local_encoder_path(model))
+        local_encoders[name] = encoder
+    return encoder
+
+def encode_local(name: str, texts: List[str]) -> np.ndarray:
+    """Encode texts with a local encoder. Runs inside the embedding process pool."""
+    return get_local_encoder(name).encode(texts)
+
+embedding_process_pool: Optional[ProcessPoolExecutor] = None
+
+def get_embedding_process_pool() -> ProcessPoolExecutor:
+    """Return the process pool used by local encoders, creating it on first use."""
+    global embedding_process_pool
+    if embedding_process_pool is None:
+        embedding_process_pool = ProcessPoolExecutor(max_workers=LOCAL_EMBEDDING_WORKERS)
+    return embedding_process_pool
+
+class EmbeddingProvider:
+    """Embeds texts with one model (blocking). `name` identifies the vectors it
+    produces and keys the embedding cache."""
+
+    def __init__(self, model: str):
+        self.model = model
+        self.name = model
+
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        raise NotImplementedError
+
+    def load(self):
+        """Load what the first texts would otherwise wait for."""
+
+class OpenAIEmbeddingProvider(EmbeddingProvider):
+    def __init__(self, model: str):
+        super().__init__(model)
+        # Bare names keep the cache keys of libraries built before providers existed
+        self.name = model.split(":", 1)[1] if model.startswith("openai:") else model
+
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        return create_embeddings(texts, self.name)
+
+    def load(self):
+        get_openai_client()
+
+class LocalEmbeddingProvider(EmbeddingProvider):
+    """`hashing:` and `local:` models, encoded on this machine's CPUs."""
+
+    def __init__(self, model: str):
+        super().__init__(model)
+        kind, _, name = model.partition(":")
+        if kind == "local":
+            path = local_encoder_path(name)
+            if not os.path.exists(path):
+                raise ValueError(f"No local embedding model at {path}, fit one with `python main.py fit-encoder {name}`")
+            # A refitted encoder produces different vectors, so it gets a new name
+            with open(path, "rb") as f:
+                self.name = f"{model}@{hashlib.sha256(f.read()).hexdigest()[:12]}"
+        elif not name.isdigit() or int(name) < 1:
+            raise ValueError(f"Expected hashing:<dimensions> with at least 1 dimension, got {model}")
+
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        size = max(LOCAL_EMBEDDING_MIN_BATCH, math.ceil(len(texts) / LOCAL_EMBEDDING_WORKERS))
+        if len(texts) <= size:
+            return get_local_encoder(self.name).encode(texts).tolist()
+        pool = get_embedding_process_pool()
+        futures = [pool.submit(encode_local, self.name, texts[i:i + size]) for i in range(0, len(texts), size)]
+        return np.concatenate([future.result() for future in futures]).tolist()
+
+    def load(self):
+        get_local_encoder(self.name)
+
+embedding_providers: Dict[str, EmbeddingProvider] = {}
+
+def get_embedding_provider(model: Optional[str] = None) -> EmbeddingProvider:
+    model = model or EMBEDDING_MODEL
+    provider = embedding_providers.get(model)
+    if provider is None:
+        kind = model.partition(":")[0] if ":" in model else "openai"
+        if kind == "openai":
+            provider = OpenAIEmbeddingProvider(model)
+        elif kind in ("hashing", "local"):
+            provider = LocalEmbeddingProvider(model)
+        else:
+            raise ValueError(f"Unknown embedding provider '{kind}' in {model}")
+        embedding_providers[model] = provider
+    return provider
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count of a text (about 4 characters per token)."""
+    return len(text) // 4 + 1
+
+class EmbeddingBatcher:
+    """Coalesce concurrent embedding requests into batched API calls.
+
+    Texts submitted within `window` seconds of each other are sent together,
+    split so that no call exceeds `max_batch_size` inputs or `max_batch_tokens`
+    estimated tokens. API calls run in a worker thread and transient errors
+    are retried with exponential backoff.
+    """
+
+    def __init__(
+        self,
+        embed_fn=create_embeddings,
+        window: float = EMBEDDING_BATCH_WINDOW,
+        max_batch_size: int = EMBEDDING_MAX_BATCH_SIZE,
+        max_batch_tokens: int = EMBEDDING_MAX_BATCH_TOKENS,
+        max_retries: int = EMBEDDING_MAX_RETRIES
+    ):
+        self.embed_fn = embed_fn
+        self.window = window
+        self.max_batch_size = max_batch_size
+        self.max_batch_tokens = max_batch_tokens
+        self.max_retries = max_retries
+        self.loop = None
+        self._pending: List[Tuple[str, asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+
+    async def embed(self, texts: List[str]) -> List[List[float]]:
+        """Embed texts, sharing API calls with any other caller in the same window."""
+        if not texts:
+            return []
+        loop = asyncio.get_running_loop()
+        futures = []
+        for text in texts:
+            future = loop.create_future()
+            self._pending.append((text, future))
+            futures.append(future)
+
+        if len(self._pending) >= self.max_batch_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window, self._flush)
+        return list(await asyncio.gather(*futures))
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        pending, self._pending = self._pending, []
+
+        batch, batch_tokens = [], 0
+        for item in pending:
+            tokens = estimate_tokens(item[0])
+            if batch and (len(batch) >= self.max_batch_size or batch_tokens + tokens > self.max_batch_tokens):
+                asyncio.get_running_loop().create_task(self._run_batch(batch))
+                batch, batch_tokens = [], 0
+            batch.append(item)
+            batch_tokens += tokens
+        if batch:
+            asyncio.get_running_loop().create_task(self._run_batch(batch))
+
+    async def _run_batch(self, batch: List[Tuple[str, asyncio.Future]]):
+        try:
+            embeddings = await self._call_with_retry([text for text, _ in batch])
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, future), embedding in zip(batch, embeddings):
+            if not future.done():
+                future.set_result(embedding)
+
+    async def _call_with_retry(self, texts: List[str]) -> List[List[float]]:
+        delay = 0.5
+        for attempt in range(self.max_retries + 1):
+            try:
+                with stage_timer("embedding_api"):
+                    return await asyncio.to_thread(self.embed_fn, texts)
+            except Exception as e:
+                if attempt == self.max_retries or not is_transient_embedding_error(e):
+                    raise
+                EMBEDDING_RETRIES.inc()
+                print(f"Warning: Embedding request failed ({str(e)}), retrying in {delay:.1f}s")
+                await asyncio.sleep(delay * random.uniform(0.5, 1.5))
+                delay = min(delay * 2, 30)
+
+class EmbeddingCache:
+    """Disk-backed embedding cache keyed by a hash of (model name, normalized text).
+
+    Vectors are stored as float32 blobs in SQLite. Once the total size exceeds
+    `max_bytes` the least recently used entries are evicted.
+    """
+
+    def __init__(self, path: str, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "key TEXT PRIMARY KEY, vector BLOB NOT NULL, size INTEGER NOT NULL, last_used REAL NOT NULL)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used)")
+        self.total_bytes = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM embeddings").fetchone()[0]
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def make_key(model: str, text: str) -> str:
+        normalized = " ".join(unicodedata.normalize("NFC", text).split())
+        return hashlib.sha256(f"{model}\0{normalized}".encode("utf-8")).hexdigest()
+
+    def get_many(self, model: str, texts: List[str]) -> List[Optional[List[float]]]:
+        """Look up cached embeddings, returning None for every miss."""
+        keys = [self.make_key(model, text) for text in texts]
+        found = {}
+        with self.lock:
+            unique_keys = list(dict.fromkeys(keys))
+            for start in range(0, len(unique_keys), 500):
+                chunk = unique_keys[start:start + 500]
+                rows = self.conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(chunk))})",
+                    chunk
+                ).fetchall()
+                found.update(rows)
+            if found:
+                now = time.time()
+                self.conn.executemany(
+                    "UPDATE embeddings SET last_used = ? WHERE key = ?",
+                    [(now, key) for key in found]
+                )
+
+            results = []
+            for key in keys:
+                blob = found.get(key)
+                if blob is None:
+                    self.misses += 1
+                    results.append(None)
+                else:
+                    self.hits += 1
+                    results.append(array("f", blob).tolist())
+            return results
+
+    def put_many(self, model: str, texts: List[str], embeddings: List[List[float]]):
+        """Store embeddings and evict old entries if the cache grew too large."""
+        now = time.time()
+        rows = {}
+        for text, embedding in zip(texts, embeddings):
+            rows[self.make_key(model, text)] = array("f", embedding).tobytes()
+        with self.lock:
+            self.conn.execute("BEGIN")
+            for key, blob in rows.items():
+                previous = self.conn.execute("SELECT size FROM embeddings WHERE key = ?", (key,)).fetchone()
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO embeddings (key, vector, size, last_used) VALUES (?, ?, ?, ?)",
+                    (key, blob, len(blob), now)
+                )
+                self.total_bytes += len(blob) - (previous[0] if previous else 0)
+            self.conn.execute("COMMIT")
+            if self.total_bytes > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        # Evict down to 90% of the budget so we don't evict on every insert
+        target = int(self.max_bytes * 0.9)
+        while self.total_bytes > target:
+            rows = self.conn.execute(
+                "SELECT key, size FROM embeddings ORDER BY last_used LIMIT 500"
+            ).fetchall()
+            if not rows:
+                self.total_bytes = 0
+                break
+            removed = []
+            for key, size in rows:
+                removed.append((key,))
+                self.total_bytes -= size
+                if self.total_bytes <= target:
+                    break
+            self.conn.executemany("DELETE FROM embeddings WHERE key = ?", removed)
+            self.evictions += len(removed)
+
+    def stats(self) -> Dict[str, Any]:
+        with self.lock:
+            entries = self.conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "entries": entries,
+            "size_bytes": self.total_bytes,
+            "max_bytes": self.max_bytes
+        }
+
+embedding_cache = EmbeddingCache(EMBEDDING_CACHE_FILE, EMBEDDING_CACHE_MAX_BYTES)
+
+# One batcher per embedding model, since a reindex may embed with a different model
+embedding_batchers: Dict[str, EmbeddingBatcher] = {}
+
+def get_embedding_batcher(model: Optional[str] = None) -> EmbeddingBatcher:
+    """Return the embedding batcher for a model bound to the running event loop."""
+    model = model or EMBEDDING_MODEL
+    loop = asyncio.get_running_loop()
+    batcher = embedding_batchers.get(model)
+    if batcher is None or batcher.loop is not loop:
+        batcher = EmbeddingBatcher(embed_fn=get_embedding_provider(model).embed)
+        batcher.loop = loop
+        embedding_batchers[model] = batcher
+    return batcher
+
+# Vector size of each embedding model, learned from its first vectors. The live
+# collections record theirs in collections.json, so vectors of another size are
+# refused instead of being mixed into them.
+embedding_dimensions: Dict[str, int] = {}
+
+def remember_embedding_dimensions(active: Dict[str, Any]):
+    if active.get("dimensions"):
+        embedding_dimensions[active["embedding_model"]] = active["dimensions"]
+
+remember_embedding_dimensions(active_collections)
+
+def check_embedding_dimensions(model: str, embeddings: List[List[float]]):
+    dimensions = len(embeddings[0])
+    expected = embedding_dimensions.get(model)
+    if expected is None:
+        embedding_dimensions[model] = dimensions
+        active = load_active_collections()
+        if active["embedding_model"] == model and "dimensions" not in active:
+            save_active_collections({**active, "dimensions": dimensions})
+    elif dimensions != expected:
+        raise ValueError(
+            f"{model} returned {dimensions}-dimensional embeddings but the library holds "
+            f"{expected}-dimensional ones. Run a reindex to switch embedding models."
+        )
+
+async def get_embeddings(texts: List[str], model: Optional[str] = None) -> List[List[float]]:
+    """Generate embeddings for several texts without blocking the event loop.
+
+    Texts already in the embedding cache are not sent to the provider again.
+    """
+    model = model or EMBEDDING_MODEL
+    name = get_embedding_provider(model).name
+    with stage_timer("embedding"):
+        embeddings = await asyncio.to_thread(embedding_cache.get_many, name, texts)
+        missing = [i for i, embedding in enumerate(embeddings) if embedding is None]
+        if missing:
+            missing_texts = [texts[i] for i in missing]
+            fresh = await get_embedding_batcher(model).embed(missing_texts)
+            check_embedding_dimensions(model, fresh)
+            await asyncio.to_thread(embedding_cache.put_many, name, missing_texts, fresh)
+            for i, embedding in zip(missing, fresh):
+                embeddings[i] = embedding
+    return embeddings
+
+async def get_embedding(text: str) -> List[float]:
+    """Generate the embedding of one text."""
+    return (await get_embeddings([text]))[0]
+
+# Tags are stored as one `tag:<name>` flag per tag so `where` filters can match them
+TAG_KEY_PREFIX = "tag:"
+
+def tag_key(tag: str) -> str:
+    return f"{TAG_KEY_PREFIX}{tag}"
+
+def tag_flags(tags: List[str], previous_tags: Iterable[str] = ()) -> Dict[str, int]:
+    """Filterable tag flags. ChromaDB merges metadata on update and can't delete
+    keys, so tags that were removed are flagged 0 instead."""
+    flags = {tag_key(tag): 0 for tag in previous_tags}
+    flags.update({tag_key(tag): 1 for tag in tags})
+    return flags
+
+def filter_fields(metadata: Dict[str, Any], previous: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """The filterable fields of a paper, denormalized onto each of its passages."""
+    try:
+        year = int(metadata.get("year"))
+    except (TypeError, ValueError):
+        year = ""
+    fields = {
+        "folder_id": metadata.get("folder_id") or "",
+        "category": metadata.get("category") or "",
+        "year": year
+    }
+    previous_tags = parse_tags(previous.get("tags", "[]")) if previous else []
+    fields.update(tag_flags(parse_tags(metadata.get("tags", "[]")), previous_tags))
+    return fields
+
+def build_where(
+    folder_id: Optional[str] = None,
+    category: Optional[str] = None,
+    year: Optional[int] = None,
+    year_from: Optional[int] = None,
+    year_to: Optional[int] = None,
+    tags: Optional[List[str]] = None,
+    include_trash: bool = False
+) -> Optional[Dict[str, Any]]:
+    """Translate paper constraints into a ChromaDB `where` filter.
+
+    Papers in the trash are excluded unless include_trash is set or the trash
+    folder is asked for explicitly. A paper matches `tags` if it has any of them.
+    """
+    clauses = []
+    if folder_id:
+        clauses.append({"folder_id": folder_id})
+    elif not include_trash:
+        clauses.append({"folder_id": {"$ne": "trash"}})
+    if category:
+        clauses.append({"category": category})
+    if year is not None:
+        clauses.append({"year": year})
+    if year_from is not None:
+        clauses.append({"year": {"$gte": year_from}})
+    if year_to is not None:
+        clauses.append({"year": {"$lte": year_to}})
+    if tags:
+        tag_clauses = [{tag_key(tag): 1} for tag in tags]
+        clauses.append(tag_clauses[0] if len(tag_clauses) == 1 else {"$or": tag_clauses})
+
+    if not clauses:
+        return None
+    return clauses[0] if len(clauses) == 1 else {"$and": clauses}
+
+def paper_filter(
+    folder_id: Optional[str] = None,
+    category: Optional[str] = None,
+    year: Optional[int] = None,
+    year_from: Optional[int] = None,
+    year_to: Optional[int] = None,
+    tags: Optional[List[str]] = None,
+    include_trash: bool = False
+):
+    """The same constraints as build_where, as a predicate over paper metadata."""
+    def matches(metadata: Dict[str, Any]) -> bool:
+        fields = filter_fields(metadata)
+        if folder_id:
+            if fields["folder_id"] != folder_id:
+                return False
+        elif not include_trash and fields["folder_id"] == "trash":
+            return False
+        if category and fields["category"] != category:
+            return False
+        paper_year = fields["year"]
+        if year is not None and paper_year != year:
+            return False
+        if year_from is not None and (paper_year == "" or paper_year < year_from):
+            return False
+        if year_to is not None and (paper_year == "" or paper_year > year_to):
+            return False
+        if tags and not any(fields.get(tag_key(tag)) == 1 for tag in tags):
+            return False
+        return True
+    return matches
+
+def passage_id(filename: str, index: int) -> str:
+    """ChromaDB id of a paper's passage."""
+    return f"{filename}#{index}"
+
+def parse_passage_id(passage_id: str) -> Tuple[str, int]:
+    """Split a passage id into its paper id and chunk index."""
+    paper_id, _, index = passage_id.rpartition("#")
+    return paper_id, int(index)
+
+def delete_passages(filename: str):
+    """Remove every passage belonging to a paper."""
+    passages.delete(where={"paper_id": filename})
+    lexical_index.remove_paper(filename)
+    if vector_store is not None:
+        vector_store.remove_papers([filename])
+
+TOKEN_RE = re.compile(r"\w+")
+
+def tokenize(text: str) -> List[str]:
+    """Lowercased word tokens used by the lexical index."""
+    return TOKEN_RE.findall(text.lower())
+
+class LexicalIndex:
+    """In-memory BM25 inverted index over paper passages.
+
+    Mirrors the passages collection: built from it at startup and updated
+    whenever passages are added or deleted. Only the postings are kept; the
+    passage text for results is read back from ChromaDB by id.
+    """
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.lock = threading.RLock()
+        self.built = False
+        self.postings: Dict[str, Dict[str, int]] = {}
+        self.doc_lengths: Dict[str, int] = {}
+        self.doc_terms: Dict[str, Tuple[str, ...]] = {}
+        self.paper_passages: Dict[str, List[str]] = {}
+        self.total_length = 0
+
+    def build(self, source_collection, page_size: int = 5000):
+        """(Re)build the index by paging through a passages collection."""
+        with self.lock:
+            self.postings, self.doc_lengths, self.doc_terms, self.paper_passages = {}, {}, {}, {}
+            self.total_length = 0
+            offset = 0
+            while True:
+                results = source_collection.get(include=["documents"], limit=page_size, offset=offset)
+                self.add(results["ids"], results["documents"])
+                if len(results["ids"]) < page_size:
+                    break
+                offset += page_size
+            self.built = True
+
+    def ensure_built(self):
+        if not self.built:
+            self.build(passages)
+
+    def add(self, ids: List[str], documents: List[str]):
+        with self.lock:
+            for doc_id, document in zip(ids, documents):
+                if doc_id in self.doc_lengths:
+                    self._remove_passage(doc_id)
+                terms = Counter(tokenize(document or ""))
+                for term, count in terms.items():
+                    self.postings.setdefault(term, {})[doc_id] = count
+                length = sum(terms.values())
+                self.doc_lengths[doc_id] = length
+                self.doc_terms[doc_id] = tuple(terms)
+                self.total_length += length
+                self.paper_passages.setdefault(parse_passage_id(doc_id)[0], []).append(doc_id)
+
+    def _remove_passage(self, doc_id: str):
+        for term in self.doc_terms.pop(doc_id, ()):
+            docs = self.postings.get(term)
+            if docs is not None:
+                docs.pop(doc_id, None)
+                if not docs:
+                    del self.postings[term]
+        self.total_length -= self.doc_lengths.pop(doc_id, 0)
+
+    def remove_paper(self, paper_id: str):
+        with self.lock:
+            for doc_id in self.paper_passages.pop(paper_id, []):
+                self._remove_passage(doc_id)
+
+    def search(self, query: str, limit: int, accept=None) -> List[Tuple[str, float]]:
+        """Top passages by BM25 score, optionally only those whose paper id passes `accept`."""
+        with self.lock:
+            n_docs = len(self.doc_lengths)
+            if not n_docs:
+                return []
+            average_length = self.total_length / n_docs
+            scores: Dict[str, float] = {}
+            for term in set(tokenize(query)):
+                docs = self.postings.get(term)
+                if not docs:
+                    continue
+                idf = math.log(1 + (n_docs - len(docs) + 0.5) / (len(docs) + 0.5))
+                for doc_id, tf in docs.items():
+                    norm = self.k1 * (1 - self.b + self.b * self.doc_lengths[doc_id] / average_length)
+                    scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (self.k1 + 1) / (tf + norm)
+
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+        if accept is None:
+            return ranked[:limit]
+        results = []
+        for doc_id, score in ranked:
+            if accept(parse_passage_id(doc_id)[0]):
+                results.append((doc_id, score))
+                if len(results) == limit:
+                    break
+        return results
+
+lexical_index = LexicalIndex()
+
+def minhash_signature(texts: Iterable[str]) -> Optional[Tuple[int, ...]]:
+    """MinHash signature of the word shingles in `texts`, or None if there are none.
+
+    Uses one-permutation hashing: each shingle is hashed once and the hash picks
+    the bucket it competes in, so the cost is linear in the text length. Empty
+    buckets borrow from the next filled one so short texts still compare.
+    """
+    empty = 1 << 64
+    mins = [empty] * MINHASH_SIZE
+    for text in texts:
+        words = tokenize(text)
+        for i in range(max(0, len(words) - MINHASH_SHINGLE_WORDS) + 1 if words else 0):
+            shingle = " ".join(words[i:i + MINHASH_SHINGLE_WORDS]).encode("utf-8")
+            value = int.from_bytes(hashlib.blake2b(shingle, digest_size=8).digest(), "little")
+            bucket, value = value % MINHASH_SIZE, value // MINHASH_SIZE
+            if value < mins[bucket]:
+                mins[bucket] = value
+    filled = [i for i, value in enumerate(mins) if value != empty]
+    if not filled:
+        return None
+    signature = list(mins)
+    for i in range(MINHASH_SIZE):
+        if mins[i] == empty:
+            j = next((j for j in filled if j > i), filled[0])
+            distance = (j - i) % MINHASH_SIZE
+            signature[i] = mins[j] + distance * (empty // MINHASH_SIZE)
+    return tuple(signature)
+
+def signature_similarity(a: Tuple[int, ...], b: Tuple[int, ...]) -> float:
+    """Estimated Jaccard similarity of two MinHash signatures."""
+    return sum(x == y for x, y in zip(a, b)) / len(a)
+
+class NearDuplicateIndex:
+    """MinHash signatures of every paper's text with an LSH band index.
+
+    Signatures are persisted in SQLite and loaded into memory on first use. A
+    lookup only compares against papers sharing at least one band of the
+    signature with the query, so it doesn't scan the whole library.
+    """
+
+    def __init__(self, path: str, bands: int = MINHASH_BANDS):
+        self.bands = bands
+        self.rows = MINHASH_SIZE // bands
+        self.lock = threading.RLock()
+        self.loaded = False
+        self.signatures: Dict[str, Tuple[int, ...]] = {}
+        self.buckets: List[Dict[Tuple[int, ...], Dict[str, None]]] = [{} for _ in range(bands)]
+        self.last_rowid = 0
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS signatures (paper_id TEXT PRIMARY KEY, signature BLOB NOT NULL)"
+        )
+
+    def ensure_loaded(self):
+        """Load the stored signatures, dropping those of papers that no longer exist."""
+        with self.lock:
+            if self.loaded:
+                return
+            index = get_paper_index()
+            stale = []
+            for rowid, paper_id, blob in self.conn.execute("SELECT rowid, paper_id, signature FROM signatures"):
+                self.last_rowid = max(self.last_rowid, rowid)
+                if paper_id in index:
+                    self._index(paper_id, tuple(array("Q", blob)))
+                else:
+                    stale.append((paper_id,))
+            self.conn.executemany("DELETE FROM signatures WHERE paper_id = ?", stale)
+            self.loaded = True
+
+    def refresh(self):
+        """Pick up signatures other worker processes added since the last load.
+        Replacing a row gives it a new rowid, so rewritten signatures are seen too."""
+        with self.lock:
+            self.ensure_loaded()
+            rows = self.conn.execute(
+                "SELECT rowid, paper_id, signature FROM signatures WHERE rowid > ?", (self.last_rowid,)
+            ).fetchall()
+            for rowid, paper_id, blob in rows:
+                self.last_rowid = max(self.last_rowid, rowid)
+                self._index(paper_id, tuple(array("Q", blob)))
+
+    def forget(self, paper_ids: List[str]):
+        """Drop signatures another worker process deleted."""
+        with self.lock:
+            for paper_id in paper_ids:
+                self._unindex(paper_id)
+
+    def _bands(self, signature: Tuple[int, ...]) -> List[Tuple[int, ...]]:
+        return [signature[band * self.rows:(band + 1) * self.rows] for band in range(self.bands)]
+
+    def _index(self, paper_id: str, signature: Tuple[int, ...]):
+        self._unindex(paper_id)
+        self.signatures[paper_id] = signature
+        for band, key in enumerate(self._bands(signature)):
+            self.buckets[band].setdefault(key, {})[paper_id] = None
+
+    def _unindex(self, paper_id: str):
+        signature = self.signatures.pop(paper_id, None)
+        if signature is None:
+            return
+        for band, key in enumerate(self._bands(signature)):
+            ids = self.buckets[band].get(key)
+            if ids is not None:
+                ids.pop(paper_id, None)
+                if not ids:
+                    del self.buckets[band][key]
+
+    def add(self, paper_id: str, signature: Tuple[int, ...]):
+        with self.lock:
+            self.ensure_loaded()
+            self._index(paper_id, signature)
+            self.conn.execute(
+                "INSERT OR REPLACE INTO signatures (paper_id, signature) VALUES (?, ?)",
+                (paper_id, array("Q", signature).tobytes())
+            )
+
+    def remove(self, paper_ids: List[str]):
+        with self.lock:
+            self.ensure_loaded()
+            for paper_id in paper_ids:
+                self._unindex(paper_id)
+            self.conn.executemany("DELETE FROM signatures WHERE paper_id = ?", [(paper_id,) for paper_id in paper_ids])
+
+    def find(self, signature: Tuple[int, ...], threshold: float = NEAR_DUPLICATE_THRESHOLD) -> Optional[Tuple[str, float]]:
+        """The most similar paper outside the trash at or above `threshold`, with its similarity."""
+        index = get_paper_index()
+        with self.lock:
+            self.ensure_loaded()
+            candidates = {}
+            for band, key in enumerate(self._bands(signature)):
+                candidates.update(self.buckets[band].get(key, {}))
+            best = None
+            for paper_id in candidates:
+                metadata = index.get(paper_id)
+                # Papers still being ingested aren't in the metadata index yet but do count
+                if metadata is not None and metadata.get("folder_id") == "trash":
+                    continue
+                similarity = signature_similarity(signature, self.signatures[paper_id])
+                if similarity >= threshold and (best is None or similarity > best[1]):
+                    best = (paper_id, similarity)
+            return best
+
+    def claim(self, paper_id: str, signature: Tuple[int, ...]) -> Optional[Tuple[str, float]]:
+        """Register a paper's signature unless a near-duplicate exists, which is returned instead.
+
+        Checking and registering under one lock keeps two concurrent uploads of
+        the same paper from both getting through; across worker processes the
+        caller holds the paper write lock.
+        """
+        with self.lock:
+            self.refresh()
+            duplicate = self.find(signature)
+            if duplicate is None:
+                self.add(paper_id, signature)
+            return duplicate
+
+near_duplicate_index = NearDuplicateIndex(NEAR_DUPLICATE_FILE)
+
+class QuantizedVectorStore:
+    """Passage embeddings quantized to float16 or int8 in a memory-mapped file.
+
+    Mirrors the passages collection for exact, brute-force vector search.
+    Row n of `<path>` holds the embedding with rowid n + 1 in the `rows` table
+    of `<path>.sqlite3`, which maps it to its passage and keeps the scale of
+    int8 rows and the squared norm of the original vector. Rows are only ever
+    appended, so other processes can map the file read-only (it is a plain
+    C-ordered array) and worker processes pick up each other's rows through
+    `refresh`. Deleted rows are left in the file until the store is rebuilt.
+    """
+
+    DTYPES = {"float16": np.float16, "int8": np.int8}
+
+    def __init__(self, path: str, dtype: str):
+        self.path = path
+        self.dtype = np.dtype(self.DTYPES[dtype])
+        self.lock = threading.RLock()
+        self.loaded = False
+        self.dimensions = 0
+        self.count = 0
+        self.vectors: Optional[np.ndarray] = None
+        self.live = np.zeros(0, dtype=bool)
+        self.scales = np.zeros(0, dtype=np.float32)
+        self.norms = np.zeros(0, dtype=np.float32)
+        self.chunks = np.zeros(0, dtype=np.int32)
+        self.row_papers: List[Optional[str]] = []
+        self.paper_rows: Dict[str, List[int]] = {}
+        self.last_rowid = 0
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        self.conn = sqlite3.connect(f"{path}.sqlite3", check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS rows ("
+            "row INTEGER PRIMARY KEY AUTOINCREMENT, paper_id TEXT NOT NULL, chunk_index INTEGER NOT NULL, "
+            "scale REAL NOT NULL, norm REAL NOT NULL)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS rows_paper_id ON rows (paper_id)")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+
+    def __len__(self) -> int:
+        with self.lock:
+            self.ensure_loaded()
+            return int(self.live[:self.count].sum())
+
+    def ensure_loaded(self):
+        with self.lock:
+            if not self.loaded:
+                self.loaded = True
+                self.refresh()
+
+    def build(self, source_collection, page_size: int = 2000):
+        """(Re)build the store by paging through a passages collection."""
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            self.conn.execute("DELETE FROM rows")
+            self.conn.execute("DELETE FROM meta")
+            self.conn.execute("DELETE FROM sqlite_sequence WHERE name = 'rows'")
+            # A new file, processes that still map the old one mustn't see it shrink
+            os.close(self.fd)
+            os.unlink(self.path)
+            self.fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+            self.conn.execute("COMMIT")
+            self.dimensions = self.count = self.last_rowid = 0
+            self.vectors = None
+            for name in ("live", "scales", "norms", "chunks"):
+                setattr(self, name, np.zeros(0, dtype=getattr(self, name).dtype))
+            self.row_papers, self.paper_rows = [], {}
+            self.loaded = True
+            offset = 0
+            while True:
+                results = source_collection.get(include=["embeddings"], limit=page_size, offset=offset)
+                self.add(results["ids"], results["embeddings"])
+                if len(results["ids"]) < page_size:
+                    break
+                offset += page_size
+
+    def _grow(self, size: int):
+        capacity = len(self.live)
+        if size <= capacity:
+            return
+        capacity = max(size, capacity * 2, 1024)
+        for name in ("live", "scales", "norms", "chunks"):
+            old = getattr(self, name)
+            grown = np.zeros(capacity, dtype=old.dtype)
+            grown[:len(old)] = old
+            setattr(self, name, grown)
+        self.row_papers.extend([None] * (capacity - len(self.row_papers)))
+
+    def _map(self, rows: int):
+        """Make sure the first `rows` rows of the file are mapped."""
+        if self.vectors is not None and len(self.vectors) >= rows:
+            return
+        if not self.dimensions:
+            # Written along with the first rows, maybe by another process
+            self.dimensions = self.conn.execute("SELECT value FROM meta WHERE key = 'dimensions'").fetchone()[0]
+        file_rows = os.fstat(self.fd).st_size // (self.dimensions * self.dtype.itemsize)
+        self.vectors = np.memmap(self.path, dtype=self.dtype, mode="r", shape=(file_rows, self.dimensions))
+
+    def _load_rows(self, rows: List[Tuple[int, str, int, float, float]]):
+        if not rows:
+            return
+        self._grow(rows[-1][0])
+        for rowid, paper_id, chunk_index, scale, norm in rows:
+            self.last_rowid = max(self.last_rowid, rowid)
+            row = rowid - 1
+            if self.live[row]:
+                continue
+            self.live[row] = True
+            self.scales[row] = scale
+            self.norms[row] = norm
+            self.chunks[row] = chunk_index
+            self.row_papers[row] = paper_id
+            self.paper_rows.setdefault(paper_id, []).append(row)
+        self.count = max(self.count, rows[-1][0])
+        self._map(self.count)
+
+    def refresh(self):
+        """Pick up rows other worker processes appended since the last load."""
+        with self.lock:
+            self.ensure_loaded()
+            self._load_rows(self.conn.execute(
+                "SELECT row, paper_id, chunk_index, scale, norm FROM rows WHERE row > ? ORDER BY row",
+                (self.last_rowid,)
+            ).fetchall())
+
+    def _unload_paper(self, paper_id: str):
+        for row in self.paper_rows.pop(paper_id, []):
+            self.live[row] = False
+            self.row_papers[row] = None
+
+    def reload_papers(self, paper_ids: List[str]):
+        """Re-read the rows of papers another worker process replaced or deleted."""
+        with self.lock:
+            self.ensure_loaded()
+            for paper_id in paper_ids:
+                self._unload_paper(paper_id)
+            for start in range(0, len(paper_ids), 500):
+                chunk = paper_ids[start:start + 500]
+                self._load_rows(self.conn.execute(
+                    f"SELECT row, paper_id, chunk_index, scale, norm FROM rows "
+                    f"WHERE paper_id IN ({','.join('?' * len(chunk))}) ORDER BY row",
+                    chunk
+                ).fetchall())
+
+    def add(self, ids: List[str], embeddings: List[List[float]]):
+        if not ids:
+            return
+        vectors = np.asarray(embeddings, dtype=np.float32)
+        norms = np.einsum("ij,ij->i", vectors, vectors)
+        if self.dtype == np.int8:
+            scales = np.abs(vectors).max(axis=1) / 127
+            scales[scales == 0] = 1.0
+            quantized = np.rint(vectors / scales[:, None]).astype(np.int8)
+        else:
+            scales = np.ones(len(ids), dtype=np.float32)
+            quantized = vectors.astype(np.float16)
+        with self.lock:
+            self.ensure_loaded()
+            # The write transaction also serializes appending to the file
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self.conn.execute("SELECT value FROM meta WHERE key = 'dimensions'").fetchone()
+                if row is None:
+                    self.conn.execute("INSERT INTO meta (key, value) VALUES ('dimensions', ?)", (vectors.shape[1],))
+                elif row[0] != vectors.shape[1]:
+                    raise ValueError(f"Expected {row[0]}-dimensional embeddings, got {vectors.shape[1]}")
+                self.dimensions = vectors.shape[1]
+                rows = []
+                for passage, scale, norm in zip(ids, scales.tolist(), norms.tolist()):
+                    paper_id, chunk_index = parse_passage_id(passage)
+                    rowid = self.conn.execute(
+                        "INSERT INTO rows (paper_id, chunk_index, scale, norm) VALUES (?, ?, ?, ?)",
+                        (paper_id, chunk_index, scale, norm)
+                    ).lastrowid
+                    rows.append((rowid, paper_id, chunk_index, scale, norm))
+                # Rows are allocated consecutively while holding the write transaction
+                os.pwrite(self.fd, quantized.tobytes(), (rows[0][0] - 1) * self.dimensions * self.dtype.itemsize)
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+            self._load_rows(rows)
+
+    def remove_papers(self, paper_ids: List[str]):
+        with self.lock:
+            self.ensure_loaded()
+            for paper_id in paper_ids:
+                self._unload_paper(paper_id)
+            self.conn.executemany("DELETE FROM rows WHERE paper_id = ?", [(paper_id,) for paper_id in paper_ids])
+
+    def destroy(self):
+        """Close and delete the store's files, once its collection is gone."""
+        with self.lock:
+            self.conn.close()
+            os.close(self.fd)
+            self.vectors = None
+            for suffix in ("", ".sqlite3", ".sqlite3-wal", ".sqlite3-shm"):
+                if os.path.exists(self.path + suffix):
+                    os.remove(self.path + suffix)
+
+    def paper_embeddings(self, paper_id: str) -> np.ndarray:
+        """Dequantized float32 embeddings of a paper's passages, in chunk order."""
+        with self.lock:
+            self.ensure_loaded()
+            rows = sorted(self.paper_rows.get(paper_id, []), key=lambda row: self.chunks[row])
+            if not rows:
+                return np.zeros((0, self.dimensions), dtype=np.float32)
+            return self.vectors[rows].astype(np.float32) * self.scales[rows, None]
+
+    def search(
+        self,
+        embedding: List[float],
+        limit: int,
+        papers: Optional[Iterable[str]] = None,
+        accept=None,
+        chunk_rows: int = 65536
+    ) -> List[Tuple[str, float]]:
+        """The `limit` nearest passages by squared L2 distance, as (passage id, distance).
+
+        `papers` restricts the search to those papers' rows up front; `accept`
+        is checked lazily per paper on the nearest rows, for filters that let
+        most papers through.
+        """
+        with self.lock:
+            self.ensure_loaded()
+            count = self.count
+            if not count or not limit:
+                return []
+            vectors = self.vectors
+            scales, norms, chunks, row_papers = self.scales[:count], self.norms[:count], self.chunks, self.row_papers
+            mask = self.live[:count].copy()
+            if papers is not None:
+                allowed = np.zeros(count, dtype=bool)
+                for paper_id in papers:
+                    allowed[self.paper_rows.get(paper_id, [])] = True
+                mask &= allowed
+
+        query = np.asarray(embedding, dtype=np.float32)
+        if len(query) != vectors.shape[1]:
+            raise ValueError(f"Expected a {vectors.shape[1]}-dimensional query embedding, got {len(query)}")
+        distances = np.empty(count, dtype=np.float32)
+        for start in range(0, count, chunk_rows):
+            stop = min(start + chunk_rows, count)
+            dots = vectors[start:stop].astype(np.float32) @ query
+            distances[start:stop] = norms[start:stop] - 2 * dots * scales[start:stop]
+        distances += float(query @ query)
+        distances[~mask] = np.inf
+        candidates = int(mask.sum())
+
+        results: List[Tuple[str, float]] = []
+        verdicts: Dict[str, bool] = {}
+        window = min(candidates, limit * 4 if accept is not None else limit)
+        seen = 0
+        while window > seen:
+            nearest = np.argpartition(distances, window - 1)[:window] if window < count else np.arange(count)
+            nearest = nearest[np.argsort(distances[nearest], kind="stable")][seen:window]
+            for row in nearest.tolist():
+                paper_id = row_papers[row]
+                if paper_id is None:
+                    continue
+                if accept is not None:
+                    if paper_id not in verdicts:
+                        verdicts[paper_id] = accept(paper_id)
+                    if not verdicts[paper_id]:
+                        continue
+                results.append((passage_id(paper_id, int(chunks[row])), float(distances[row])))
+                if len(results) == limit:
+                    return results
+            seen = window
+            window = min(candidates, window * 4)
+        return results
+
+def open_vector_store(passages_name: str) -> Optional[QuantizedVectorStore]:
+    """The vector store mirroring a passages collection, if VECTOR_STORE enables one."""
+    if VECTOR_STORE == "chroma":
+        return None
+    return QuantizedVectorStore(os.path.join(VECTOR_STORE_DIR, f"{passages_name}.{VECTOR_STORE}"), VECTOR_STORE)
+
+vector_store = open_vector_store(passages.name)
+
+class RelatedPapers:
+    """Nearest-neighbour graph over the papers, behind /papers/{filename}/related.
+
+    The `neighbours` nearest papers of every paper, by the distance between
+    their paper embeddings in the papers collection, are kept in SQLite so a
+    lookup is one indexed read. `linked` records the papers whose list was
+    computed, so a paper without neighbours isn't linked again on every lookup. `update` follows the shared change log: it
+    links papers that were added or replaced (adding them to their
+    neighbours' lists too), drops deleted papers and refills the lists they
+    were in, and starts over for a new papers collection.
+    """
+
+    def __init__(self, path: str, neighbours: int = RELATED_NEIGHBOURS):
+        self.neighbours = neighbours
+        self.lock = threading.RLock()
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS neighbours ("
+            "paper_id TEXT NOT NULL, neighbour_id TEXT NOT NULL, distance REAL NOT NULL, "
+            "PRIMARY KEY (paper_id, neighbour_id))"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS neighbours_neighbour_id ON neighbours (neighbour_id)")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS pending (paper_id TEXT PRIMARY KEY)")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS linked (paper_id TEXT PRIMARY KEY)")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+
+    def _meta(self, key: str) -> Optional[str]:
+        row = self.conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def _set_meta(self, key: str, value: Any):
+        self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, str(value)))
+
+    def lookup(self, paper_id: str, source_collection, limit: int, accept) -> List[Tuple[str, float]]:
+        """Up to `limit` of a paper's neighbours that pass `accept`, as (paper id,
+        distance), nearest first. Papers the graph hasn't reached yet are linked
+        on the spot. If rejected papers (in the trash, say) leave too few of the
+        stored list, more neighbours are fetched from the collection's index."""
+        with self.lock:
+            rows = self._neighbours(paper_id)
+            if not rows and self.conn.execute("SELECT 1 FROM linked WHERE paper_id = ?", (paper_id,)).fetchone() is None:
+                self.link([paper_id], source_collection)
+                rows = self._neighbours(paper_id)
+        results = [(neighbour_id, distance) for neighbour_id, distance in rows if accept(neighbour_id)]
+        if len(results) < limit and len(rows) >= self.neighbours:
+            # The full list may have left out papers that would pass
+            return self._nearest(paper_id, source_collection, limit, accept, len(rows) + limit)
+        return results[:limit]
+
+    def _neighbours(self, paper_id: str) -> List[Tuple[str, float]]:
+        return self.conn.execute(
+            "SELECT neighbour_id, distance FROM neighbours WHERE paper_id = ? ORDER BY distance", (paper_id,)
+        ).fetchall()
+
+    def _nearest(self, paper_id: str, source_collection, limit: int, accept, fetch: int) -> List[Tuple[str, float]]:
+        """Query the collection's index for the nearest `limit` papers passing
+        `accept`, fetching more until enough pass or the collection runs out."""
+        embeddings = source_collection.get(ids=[paper_id], include=["embeddings"])["embeddings"]
+        count = source_collection.count()
+        if not embeddings or count < 2:
+            return []
+        while True:
+            found = source_collection.query(
+                query_embeddings=embeddings, n_results=min(fetch + 1, count), include=["distances"]
+            )
+            results = [
+                (neighbour_id, distance)
+                for neighbour_id, distance in zip(found["ids"][0], found["distances"][0])
+                if neighbour_id != paper_id and accept(neighbour_id)
+            ]
+            if len(results) >= limit or fetch + 1 >= count:
+                return results[:limit]
+            fetch *= 4
+
+    def update(self, source_collection, shared: "SharedState", batch_size: int = 100) -> int:
+        """Apply the logged paper changes and link the papers waiting for it.
+        Returns how many papers were linked."""
+        with self.lock:
+            rows, complete = shared.changes_since(int(self._meta("seq") or 0))
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                if (
+                    self._meta("collection") != source_collection.name
+                    or not complete
+                    or any(kind == "reset" for _, _, _, kind in rows)
+                ):
+                    self._restart(source_collection)
+                else:
+                    changes = {paper_id: kind for _, _, paper_id, kind in rows if kind in ("content", "delete")}
+                    self._remove([paper_id for paper_id, kind in changes.items() if kind == "delete"])
+                    self.conn.executemany(
+                        "INSERT OR IGNORE INTO pending (paper_id) VALUES (?)",
+                        [(paper_id,) for paper_id, kind in changes.items() if kind == "content"]
+                    )
+                if rows:
+                    self._set_meta("seq", rows[-1][0])
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+
+        # Batch by batch, so lookups aren't held up by a full rebuild
+        linked = 0
+        while True:
+            with self.lock:
+                batch = [row[0] for row in self.conn.execute("SELECT paper_id FROM pending LIMIT ?", (batch_size,))]
+                if not batch:
+                    return linked
+                self.link(batch, source_collection)
+            linked += len(batch)
+
+    def _restart(self, source_collection, page_size: int = 10000):
+        """Drop the graph and queue every paper of `source_collection` for linking."""
+        self.conn.execute("DELETE FROM neighbours")
+        self.conn.execute("DELETE FROM pending")
+        self.conn.execute("DELETE FROM linked")
+        offset = 0
+        while True:
+            ids = source_collection.get(include=[], limit=page_size, offset=offset)["ids"]
+            self.conn.executemany("INSERT OR IGNORE INTO pending (paper_id) VALUES (?)", [(i,) for i in ids])
+            if len(ids) < page_size:
+                break
+            offset += page_size
+        self._set_meta("collection", source_collection.name)
+
+    def _remove(self, paper_ids: List[str]):
+        for start in range(0, len(paper_ids), 500):
+            chunk = paper_ids[start:start + 500]
+            marks = ",".join("?" * len(chunk))
+            # Lists that lose a member are computed again
+            self.conn.execute(
+                f"INSERT OR IGNORE INTO pending (paper_id) "
+                f"SELECT DISTINCT paper_id FROM neighbours WHERE neighbour_id IN ({marks})", chunk
+            )
+            self.conn.execute(f"DELETE FROM neighbours WHERE paper_id IN ({marks}) OR neighbour_id IN ({marks})", chunk * 2)
+            self.conn.execute(f"DELETE FROM pending WHERE paper_id IN ({marks})", chunk)
+            self.conn.execute(f"DELETE FROM linked WHERE paper_id IN ({marks})", chunk)
+
+    def link(self, paper_ids: List[str], source_collection):
+        """(Re)compute the neighbour lists of some papers from the collection's index."""
+        with self.lock:
+            results = source_collection.get(ids=paper_ids, include=["embeddings"])
+            count = source_collection.count()
+            edges = []
+            if results["ids"] and count > 1:
+                found = source_collection.query(
+                    query_embeddings=results["embeddings"],
+                    n_results=min(self.neighbours + 1, count),
+                    include=["distances"]
+                )
+                for paper_id, ids, distances in zip(results["ids"], found["ids"], found["distances"]):
+                    edges.extend([
+                        (paper_id, neighbour_id, distance)
+                        for neighbour_id, distance in zip(ids, distances) if neighbour_id != paper_id
+                    ][:self.neighbours])
+
+            marks = ",".join("?" * len(paper_ids))
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                self.conn.execute(f"DELETE FROM neighbours WHERE paper_id IN ({marks})", paper_ids)
+                self.conn.executemany("INSERT OR REPLACE INTO neighbours VALUES (?, ?, ?)", edges)
+                # The linked papers are also candidates for their neighbours' lists
+                self.conn.executemany(
+                    "INSERT OR REPLACE INTO neighbours VALUES (?, ?, ?)",
+                    [(neighbour_id, paper_id, distance) for paper_id, neighbour_id, distance in edges]
+                )
+                for neighbour_id in {neighbour_id for _, neighbour_id, _ in edges}:
+                    self.conn.execute(
+                        "DELETE FROM neighbours WHERE paper_id = ? AND neighbour_id NOT IN ("
+                        "SELECT neighbour_id FROM neighbours WHERE paper_id = ? ORDER BY distance LIMIT ?)",
+                        (neighbour_id, neighbour_id, self.neighbours)
+                    )
+                self.conn.execute(f"DELETE FROM pending WHERE paper_id IN ({marks})", paper_ids)
+                # Also papers with no neighbours, their empty list is known
+                self.conn.executemany("INSERT OR IGNORE INTO linked (paper_id) VALUES (?)", [(i,) for i in results["ids"]])
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+
+related_papers = RelatedPapers(RELATED_FILE)
+
+def spool_passages(file_path: str, spool) -> Optional[Tuple[int, ...]]:
+    """Write a PDF's passages to `spool` one per line and return their MinHash signature.
+
+    Passages never contain newlines since chunking joins words with single spaces.
+    """
+    def iter_spooled():
+        for passage in iter_passages(iter_pdf_pages(file_path)):
+            spool.write(passage + "\n")
+            yield passage
+    signature = minhash_signature(iter_spooled())
+    spool.seek(0)
+    return signature
+
+def iter_spooled_passages(spool) -> Iterator[str]:
+    """Read passages back from a spool written by spool_passages."""
+    for line in spool:
+        yield line.rstrip("\n")
+
+def mean_embedding(embeddings: Iterable[List[float]]) -> List[float]:
+    """Normalized mean of several embeddings, used as the paper-level embedding."""
+    total = None
+    for embedding in embeddings:
+        if total is None:
+            total = [0.0] * len(embedding)
+        for i, value in enumerate(embedding):
+            total[i] += value
+    norm = math.sqrt(sum(value * value for value in total)) or 1.0
+    return [value / norm for value in total]
+
+def passage_records(filename: str, start: int, count: int, metadata: Dict[str, Any]) -> Dict[str, list]:
+    """Ids and metadatas for a run of a paper's passages."""
+    fields = filter_fields(metadata)
+    return {
+        "ids": [passage_id(filename, start + i) for i in range(count)],
+        "metadatas": [{**fields, "paper_id": filename, "chunk_index": start + i} for i in range(count)]
+    }
+
+def live_library() -> Tuple[Any, Any, LexicalIndex, Optional[QuantizedVectorStore], str]:
+    """The live papers and passages collections, lexical index, vector store and
+    embedding model. A reindex swaps them all at once, so writes that span
+    awaits take them together up front and check for a swap before committing."""
+    return collection, passages, lexical_index, vector_store, EMBEDDING_MODEL
+
+def discard_library_passages(paper_ids: List[str], library: tuple):
+    """Remove papers' passages from the collection and indexes of a library."""
+    _, library_passages, library_lexical_index, library_vector_store, _ = library
+    try:
+        library_passages.delete(where={"paper_id": {"$in": paper_ids}})
+    except Exception:
+        pass  # A reindex deleted the collection after swapping in a new one
+    for paper_id in paper_ids:
+        library_lexical_index.remove_paper(paper_id)
+    if library_vector_store is not None:
+        try:
+            library_vector_store.remove_papers(paper_ids)
+        except Exception:
+            pass
+
+async def index_paper(filename: str, metadata: Dict[str, Any], spool) -> int:
+    """Embed a paper's spooled passages in batches and store them linked to the paper id.
+
+    The paper record itself is stored with the normalized mean of its passage
+    embeddings and its first passage as document, and added to the metadata
+    index. If a reindex swaps the collections before the paper record is
+    written, the passages are dropped and the paper is indexed again into the
+    new collections with their model. Returns the passage count.
+    """
+    while True:
+        library = live_library()
+        library_passages, library_lexical_index, library_vector_store, model = library[1:]
+        count = 0
+        first_passage = None
+        embedding_sum = None
+        spool.seek(0)
+        passage_iter = iter_spooled_passages(spool)
+        try:
+            while True:
+                # Pull the next batch off the event loop, PDF parsing is blocking work
+                batch = await asyncio.to_thread(list, itertools.islice(passage_iter, EMBEDDING_BATCH_SIZE))
+                if not batch:
+                    break
+
+                embeddings = await get_embeddings(batch, model)
+                records = passage_records(filename, count, len(batch), metadata)
+                await asyncio.to_thread(
+                    library_passages.add,
+                    documents=batch,
+                    embeddings=embeddings,
+                    **records
+                )
+                library_lexical_index.add(records["ids"], batch)
+                if library_vector_store is not None:
+                    await asyncio.to_thread(library_vector_store.add, records["ids"], embeddings)
+
+                # Keep a running sum instead of every embedding to stay flat in memory
+                if first_passage is None:
+                    first_passage = batch[0]
+                    embedding_sum = [0.0] * len(embeddings[0])
+                for embedding in embeddings:
+                    for i, value in enumerate(embedding):
+                        embedding_sum[i] += value
+                count += len(batch)
+
+            if not count:
+                raise ValueError("No text could be extracted from the PDF file.")
+
+            metadata["passage_count"] = count
+            # Paper records and their counts are written together, see build_worker_state
+            async with paper_write_lock():
+                if collection is library[0]:
+                    await asyncio.to_thread(
+                        collection.add,
+                        documents=[first_passage],
+                        embeddings=[mean_embedding([embedding_sum])],
+                        metadatas=[metadata],
+                        ids=[filename]
+                    )
+                    paper_index.upsert(filename, metadata)
+                    return count
+        except Exception:
+            # Don't leave orphaned passages behind
+            await asyncio.to_thread(discard_library_passages, [filename], library)
+            # Writes to the old collections fail once another worker's reindex deleted them
+            await asyncio.to_thread(sync_worker_state)
+            if collection is library[0]:
+                raise
+            continue
+        # A reindex swapped the collections, the passages went to the old ones
+        await asyncio.to_thread(discard_library_passages, [filename], library)
+
+def extract_passages(file_path: str) -> List[str]:
+    """Extract and chunk a whole PDF. Runs inside the PDF process pool."""
+    return list(iter_passages(iter_pdf_pages_serial(file_path)))
+
+def extract_passages_with_signature(file_path: str) -> Tuple[List[str], Optional[Tuple[int, ...]]]:
+    """Extract and chunk a whole PDF and compute its MinHash signature. Runs inside the PDF process pool."""
+    texts = extract_passages(file_path)
+    return texts, minhash_signature(texts)
+
+pdf_process_pool: Optional[ProcessPoolExecutor] = None
+
+def get_pdf_process_pool() -> ProcessPoolExecutor:
+    """Return the process pool used for PDF parsing, creating it on first use."""
+    global pdf_process_pool
+    if pdf_process_pool is None:
+        pdf_process_pool = ProcessPoolExecutor(max_workers=PDF_WORKERS)
+    return pdf_process_pool
+
+def sanitize_filename(title: str, original_extension: str = ".pdf") -> str:
+    """Convert a title to a valid filename."""
+    # Remove invalid characters and replace spaces with underscores
+    filename = re.sub(r'[<>:"/\\|?*]', '', title)
+    filename = filename.replace(' ', '_')
+    
+    # Ensure the filename ends with .pdf
+    if not filename.lower().endswith(original_extension):
+        filename += original_extension
+        
+    return filename
+
+def ensure_unique_filename(base_filename: str, directory: str) -> str:
+    """Ensure filename is unique by adding a number if necessary."""
+    filename = base_filename
+    counter = 1
+    
+    # Split filename into name and extension
+    name, ext = os.path.splitext(filename)
+    
+    while os.path.exists(os.path.join(directory, filename)):
+        filename = f"{name}_{counter}{ext}"
+        counter += 1
+        
+    return filename
+
+async def receive_upload(upload: UploadFile, directory: str) -> Tuple[str, str]:
+    """Stream an upload into a temporary file in `directory`, hashing it on the way.
+
+    Returns the temporary path and the SHA-256 of the content. The file is
+    created next to its destination so it can be renamed into place atomically.
+    """
+    fd, temp_path = tempfile.mkstemp(prefix=".upload-", suffix=".part", dir=directory)
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        with os.fdopen(fd, "wb") as buffer:
+            while chunk := await upload.read(UPLOAD_CHUNK_SIZE):
+                size += len(chunk)
+                if MAX_UPLOAD_BYTES and size > MAX_UPLOAD_BYTES:
+                    raise HTTPException(
+                        status_code=413,
+                        detail=f"File exceeds the maximum upload size of {MAX_UPLOAD_BYTES} bytes"
+                    )
+                digest.update(chunk)
+                await asyncio.to_thread(buffer.write, chunk)
+    except BaseException:
+        os.remove(temp_path)
+        raise
+    return temp_path, digest.hexdigest()
+
+def file_sha256(file_path: str) -> str:
+    """SHA-256 of a file on disk."""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        while chunk := f.read(UPLOAD_CHUNK_SIZE):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def parse_tags(paper_tags) -> List[str]:
+    """Return a paper's tags, which are stored as a JSON encoded string."""
+    if isinstance(paper_tags, str):
+        try:
+            parsed_tags = json.loads(paper_tags)
+            if isinstance(parsed_tags, list):
+                return parsed_tags
+        except json.JSONDecodeError:
+            print(f"Warning: Could not parse tags JSON: {paper_tags}")
+        return []
+    if isinstance(paper_tags, list):
+        return paper_tags
+    return []
+
+class StatsAggregates:
+    """Paper counts per category, tag and year, persisted in SQLite.
+
+    Counts are kept per scope: the whole collection, the library (everything
+    outside the trash) and each folder, so /stats reads one scope's rows
+    whatever the size of the collection. The metadata index applies the count
+    changes of each write in a single transaction; the rows are mirrored in
+    memory so reads never touch the database.
+    """
+
+    ALL = "all"
+    LIBRARY = "library"
+    FOLDER_PREFIX = "folder:"
+
+    def __init__(self, path: str):
+        self.lock = threading.RLock()
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS counts ("
+            "scope TEXT NOT NULL, field TEXT NOT NULL, key TEXT NOT NULL, count INTEGER NOT NULL, "
+            "PRIMARY KEY (scope, field, key))"
+        )
+        self.scopes: Dict[str, Counter] = {}
+        self.load()
+
+    def load(self):
+        """(Re)read the counts, which other worker processes may have changed."""
+        scopes = {}
+        with self.lock:
+            for scope, field, key, count in self.conn.execute("SELECT scope, field, key, count FROM counts"):
+                scopes.setdefault(scope, Counter())[(field, key)] = count
+            self.scopes = scopes
+
+    @classmethod
+    def folder_scope(cls, folder_id: Optional[str]) -> str:
+        return cls.FOLDER_PREFIX + (folder_id or "")
+
+    @classmethod
+    def entries(cls, metadata: Dict[str, Any]) -> List[Tuple[str, str, str]]:
+        """The (scope, field, key) counters a paper adds one to."""
+        folder_id = metadata.get("folder_id")
+        scopes = [cls.ALL, cls.folder_scope(folder_id)]
+        if folder_id != "trash":
+            scopes.append(cls.LIBRARY)
+        keys = [("total", "")]
+        if metadata.get("category"):
+            keys.append(("category", str(metadata["category"])))
+        keys.extend(("tag", str(tag)) for tag in dict.fromkeys(parse_tags(metadata.get("tags", "[]"))))
+        if metadata.get("year"):
+            keys.append(("year", str(metadata["year"])))
+        return [(scope, field, key) for scope in scopes for field, key in keys]
+
+    def apply(self, deltas: Counter):
+        """Add count changes, in one transaction."""
+        deltas = [(scope, field, key, delta) for (scope, field, key), delta in deltas.items() if delta]
+        if not deltas:
+            return
+        with self.lock:
+            self.conn.execute("BEGIN")
+            try:
+                self.conn.executemany(
+                    "INSERT INTO counts (scope, field, key, count) VALUES (?, ?, ?, ?) "
+                    "ON CONFLICT (scope, field, key) DO UPDATE SET count = count + excluded.count",
+                    deltas
+                )
+                self.conn.executemany(
+                    "DELETE FROM counts WHERE scope = ? AND field = ? AND key = ? AND count <= 0",
+                    [(scope, field, key) for scope, field, key, delta in deltas if delta < 0]
+                )
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+            for scope, field, key, delta in deltas:
+                counts = self.scopes.setdefault(scope, Counter())
+                counts[(field, key)] += delta
+                if counts[(field, key)] <= 0:
+                    del counts[(field, key)]
+                    if not counts:
+                        del self.scopes[scope]
+
+    def reconcile(self, metadatas: Iterable[Dict[str, Any]]):
+        """Bring the stored counts in line with the given papers, which is only
+        needed when they were changed without going through the metadata index."""
+        expected = Counter()
+        for metadata in metadatas:
+            expected.update(self.entries(metadata))
+        with self.lock:
+            stored = Counter({
+                (scope, field, key): count
+                for scope, counts in self.scopes.items() for (field, key), count in counts.items()
+            })
+            if expected == stored:
+                return
+            print("Warning: Stored paper statistics are out of date, recounting")
+            expected.subtract(stored)
+            self.apply(expected)
+
+    def stats(self, scope: str) -> Dict[str, Any]:
+        with self.lock:
+            rows = list(self.scopes.get(scope, {}).items())
+        return {
+            "total_papers": sum(count for (field, _), count in rows if field == "total"),
+            "categories": {key: count for (field, key), count in rows if field == "category"},
+            "tags": sorted(key for (field, key), _ in rows if field == "tag"),
+            "years": {key: count for (field, key), count in rows if field == "year"}
+        }
+
+class SharedState:
+    """Paper changes and job progress shared by the worker processes, in SQLite.
+
+    Every write to the metadata index is logged as (seq, worker, paper, kind)
+    where kind is "metadata", "content" (new passages), "delete" or "reset"
+    (the collections were swapped by a reindex), and every write to the
+    folders as (seq, worker, folder, "folder"). Workers replay the paper
+    entries of the others to keep their in-memory indexes current, and the
+    change feed serves all of them to clients. Only the last
+    CHANGE_LOG_RETENTION entries are kept; a worker that falls further behind
+    reloads everything.
+    """
+
+    def __init__(self, path: str):
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS changes ("
+            "seq INTEGER PRIMARY KEY AUTOINCREMENT, worker TEXT NOT NULL, paper_id TEXT NOT NULL, kind TEXT NOT NULL)"
+        )
+        self.conn.execute("CREATE TABLE IF NOT EXISTS jobs (id TEXT PRIMARY KEY, job TEXT NOT NULL)")
+
+    def record_changes(self, changes: List[Tuple[str, str]]):
+        """Log (paper id, kind) changes made by this worker."""
+        if not changes:
+            return
+        with self.lock:
+            self.conn.execute("BEGIN")
+            try:
+                self.conn.executemany(
+                    "INSERT INTO changes (worker, paper_id, kind) VALUES (?, ?, ?)",
+                    [(WORKER_ID, paper_id, kind) for paper_id, kind in changes]
+                )
+                self.conn.execute(
+                    "DELETE FROM changes WHERE seq <= (SELECT MAX(seq) FROM changes) - ?", (CHANGE_LOG_RETENTION,)
+                )
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+
+    def latest_change(self) -> int:
+        with self.lock:
+            return self.conn.execute("SELECT COALESCE(MAX(seq), 0) FROM changes").fetchone()[0]
+
+    def changes_since(
+        self, seq: int, until: Optional[int] = None, limit: int = -1
+    ) -> Tuple[List[Tuple[int, str, str, str]], bool]:
+        """Entries after `seq` (up to `until`, at most `limit` of them), and
+        whether the log still covers everything since then."""
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT seq, worker, paper_id, kind FROM changes WHERE seq > ? AND seq <= ? ORDER BY seq LIMIT ?",
+                (seq, until if until is not None else sys.maxsize, limit)
+            ).fetchall()
+        complete = not rows or rows[0][0] == seq + 1
+        return rows, complete
+
+    def publish_job(self, job: Dict[str, Any]):
+        with self.lock:
+            self.conn.execute("INSERT OR REPLACE INTO jobs (id, job) VALUES (?, ?)", (job["id"], json.dumps(job)))
+
+    def get_job(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self.lock:
+            row = self.conn.execute("SELECT job FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def delete_jobs(self, job_ids: List[str]):
+        with self.lock:
+            self.conn.executemany("DELETE FROM jobs WHERE id = ?", [(job_id,) for job_id in job_ids])
+
+WORKER_ID = uuid.uuid4().hex
+shared_state = SharedState(SHARED_STATE_FILE)
+folder_store.shared = shared_state
+
+@contextmanager
+def write_file_lock():
+    """Exclusive lock on WRITE_LOCK_FILE, held by one worker process at a time."""
+    if fcntl is None:
+        yield
+        return
+    with open(WRITE_LOCK_FILE, "a") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+write_lock = asyncio.Lock()
+
+@asynccontextmanager
+async def paper_write_lock():
+    """Serialize writes that read papers before writing them, across worker processes.
+
+    The indexes are brought up to date with the other workers' changes once the
+    lock is held, so the read sees every earlier write.
+    """
+    async with write_lock:
+        file_lock = write_file_lock()
+        await asyncio.to_thread(file_lock.__enter__)
+        try:
+            await asyncio.to_thread(sync_worker_state)
+            yield
+        finally:
+            file_lock.__exit__(None, None, None)
+
+class PaperIndex:
+    """In-memory index of paper metadata.
+
+    Keeps every paper's metadata plus inverted indexes by tag, category, folder,
+    year and content hash. It is built from ChromaDB once and then updated
+    incrementally by every handler that writes papers, passing the count
+    changes on to its stats aggregates and logging the change for the other
+    workers, if it has those. Changes replayed from the other workers pass
+    `shared=False` since they were counted and logged where they were made.
+    Inverted indexes map to dicts (used as ordered sets) so results keep the
+    upload order. `generation` is bumped on every change so derived results,
+    like cached searches, can tell they are stale.
+    """
+
+    FIELDS = ("tag", "category", "folder_id", "year", "content_hash")
+
+    def __init__(self, aggregates: Optional[StatsAggregates] = None, shared: Optional[SharedState] = None):
+        self.lock = threading.RLock()
+        self.built = False
+        self.generation = 0
+        self.papers: Dict[str, Dict[str, Any]] = {}
+        self.inverted: Dict[str, Dict[Any, Dict[str, None]]] = {field: {} for field in self.FIELDS}
+        self.aggregates = aggregates
+        self.shared = shared
+        self.pending_counts: Optional[Counter] = None
+        self.pending_changes: List[Tuple[str, str]] = []
+
+    def build(self, source_collection, page_size: int = 10000):
+        """(Re)build the index by paging through a collection's metadata."""
+        with self.lock:
+            self.generation += 1
+            self.papers = {}
+            self.inverted = {field: {} for field in self.FIELDS}
+            offset = 0
+            while True:
+                results = source_collection.get(include=["metadatas"], limit=page_size, offset=offset)
+                for paper_id, metadata in zip(results["ids"], results["metadatas"]):
+                    self._add(paper_id, metadata, shared=False)
+                if len(results["ids"]) < page_size:
+                    break
+                offset += page_size
+            self.built = True
+
+    def attach(self, aggregates: StatsAggregates, shared: SharedState):
+        """Keep `aggregates` up to date and log changes from now on, recounting
+        the aggregates from this index."""
+        with self.lock:
+            self.aggregates = aggregates
+            self.shared = shared
+            aggregates.reconcile(self.papers.values())
+
+    @contextmanager
+    def batch(self):
+        """Apply the count changes of all writes in the block in one transaction,
+        and log their changes in another."""
+        with self.lock:
+            if self.pending_counts is not None:
+                yield
+                return
+            self.pending_counts = Counter()
+            try:
+                yield
+            finally:
+                pending, self.pending_counts = self.pending_counts, None
+                changes, self.pending_changes = self.pending_changes, []
+                if self.aggregates is not None:
+                    self.aggregates.apply(pending)
+                if self.shared is not None:
+                    self.shared.record_changes(changes)
+
+    def _share(self, paper_id: str, kind: str, metadata: Dict[str, Any], sign: int):
+        with self.batch():
+            if self.aggregates is not None:
+                for entry in StatsAggregates.entries(metadata):
+                    self.pending_counts[entry] += sign
+            if kind:
+                self.pending_changes.append((paper_id, kind))
+
+    def ensure_built(self):
+        if not self.built:
+            self.build(collection)
+
+    @staticmethod
+    def _keys(metadata: Dict[str, Any]) -> Dict[str, List[Any]]:
+        year = metadata.get("year")
+        category = metadata.get("category")
+        return {
+            "tag": list(dict.fromkeys(parse_tags(metadata.get("tags", "[]")))),
+            "category": [category] if category else [],
+            "folder_id": [metadata.get("folder_id")],
+            "year": [year] if year else [],
+            "content_hash": [metadata["content_hash"]] if metadata.get("content_hash") else []
+        }
+
+    def _index_keys(self, paper_id: str, metadata: Dict[str, Any]):
+        for field, keys in self._keys(metadata).items():
+            for key in keys:
+                self.inverted[field].setdefault(key, {})[paper_id] = None
+
+    def _unindex_keys(self, paper_id: str, metadata: Dict[str, Any]):
+        for field, keys in self._keys(metadata).items():
+            for key in keys:
+                ids = self.inverted[field].get(key)
+                if ids is not None:
+                    ids.pop(paper_id, None)
+                    if not ids:
+                        del self.inverted[field][key]
+
+    def _add(self, paper_id: str, metadata: Dict[str, Any], shared: bool = True):
+        previous = self.papers.get(paper_id)
+        # Tag flags are only there for ChromaDB filters, clients read the tags field.
+        metadata = {key: value for key, value in metadata.items() if not key.startswith(TAG_KEY_PREFIX)}
+        if shared:
+            content_changed = previous is None or any(
+                previous.get(field) != metadata.get(field) for field in ("content_hash", "passage_count")
+            )
+            if previous is not None:
+                self._share(paper_id, "", previous, -1)
+            self._share(paper_id, "content" if content_changed else "metadata", metadata, 1)
+        if previous is not None:
+            self._unindex_keys(paper_id, previous)
+        # Assigning an existing key keeps the paper's position in the listing order
+        self.papers[paper_id] = metadata
+        self._index_keys(paper_id, metadata)
+
+    def upsert(self, paper_id: str, metadata: Dict[str, Any], shared: bool = True):
+        with self.lock:
+            self._add(paper_id, metadata, shared)
+            self.generation += 1
+
+    def remove(self, paper_id: str, shared: bool = True):
+        with self.lock:
+            self.generation += 1
+            metadata = self.papers.pop(paper_id, None)
+            if metadata is not None:
+                self._unindex_keys(paper_id, metadata)
+                if shared:
+                    self._share(paper_id, "delete", metadata, -1)
+
+    def get(self, paper_id: str) -> Optional[Dict[str, Any]]:
+        with self.lock:
+            return self.papers.get(paper_id)
+
+    def __contains__(self, paper_id: str) -> bool:
+        return paper_id in self.papers
+
+    def all(self) -> List[Dict[str, Any]]:
+        with self.lock:
+            return list(self.papers.values())
+
+    def find(self, field: str, key: Any, exclude_trash: bool = False) -> List[Dict[str, Any]]:
+        """Metadata of every paper whose `field` matches `key`."""
+        with self.lock:
+            papers = [self.papers[paper_id] for paper_id in self.inverted[field].get(key, {})]
+        if exclude_trash:
+            papers = [paper for paper in papers if paper.get("folder_id") != "trash"]
+        return papers
+
+    def candidates(
+        self,
+        folder_id: Optional[str] = None,
+        category: Optional[str] = None,
+        tags: Optional[List[str]] = None
+    ) -> Optional[List[str]]:
+        """Ids of the papers that can match a folder, category or tags constraint,
+        from the narrowest of those indexes, or None if there is no such constraint."""
+        with self.lock:
+            options = []
+            if folder_id:
+                options.append(list(self.inverted["folder_id"].get(folder_id, {})))
+            if category:
+                options.append(list(self.inverted["category"].get(category, {})))
+            if tags:
+                options.append(list(dict.fromkeys(
+                    paper_id for tag in tags for paper_id in self.inverted["tag"].get(tag, {})
+                )))
+            return min(options, key=len) if options else None
+
+    def find_duplicate(self, content_hash: str) -> Optional[str]:
+        """Filename of a paper outside the trash with the given content hash."""
+        duplicates = self.find("content_hash", content_hash, exclude_trash=True)
+        return duplicates[0]["filename"] if duplicates else None
+
+stats_aggregates = StatsAggregates(STATS_FILE)
+paper_index = PaperIndex(stats_aggregates, shared_state)
+
+def get_paper_index() -> PaperIndex:
+    """Return the metadata index, building it on first use."""
+    paper_index.ensure_built()
+    return paper_index
+
+# Last entry of the shared change log reflected in this worker's indexes
+synced_change = 0
+sync_lock = threading.Lock()
+
+def backfill_passages(batch_size: int = 500):
+    """Give papers indexed before passages existed a passage made of their
+    paper record (its text and embedding), so searches find them. A reindex
+    later splits their full text into passages. Runs under the write lock."""
+    legacy = [paper_id for paper_id, metadata in paper_index.papers.items() if "passage_count" not in metadata]
+    if not legacy:
+        return
+    print(f"Adding passages for {len(legacy)} papers indexed before passages existed")
+    for start in range(0, len(legacy), batch_size):
+        chunk = legacy[start:start + batch_size]
+        results = collection.get(ids=chunk, include=["documents", "metadatas", "embeddings"])
+        ids, documents, embeddings, metadatas = [], [], [], []
+        for paper_id, document, metadata, embedding in zip(
+            results["ids"], results["documents"], results["metadatas"], results["embeddings"]
+        ):
+            records = passage_records(paper_id, 0, 1, metadata)
+            ids.extend(records["ids"])
+            metadatas.extend(records["metadatas"])
+            documents.append(document or "")
+            embeddings.append(embedding)
+        if not ids:
+            continue
+        passages.upsert(ids=ids, documents=documents, embeddings=embeddings, metadatas=metadatas)
+        collection.update(ids=results["ids"], metadatas=[{"passage_count": 1}] * len(results["ids"]))
+        with paper_index.batch():
+            for paper_id, metadata in zip(results["ids"], results["metadatas"]):
+                paper_index.upsert(paper_id, {**metadata, "passage_count": 1})
+
+def build_worker_state():
+    """Build the metadata, lexical and near-duplicate indexes of this worker."""
+    global synced_change
+    # Paper records and their counts only change under the write lock, so
+    # under it the stored counts can be checked against the papers
+    with write_file_lock():
+        paper_index.ensure_built()
+        backfill_passages()
+        stats_aggregates.load()
+        stats_aggregates.reconcile(paper_index.all())
+        if vector_store is not None and len(vector_store) != passages.count():
+            # New, or out of step with the passages after a crash
+            print(f"Building the {VECTOR_STORE} vector store from the passages collection")
+            vector_store.build(passages)
+            shared_state.record_changes([("", "reset")])
+        synced_change = shared_state.latest_change()
+    lexical_index.ensure_built()
+    near_duplicate_index.ensure_loaded()
+
+def reload_worker_state():
+    """Reopen the live collections and rebuild this worker's indexes from them,
+    after a reindex swapped the collections or too many changes were missed."""
+    global collection, passages, paper_index, lexical_index, vector_store, EMBEDDING_MODEL
+    active = load_active_collections()
+    new_collection, new_passages = open_collections(active)
+    new_vector_store = open_vector_store(new_passages.name)
+    if new_vector_store is not None:
+        new_vector_store.ensure_loaded()
+    new_index = PaperIndex(stats_aggregates, shared_state)
+    new_index.build(new_collection)
+    new_lexical_index = LexicalIndex()
+    new_lexical_index.build(new_passages)
+    new_index.generation = paper_index.generation + 1  # Invalidates cached searches
+    collection, passages = new_collection, new_passages
+    paper_index, lexical_index, vector_store = new_index, new_lexical_index, new_vector_store
+    EMBEDDING_MODEL = active["embedding_model"]
+    remember_embedding_dimensions(active)
+    near_duplicate_index.refresh()
+    stats_aggregates.load()
+
+def apply_worker_changes(changes: List[Tuple[str, str]], batch_size: int = 500):
+    """Re-read the papers other workers changed into this worker's indexes."""
+    paper_ids = list(dict.fromkeys(paper_id for paper_id, _ in changes))
+    content_ids = {paper_id for paper_id, kind in changes if kind == "content"}
+    for start in range(0, len(paper_ids), batch_size):
+        chunk = paper_ids[start:start + batch_size]
+        results = collection.get(ids=chunk, include=["metadatas"])
+        current = dict(zip(results["ids"], results["metadatas"]))
+        for paper_id in chunk:
+            if paper_id in current:
+                paper_index.upsert(paper_id, current[paper_id], shared=False)
+            else:
+                paper_index.remove(paper_id, shared=False)
+                lexical_index.remove_paper(paper_id)
+        near_duplicate_index.forget([paper_id for paper_id in chunk if paper_id not in current])
+
+        reread = [paper_id for paper_id in chunk if paper_id in current and paper_id in content_ids]
+        if reread:
+            for paper_id in reread:
+                lexical_index.remove_paper(paper_id)
+            results = passages.get(where={"paper_id": {"$in": reread}}, include=["documents"])
+            lexical_index.add(results["ids"], results["documents"])
+        if vector_store is not None:
+            vector_store.reload_papers([
+                paper_id for paper_id in chunk if paper_id not in current or paper_id in content_ids
+            ])
+    if vector_store is not None:
+        vector_store.refresh()
+    near_duplicate_index.refresh()
+    stats_aggregates.load()
+
+def sync_worker_state():
+    """Apply the paper changes other worker processes logged since the last sync."""
+    global synced_change
+    with sync_lock:
+        rows, complete = shared_state.changes_since(synced_change)
+        if not rows:
+            return
+        changes = [
+            (paper_id, kind) for _, worker, paper_id, kind in rows if worker != WORKER_ID and kind != "folder"
+        ]
+        if not complete or any(kind == "reset" for _, kind in changes):
+            reload_worker_state()
+        elif changes:
+            apply_worker_changes(changes)
+        synced_change = rows[-1][0]
+
+# Startup runs in the background (see lifespan): /healthz answers at once,
+# /readyz once the indexes are built and warm. Other requests wait for the
+# indexes, up to STARTUP_WAIT_TIMEOUT seconds, and then get a 503.
+STARTUP_WAIT_TIMEOUT = float(os.getenv("STARTUP_WAIT_TIMEOUT", "120"))
+STARTUP_RETRY_DELAY = 5
+UNGATED_PATHS = ("/", "/healthz", "/readyz", "/metrics")
+
+startup_status: Dict[str, Any] = {"status": "starting", "error": None, "seconds": None}
+# Set once build_worker_state has run. Created by the lifespan, in its event loop
+worker_built: Optional[asyncio.Event] = None
+warmup_task: Optional[asyncio.Task] = None
+related_task: Optional[asyncio.Task] = None
+
+async def warm_up():
+    global related_task
+    started = time.perf_counter()
+    while True:
+        try:
+            await asyncio.to_thread(build_worker_state)
+            break
+        except Exception as e:
+            startup_status["error"] = str(e)
+            print(f"Warning: Building the indexes failed ({str(e)}), retrying in {STARTUP_RETRY_DELAY}s")
+            await asyncio.sleep(STARTUP_RETRY_DELAY)
+    worker_built.set()
+    startup_status.update(status="warming", error=None)
+    related_task = asyncio.create_task(update_related_papers())
+    try:
+        await asyncio.to_thread(warm_caches)
+    except Exception as e:
+        # Only costs the first requests some latency
+        print(f"Warning: Warming the caches failed: {str(e)}")
+    startup_status.update(status="ready", seconds=round(time.perf_counter() - started, 3))
+
+def warm_caches():
+    """Load what the first requests would otherwise wait for: the HNSW indexes
+    of the collections, the embedding model and index.html."""
+    for source in (collection, passages):
+        sample = source.get(limit=1, include=["embeddings"])
+        if sample["ids"]:
+            source.query(query_embeddings=sample["embeddings"], n_results=1, include=[])
+    get_embedding_provider().load()
+    read_index_html()
+
+def is_gated(path: str) -> bool:
+    return path not in UNGATED_PATHS and not path.startswith("/static/")
+
+@app.get("/healthz")
+async def healthz():
+    """Liveness: the process is up and answering."""
+    return {"status": "ok"}
+
+@app.get("/readyz")
+async def readyz():
+    """Readiness: 200 once this worker's indexes are built and warm, 503 until then."""
+    if startup_status["status"] != "ready":
+        return JSONResponse(status_code=503, content=startup_status)
+    return startup_status
+
+async def update_related_papers():
+    """Keep the related-papers graph up to date, in the worker holding RELATED_LOCK_FILE."""
+    lock_file = None
+    while True:
+        if lock_file is None:
+            lock_file = try_lock_file(RELATED_LOCK_FILE)
+        if lock_file is not None:
+            try:
+                # The graph must follow this worker's collection, after any reindex swap
+                await asyncio.to_thread(sync_worker_state)
+                await asyncio.to_thread(related_papers.update, collection, shared_state)
+            except Exception as e:
+                print(f"Warning: Updating related papers failed: {str(e)}")
+        await asyncio.sleep(RELATED_UPDATE_INTERVAL)
+
+# A single worker only has to pick up writes of other processes (a reindex
+# from the command line, or workers started without WEB_CONCURRENCY), so it
+# checks the change log at most every WORKER_SYNC_INTERVAL seconds instead of
+# on every request.
+WORKER_SYNC_INTERVAL = float(os.getenv("WORKER_SYNC_INTERVAL", "1"))
+last_sync_check = 0.0
+
+@app.middleware("http")
+async def sync_with_other_workers(request: Request, call_next):
+    """Hold requests until this worker's indexes are built, then bring them up
+    to date with the writes of the other workers."""
+    global last_sync_check
+    if worker_built is not None and not worker_built.is_set():
+        if not is_gated(request.url.path):
+            return await call_next(request)
+        try:
+            await asyncio.wait_for(worker_built.wait(), STARTUP_WAIT_TIMEOUT)
+        except asyncio.TimeoutError:
+            return JSONResponse(status_code=503, content={"detail": "The server is still starting"})
+    if WEB_CONCURRENCY == 1:
+        now = time.monotonic()
+        if now - last_sync_check < WORKER_SYNC_INTERVAL:
+            return await call_next(request)
+        last_sync_check = now
+    if await asyncio.to_thread(shared_state.latest_change) > synced_change:
+        await asyncio.to_thread(sync_worker_state)
+    return await call_next(request)
+
+# Change feed: clients keep a copy of the papers and folders they show and
+# apply the changes logged since the version they have, from GET /changes or
+# pushed by the /changes/stream event stream. The stream checks for new
+# changes every CHANGE_STREAM_INTERVAL seconds.
+CHANGE_STREAM_INTERVAL = float(os.getenv("CHANGE_STREAM_INTERVAL", "0.5"))
+CHANGE_STREAM_HEARTBEAT = 15
+
+def change_feed(since: Optional[int], limit: int = 1000, fields: Optional[List[str]] = None) -> Dict[str, Any]:
+    """The papers and folders changed after version `since`, each once with its
+    current state (None once deleted). `reset` asks the client to reload
+    everything: the log no longer reaches back to `since`, or a reindex
+    swapped the collections."""
+    # Changes up to synced_change are in this worker's indexes
+    sync_worker_state()
+    version = synced_change
+    if since is None:
+        return {"version": version, "reset": False, "more": False, "changes": []}
+    rows, complete = shared_state.changes_since(since, version, limit)
+    if since > version or not complete or any(kind == "reset" for _, _, _, kind in rows):
+        return {"version": version, "reset": True, "more": False, "changes": []}
+    if not rows:
+        return {"version": since, "reset": False, "more": False, "changes": []}
+
+    latest: Dict[Tuple[str, str], int] = {}
+    for seq, _, item_id, kind in rows:
+        key = ("folder" if kind == "folder" else "paper", item_id)
+        latest.pop(key, None)
+        latest[key] = seq
+    folders = {}
+    if any(kind == "folder" for kind, _ in latest):
+        folders = {folder["id"]: folder for folder in folder_store.load()["folders"]}
+    index = get_paper_index()
+    changes = []
+    for (kind, item_id), seq in latest.items():
+        if kind == "folder":
+            changes.append({"version": seq, "type": "folder", "id": item_id, "folder": folders.get(item_id)})
+        else:
+            paper = index.get(item_id)
+            if paper is not None and fields:
+                paper = project_paper(paper, fields)
+            changes.append({"version": seq, "type": "paper", "id": item_id, "paper": paper})
+    return {"version": rows[-1][0], "reset": False, "more": rows[-1][0] < version, "changes": changes}
+
+def parse_fields(fields: Optional[str]) -> Optional[List[str]]:
+    return [field.strip() for field in fields.split(",") if field.strip()] if fields else None
+
+@app.get("/changes")
+async def get_changes(
+    since: Optional[int] = Query(None, ge=0, description="Version the client has; omit to get the current one"),
+    limit: int = Query(1000, ge=1, le=10000),
+    fields: Optional[str] = Query(None, description="Comma separated paper metadata fields to return")
+):
+    """Papers and folders changed since a version of the library."""
+    return await asyncio.to_thread(change_feed, since, limit, parse_fields(fields))
+
+@app.get("/changes/stream")
+async def stream_changes(
+    request: Request,
+    since: Optional[int] = Query(None, ge=0),
+    fields: Optional[str] = Query(None, description="Comma separated paper metadata fields to return")
+):
+    """The change feed as Server-Sent Events. Each `changes` event carries a
+    /changes response and has its version as id, so a reconnecting EventSource
+    resumes where it left off."""
+    last_event_id = request.headers.get("last-event-id", "")
+    if last_event_id.isdigit():
+        since = int(last_event_id)
+    paper_fields = parse_fields(fields)
+
+    async def events():
+        version = since
+        yield f"retry: {int(CHANGE_STREAM_INTERVAL * 4000)}\n\n"
+        if version is None:
+            feed = await asyncio.to_thread(change_feed, None)
+            version = feed["version"]
+            yield f"id: {version}\nevent: changes\ndata: {json.dumps(feed)}\n\n"
+        idle = 0.0
+        while not await request.is_disconnected():
+            if shared_state.latest_change() > version:
+                feed = await asyncio.to_thread(change_feed, version, 1000, paper_fields)
+                if feed["changes"] or feed["reset"]:
+                    yield f"id: {feed['version']}\nevent: changes\ndata: {json.dumps(feed)}\n\n"
+                    idle = 0.0
+                version = feed["version"]
+                if feed["more"]:
+                    continue
+            await asyncio.sleep(CHANGE_STREAM_INTERVAL)
+            idle += CHANGE_STREAM_INTERVAL
+            if idle >= CHANGE_STREAM_HEARTBEAT:
+                yield ": keep-alive\n\n"
+                idle = 0.0
+
+    return StreamingResponse(
+        events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+def save_paper_metadata(updates: Dict[str, Dict[str, Any]], batch_size: int = 5000):
+    """Write changed metadata of papers to ChromaDB and the metadata index.
+
+    `updates` maps filenames to changed metadata, which is merged into the
+    stored metadata the same way ChromaDB merges it. Each paper's passages get
+    the paper's new filterable fields so filtered searches stay in sync.
+    """
+    index = get_paper_index()
+    paper_metadatas, passage_ids, passage_metadatas, merged_metadatas = [], [], [], {}
+    for filename, metadata in updates.items():
+        previous = index.get(filename) or {}
+        merged = {**previous, **metadata}
+        paper_metadatas.append({
+            **metadata,
+            **tag_flags(parse_tags(merged.get("tags", "[]")), parse_tags(previous.get("tags", "[]")))
+        })
+        merged_metadatas[filename] = merged
+
+        fields = filter_fields(merged, previous)
+        passage_count = int(merged.get("passage_count") or 0)
+        passage_ids.extend(passage_id(filename, i) for i in range(passage_count))
+        passage_metadatas.extend([fields] * passage_count)
+
+    filenames = list(updates)
+    for start in range(0, len(filenames), batch_size):
+        collection.update(
+            ids=filenames[start:start + batch_size],
+            metadatas=paper_metadatas[start:start + batch_size]
+        )
+    for start in range(0, len(passage_ids), batch_size):
+        passages.update(
+            ids=passage_ids[start:start + batch_size],
+            metadatas=passage_metadatas[start:start + batch_size]
+        )
+    with index.batch():
+        for filename, merged in merged_metadatas.items():
+            index.upsert(filename, merged)
+
+def folder_move_updates(metadatas: Dict[str, Dict[str, Any]], folder_id: str) -> Dict[str, Dict[str, Any]]:
+    """Metadata changes moving papers to a folder. Papers moved to the trash
+    remember their original folder so they can be restored."""
+    updates = {}
+    for filename, metadata in metadatas.items():
+        update = {"folder_id": folder_id}
+        if folder_id == "trash" and metadata.get("folder_id") != "trash":
+            update["original_folder_id"] = metadata.get("folder_id")
+        updates[filename] = update
+    return updates
+
+def hard_delete_papers(filenames: List[str], batch_size: int = 500):
+    """Permanently delete papers, their passages and their files."""
+    for start in range(0, len(filenames), batch_size):
+        chunk = filenames[start:start + batch_size]
+        collection.delete(ids=chunk)
+        passages.delete(where={"paper_id": {"$in": chunk}})
+        if vector_store is not None:
+            vector_store.remove_papers(chunk)
+    near_duplicate_index.remove(filenames)
+    with paper_index.batch():
+        for filename in filenames:
+            paper_index.remove(filename)
+    for filename in filenames:
+        lexical_index.remove_paper(filename)
+        delete_thumbnails(filename)
+        file_path = os.path.join(UPLOAD_DIR, filename)
+        if os.path.exists(file_path):
+            os.remove(file_path)
+
+# The main page, read again only when index.html changes
+index_html: Optional[Tuple[Tuple[float, int], str]] = None
+
+def read_index_html() -> str:
+    global index_html
+    stat = os.stat("index.html")
+    stamp = (stat.st_mtime, stat.st_size)
+    if index_html is None or index_html[0] != stamp:
+        with open("index.html", "r") as f:
+            index_html = (stamp, f.read())
+    return index_html[1]
+
+# Serve the main index.html page
+@app.get("/", response_class=HTMLResponse)
+async def read_root():
+    """Serve the main HTML page"""
+    return HTMLResponse(content=read_index_html())
+
+class AppFiles(StaticFiles):
+    """The files of the app directory, except DATA_DIR and hidden files like .env."""
+
+    def lookup_path(self, path: str):
+        full_path, stat = super().lookup_path(path)
+        data_dir = os.path.realpath(DATA_DIR)
+        if stat is not None and (
+            os.path.commonpath([full_path, data_dir]) == data_dir
+            or any(part.startswith(".") for part in path.split(os.sep))
+        ):
+            return "", None
+        return full_path, stat
+
+# Serve static files (JavaScript, CSS)
+app.mount("/static", AppFiles(directory="."), name="static")
+
+class ListParams:
+    """Pagination, sorting and field projection shared by the paper listing endpoints."""
+
+    SORT_FIELDS = ("upload_date", "year", "title")
+
+    def __init__(
+        self,
+        offset: int = Query(0, ge=0),
+        limit: Optional[int] = Query(None, ge=1, le=1000),
+        sort: Optional[str] = Query(None, description="One of upload_date, year, title"),
+        order: str = Query("asc", description="asc or desc"),
+        fields: Optional[str] = Query(None, description="Comma separated metadata fields to return")
+    ):
+        if sort is not None and sort not in self.SORT_FIELDS:
+            raise HTTPException(status_code=400, detail=f"sort must be one of {', '.join(self.SORT_FIELDS)}")
+        if order not in ("asc", "desc"):
+            raise HTTPException(status_code=400, detail="order must be asc or desc")
+        self.offset = offset
+        self.limit = limit
+        self.sort = sort
+        self.order = order
+        self.fields = parse_fields(fields)
+
+def sort_value(paper: Dict[str, Any], field: str):
+    """Comparable value of a metadata field, or None if the paper doesn't have one."""
+    value = paper.get(field)
+    if value is None or value == "":
+        return None
+    if field == "title":
+        return str(value).casefold()
+    if field == "year":
+        try:
+            return int(value)
+        except (TypeError, ValueError):
+            return None
+    return str(value)
+
+def project_paper(paper: Dict[str, Any], fields: List[str]) -> Dict[str, Any]:
+    # filename identifies the paper, so always include it
+    fields = ["filename"] + [field for field in fields if field != "filename"]
+    return {field: paper[field] for field in fields if field in paper}
+
+def paginate_papers(papers: List[Dict[str, Any]], params: ListParams) -> Dict[str, Any]:
+    """Sort, slice and project a list of paper metadata into a listing response."""
+    if params.sort:
+        # Papers missing the sort field always go last
+        keyed = [(sort_value(paper, params.sort), paper) for paper in papers]
+        present = [item for item in keyed if item[0] is not None]
+        present.sort(key=lambda item: item[0], reverse=params.order == "desc")
+        papers = [paper for _, paper in present] + [paper for value, paper in keyed if value is None]
+    elif params.order == "desc":
+        papers = papers[::-1]
+
+    total = len(papers)
+    end = total if params.limit is None else params.offset + params.limit
+    page = papers[params.offset:end]
+
+    if params.fields:
+        page = [project_paper(paper, params.fields) for paper in page]
+
+    return {
+        "papers": page,
+        "total": total,
+        "offset": params.offset,
+        "limit": params.limit,
+        "next_offset": end if end < total else None
+    }
+
+@app.get("/stats")
+async def get_stats(folder_id: Optional[str] = None, exclude_trash: bool = False):
+    """Get statistics about the paper collection, the papers outside the trash or one folder"""
+    try:
+        get_paper_index()
+        if folder_id:
+            return stats_aggregates.stats(StatsAggregates.folder_scope(folder_id))
+        return stats_aggregates.stats(StatsAggregates.LIBRARY if exclude_trash else StatsAggregates.ALL)
+    except Exception as e:
+        # Return empty stats if there's an error or empty collection
+        print(f"Error in get_stats: {str(e)}")
+        return {
+            "total_papers": 0,
+            "categories": {},
+            "tags": [],
+            "years": {}
+        }
+
+@app.get("/papers/by-tag/{tag}")
+async def get_papers_by_tag(tag: str, params: ListParams = Depends()):
+    """Get papers with specific tag"""
+    try:
+        # Skip papers that are in the trash folder
+        papers = get_paper_index().find("tag", tag, exclude_trash=True)
+    except Exception as e:
+        print(f"Error in get_papers_by_tag: {str(e)}")
+        papers = []
+    return paginate_papers(papers, params)
+
+@app.get("/papers/by-category/{category}")
+async def get_papers_by_category(category: str, params: ListParams = Depends()):
+    """Get papers in specific category"""
+    try:
+        papers = get_paper_index().find("category", category, exclude_trash=True)
+    except Exception:
+        papers = []
+    return paginate_papers(papers, params)
+
+def build_paper_metadata(
+    metadata_dict: Dict[str, Any],
+    filename: str,
+    folder_id: Optional[str],
+    content_hash: str = ""
+) -> Dict[str, Any]:
+    """Convert user supplied metadata into the flat form stored in ChromaDB."""
+    # Prepare sanitized metadata for ChromaDB
+    sanitized_metadata = {
+        "filename": filename,  # Store the new filename
+        "upload_date": str(datetime.now()),
+        "title": metadata_dict.get('title', filename),
+        "authors": metadata_dict.get('authors', ""),
+        "content_hash": content_hash,
+        "embedding_model": EMBEDDING_MODEL,
+        "extractor_version": EXTRACTOR_VERSION
+    }
+    
+    # Add folder_id to metadata, defaulting to 'default'
+    sanitized_metadata["folder_id"] = folder_id
+    
+    # Handle keywords (convert list to JSON string if needed)
+    keywords = metadata_dict.get('keywords', [])
+    if isinstance(keywords, list):
+        sanitized_metadata["keywords"] = json.dumps(keywords)
+    else:
+        sanitized_metadata["keywords"] = "[]"
+        
+    # Handle tags (convert list to JSON string if needed)
+    tags = metadata_dict.get('tags', [])
+    if isinstance(tags, list):
+        sanitized_metadata["tags"] = json.dumps(tags)
+        sanitized_metadata.update(tag_flags(tags))
+    else:
+        sanitized_metadata["tags"] = "[]"
+    
+    # Handle abstract
+    sanitized_metadata["abstract"] = metadata_dict.get('abstract', "")
+    
+    # Handle year field (must be int or str, not None)
+    year = metadata_dict.get('year')
+    if year is not None:
+        sanitized_metadata["year"] = year
+    
+    # Handle category field (must be str, not None)
+    category = metadata_dict.get('category')
+    if category is not None and category != "":
+        sanitized_metadata["category"] = category
+
+    return sanitized_metadata
+
+async def check_file_exists(filename: str) -> bool:
+    """Check if a file with the given filename exists in any folder."""
+    try:
+        return filename in get_paper_index()
+    except Exception:
+        return False
+
+@app.post("/papers/")
+async def upload_paper(
+    file: UploadFile = File(...),
+    metadata: Optional[str] = Form(None),
+    folder_id: Optional[str] = Form('default'),  # Default to 'default' folder
+    override: bool = Form(False)  # New parameter to handle overrides
+):
+    """Upload a research paper and store its embedding."""
+    if not file.filename.endswith('.pdf'):
+        raise HTTPException(status_code=400, detail="Only PDF files are accepted")
+    
+    # Validate folder if specified
+    if folder_id:
+        if not await asyncio.to_thread(folder_store.exists, folder_id):
+            raise HTTPException(status_code=404, detail="Folder not found")
+    
+    # Parse metadata
+    try:
+        metadata_dict = json.loads(metadata) if metadata else {}
+        if not metadata_dict.get('title'):
+            metadata_dict['title'] = os.path.splitext(file.filename)[0]  # Use original filename without extension as title
+    except json.JSONDecodeError:
+        metadata_dict = {'title': os.path.splitext(file.filename)[0]}
+    
+    # Stream the upload to disk, hashing it as it arrives
+    with stage_timer("upload_receive"):
+        temp_path, content_hash = await receive_upload(file, UPLOAD_DIR)
+    
+    # Identical content is already in the library: reuse it instead of parsing and embedding again
+    duplicate = get_paper_index().find_duplicate(content_hash)
+    if duplicate and not override:
+        os.remove(temp_path)
+        return {"message": "Paper already exists", "filename": duplicate, "duplicate": True}
+    
+    # Create a sanitized filename from the title
+    original_ext = os.path.splitext(file.filename)[1].lower()
+    sanitized_filename = sanitize_filename(metadata_dict['title'], original_ext)
+    
+    # Check if file exists
+    if await check_file_exists(sanitized_filename):
+        if not override:
+            os.remove(temp_path)
+            raise HTTPException(
+                status_code=409,  # Conflict
+                detail={
+                    "message": "File with this name already exists",
+                    "filename": sanitized_filename,
+                    "requires_override": True
+                }
+            )
+        # If override is True, we'll continue and replace the existing file
+    else:
+        # If file doesn't exist, ensure unique filename
+        sanitized_filename = ensure_unique_filename(sanitized_filename, UPLOAD_DIR)
+    
+    # Move the received file into place under the new filename
+    file_path = os.path.join(UPLOAD_DIR, sanitized_filename)
+    os.replace(temp_path, file_path)
+    
+    # Extract and chunk the text once, spooling the passages to disk while
+    # computing the MinHash signature used for near-duplicate detection
+    spool = tempfile.TemporaryFile("w+", encoding="utf-8", newline="\n")
+    try:
+        with stage_timer("pdf_extract"):
+            signature = await asyncio.to_thread(spool_passages, file_path, spool)
+        near_duplicate = None
+        if signature is not None:
+            if override:
+                await asyncio.to_thread(near_duplicate_index.add, sanitized_filename, signature)
+            else:
+                async with paper_write_lock():
+                    near_duplicate = await asyncio.to_thread(near_duplicate_index.claim, sanitized_filename, signature)
+    except Exception as e:
+        spool.close()
+        os.remove(file_path)
+        raise HTTPException(status_code=500, detail=str(e))
+    
+    if near_duplicate:
+        spool.close()
+        os.remove(file_path)
+        raise HTTPException(
+            status_code=409,
+            detail={
+                "message": "A near-duplicate of this paper already exists",
+                "filename": near_duplicate[0],
+                "similarity": round(near_duplicate[1], 3),
+                "near_duplicate": True,
+                "requires_override": True
+            }
+        )
+    
+    # Generate embeddings
+    try:
+        sanitized_metadata = build_paper_metadata(metadata_dict, sanitized_filename, folder_id, content_hash)
+
+        # Delete existing document and its passages if overriding
+        if override:
+            try:
+                async with paper_write_lock():
+                    await asyncio.to_thread(collection.delete, ids=[sanitized_filename])
+                    await asyncio.to_thread(delete_passages, sanitized_filename)
+                    paper_index.remove(sanitized_filename)
+            except Exception:
+                pass
+        
+        # Store the spooled passages plus the paper record
+        await index_paper(
+            sanitized_filename,  # Use the new filename as ID
+            sanitized_metadata,
+            spool
+        )
+        return {"message": "Paper uploaded successfully", "filename": sanitized_filename}
+    except Exception as e:
+        # Clean up file if processing fails
+        if os.path.exists(file_path):
+            os.remove(file_path)
+        near_duplicate_index.remove([sanitized_filename])
+        raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        spool.close()
+
+# Bulk ingestion jobs, kept in memory and reported through /jobs/{job_id}
+ingest_jobs: Dict[str, Dict[str, Any]] = {}
+ingest_tasks = set()
+
+class IngestWriter:
+    """Buffer parsed and embedded papers and write them to ChromaDB in batches."""
+
+    def __init__(self, job: Dict[str, Any], batch_size: int = INGEST_ADD_BATCH_SIZE):
+        self.job = job
+        self.batch_size = batch_size
+        self.lock = asyncio.Lock()
+        self.papers = []
+
+    async def add(
+        self,
+        filename: str,
+        metadata: Dict[str, Any],
+        texts: List[str],
+        embeddings: List[List[float]],
+        model: str
+    ):
+        async with self.lock:
+            self.papers.append((filename, metadata, texts, embeddings, model))
+            if len(self.papers) >= self.batch_size:
+                await self._flush()
+
+    async def flush(self):
+        async with self.lock:
+            await self._flush()
+
+    async def _flush(self):
+        papers, self.papers = self.papers, []
+        if not papers:
+            return
+        filenames = [filename for filename, _, _, _, _ in papers]
+
+        # Written to one generation of the library; a reindex swapping in new
+        # collections meanwhile means writing the batch again to those
+        while True:
+            library = live_library()
+            library_passages, library_lexical_index, library_vector_store, model = library[1:]
+            try:
+                # Papers embedded before a reindex switched models are embedded again
+                for i, (filename, metadata, texts, embeddings, embedded_with) in enumerate(papers):
+                    if embedded_with != model:
+                        papers[i] = (filename, metadata, texts, await get_embeddings(texts, model), model)
+
+                passage_ids, passage_docs, passage_embeddings, passage_metadatas = [], [], [], []
+                for filename, metadata, texts, embeddings, _ in papers:
+                    records = passage_records(filename, 0, len(texts), metadata)
+                    passage_ids.extend(records["ids"])
+                    passage_metadatas.extend(records["metadatas"])
+                    passage_docs.extend(texts)
+                    passage_embeddings.extend(embeddings)
+                    metadata["passage_count"] = len(texts)
+
+                await asyncio.to_thread(
+                    library_passages.add,
+                    ids=passage_ids,
+                    documents=passage_docs,
+                    embeddings=passage_embeddings,
+                    metadatas=passage_metadatas
+                )
+                await asyncio.to_thread(library_lexical_index.add, passage_ids, passage_docs)
+                if library_vector_store is not None:
+                    await asyncio.to_thread(library_vector_store.add, passage_ids, passage_embeddings)
+                # Paper records and their counts are written together, see build_worker_state
+                async with paper_write_lock():
+                    if collection is library[0]:
+                        await asyncio.to_thread(
+                            collection.add,
+                            ids=filenames,
+                            documents=[texts[0] for _, _, texts, _, _ in papers],
+                            embeddings=[mean_embedding(embeddings) for _, _, _, embeddings, _ in papers],
+                            metadatas=[metadata for _, metadata, _, _, _ in papers]
+                        )
+                        with paper_index.batch():
+                            for filename, metadata, _, _, _ in papers:
+                                paper_index.upsert(filename, metadata)
+                        break
+            except Exception as e:
+                await asyncio.to_thread(discard_library_passages, filenames, library)
+                # Writes to the old collections fail once another worker's reindex deleted them
+                await asyncio.to_thread(sync_worker_state)
+                if collection is not library[0]:
+                    continue
+                for filename in filenames:
+                    discard_ingested_file(filename)
+                    record_job_result(self.job, filename, "failed", str(e))
+                return
+            await asyncio.to_thread(discard_library_passages, filenames, library)
+
+        for filename in filenames:
+            record_job_result(self.job, filename, "succeeded")
+
+def discard_ingested_file(filename: str):
+    """Remove a paper file whose ingestion failed, along with its signature."""
+    file_path = os.path.join(UPLOAD_DIR, filename)
+    if os.path.exists(file_path):
+        os.remove(file_path)
+    near_duplicate_index.remove([filename])
+
+def record_job_result(job: Dict[str, Any], filename: str, status: str, error: Optional[str] = None):
+    """Record the outcome of one file of a bulk ingestion job."""
+    job["processed"] += 1
+    job[status] += 1
+    result = {"filename": filename, "status": status}
+    if error:
+        result["error"] = error
+    job["results"].append(result)
+    publish_job(job)
+
+# When each job of this worker was last published
+job_published_at: Dict[str, float] = {}
+
+def publish_job(job: Dict[str, Any], force: bool = False):
+    """Share a job's progress with the other workers, so any of them can answer
+    /jobs/{job_id}. Progress is published at most every JOB_PUBLISH_INTERVAL seconds."""
+    now = time.monotonic()
+    if not force and now - job_published_at.get(job["id"], 0.0) < JOB_PUBLISH_INTERVAL:
+        return
+    job_published_at[job["id"]] = now
+    shared_state.publish_job(job)
+
+def prune_finished_jobs():
+    """Forget the oldest finished jobs once there are too many."""
+    finished = [job_id for job_id, job in ingest_jobs.items() if job["status"] in ("completed", "failed")]
+    pruned = finished[:max(0, len(finished) - MAX_FINISHED_JOBS)]
+    for job_id in pruned:
+        del ingest_jobs[job_id]
+        job_published_at.pop(job_id, None)
+    shared_state.delete_jobs(pruned)
+
+class UploadStager:
+    """Save the PDFs of one bulk upload, and the PDFs inside its zips, to a
+    staging directory. Each file is held to MAX_UPLOAD_BYTES like a single
+    upload and all of them together to MAX_BULK_UPLOAD_BYTES, counting zip
+    members as they are decompressed."""
+
+    def __init__(self, staging_dir: str):
+        self.staging_dir = staging_dir
+        self.names = itertools.count()
+        self.total = 0
+        self.staged: List[Tuple[str, str]] = []
+
+    def stage(self, upload: UploadFile):
+        name = os.path.basename(upload.filename or "")
+        if name.lower().endswith(".zip"):
+            with zipfile.ZipFile(upload.file) as archive:
+                for member in archive.infolist():
+                    member_name = os.path.basename(member.filename)
+                    if member.is_dir() or not member_name.lower().endswith(".pdf") or member.filename.startswith("__MACOSX"):
+                        continue
+                    with archive.open(member) as source:
+                        self._stage_file(source, member_name)
+        elif name.lower().endswith(".pdf"):
+            self._stage_file(upload.file, name)
+
+    def _stage_file(self, source, name: str):
+        staged_path = os.path.join(self.staging_dir, f"{next(self.names)}_{name}")
+        size = 0
+        with open(staged_path, "wb") as buffer:
+            while chunk := source.read(UPLOAD_CHUNK_SIZE):
+                size += len(chunk)
+                self.total += len(chunk)
+                if MAX_UPLOAD_BYTES and size > MAX_UPLOAD_BYTES:
+                    raise HTTPException(
+                        status_code=413,
+                        detail=f"{name} exceeds the maximum upload size of {MAX_UPLOAD_BYTES} bytes"
+                    )
+                if MAX_BULK_UPLOAD_BYTES and self.total > MAX_BULK_UPLOAD_BYTES:
+                    raise HTTPException(
+                        status_code=413,
+                        detail=f"The files exceed the maximum bulk upload size of {MAX_BULK_UPLOAD_BYTES} bytes"
+                    )
+                buffer.write(chunk)
+        self.staged.append((name, staged_path))
+
+async def ingest_staged_file(
+    job: Dict[str, Any],
+    writer: IngestWriter,
+    semaphore: asyncio.Semaphore,
+    filename: str,
+    metadata: Dict[str, Any],
+    override: bool
+):
+    """Parse, embed and queue one paper of a bulk ingestion job for writing."""
+    async with semaphore:
+        try:
+            loop = asyncio.get_running_loop()
+            with stage_timer("pdf_extract"):
+                texts, signature = await loop.run_in_executor(
+                    get_pdf_process_pool(), extract_passages_with_signature, os.path.join(UPLOAD_DIR, filename)
+                )
+            if not texts:
+                raise ValueError("No text could be extracted from the PDF file.")
+
+            # Skip near-duplicates before paying for their embeddings
+            if signature is not None and override:
+                await asyncio.to_thread(near_duplicate_index.add, filename, signature)
+            elif signature is not None:
+                async with paper_write_lock():
+                    near_duplicate = await asyncio.to_thread(near_duplicate_index.claim, filename, signature)
+                if near_duplicate:
+                    # Not registered under this name, so only the file has to go
+                    os.remove(os.path.join(UPLOAD_DIR, filename))
+                    record_job_result(job, filename, "skipped", f"Near-duplicate of {near_duplicate[0]}")
+                    return
+            model = EMBEDDING_MODEL
+            embeddings = await get_embeddings(texts, model)
+        except Exception as e:
+            discard_ingested_file(filename)
+            record_job_result(job, filename, "failed", str(e))
+            return
+        await writer.add(filename, metadata, texts, embeddings, model)
+
+async def run_ingest_job(
+    job: Dict[str, Any],
+    staged: List[Tuple[str, str]],
+    metadata_dict: Dict[str, Any],
+    folder_id: Optional[str],
+    override: bool
+):
+    """Move staged files into the library and ingest them through the worker pool."""
+    job["status"] = "running"
+    publish_job(job, force=True)
+    writer = IngestWriter(job)
+    semaphore = asyncio.Semaphore(INGEST_CONCURRENCY)
+    tasks = []
+    job_hashes = {}
+    try:
+        # Names are assigned one file at a time so files in the same job can't collide
+        for original_name, staged_path in staged:
+            content_hash = await asyncio.to_thread(file_sha256, staged_path)
+            duplicate = job_hashes.get(content_hash) or get_paper_index().find_duplicate(content_hash)
+            if duplicate and not override:
+                os.remove(staged_path)
+                record_job_result(job, original_name, "skipped", f"Duplicate of {duplicate}")
+                continue
+
+            file_metadata = dict(metadata_dict)
+            file_metadata["title"] = metadata_dict.get("title") or os.path.splitext(original_name)[0]
+            filename = sanitize_filename(file_metadata["title"], ".pdf")
+
+            if await check_file_exists(filename):
+                if not override:
+                    os.remove(staged_path)
+                    record_job_result(job, filename, "skipped", "File with this name already exists")
+                    continue
+                async with paper_write_lock():
+                    await asyncio.to_thread(collection.delete, ids=[filename])
+                    await asyncio.to_thread(delete_passages, filename)
+                    paper_index.remove(filename)
+                near_duplicate_index.remove([filename])
+            else:
+                filename = ensure_unique_filename(filename, UPLOAD_DIR)
+            os.replace(staged_path, os.path.join(UPLOAD_DIR, filename))
+            job_hashes[content_hash] = filename
+
+            sanitized_metadata = build_paper_metadata(file_metadata, filename, folder_id, content_hash)
+            tasks.append(asyncio.create_task(
+                ingest_staged_file(job, writer, semaphore, filename, sanitized_metadata, override)
+            ))
+
+        await asyncio.gather(*tasks)
+        await writer.flush()
+        job["status"] = "completed"
+    except Exception as e:
+        print(f"Error in ingest job {job['id']}: {str(e)}")
+        job["status"] = "failed"
+        job["error"] = str(e)
+    finally:
+        job["finished_at"] = str(datetime.now())
+        shutil.rmtree(os.path.join(INGEST_STAGING_DIR, job["id"]), ignore_errors=True)
+        publish_job(job, force=True)
+        prune_finished_jobs()
+
+@app.post("/papers/bulk")
+async def bulk_upload_papers(
+    files: List[UploadFile] = File(...),
+    metadata: Optional[str] = Form(None),  # Shared metadata (tags, category, ...) for every file
+    folder_id: Optional[str] = Form('default'),
+    override: bool = Form(False)
+):
+    """Upload many PDFs (or zip archives of PDFs) and ingest them in the background."""
+    # Validate folder if specified
+    if folder_id:
+        if not await asyncio.to_thread(folder_store.exists, folder_id):
+            raise HTTPException(status_code=404, detail="Folder not found")
+
+    try:
+        metadata_dict = json.loads(metadata) if metadata else {}
+    except json.JSONDecodeError:
+        metadata_dict = {}
+
+    job_id = str(uuid.uuid4())
+    staging_dir = os.path.join(INGEST_STAGING_DIR, job_id)
+    os.makedirs(staging_dir, exist_ok=True)
+    stager = UploadStager(staging_dir)
+    try:
+        for upload in files:
+            await asyncio.to_thread(stager.stage, upload)
+    except zipfile.BadZipFile:
+        shutil.rmtree(staging_dir, ignore_errors=True)
+        raise HTTPException(status_code=400, detail="Invalid zip archive")
+    except BaseException:
+        shutil.rmtree(staging_dir, ignore_errors=True)
+        raise
+    staged = stager.staged
+
+    if not staged:
+        shutil.rmtree(staging_dir, ignore_errors=True)
+        raise HTTPException(status_code=400, detail="Only PDF files or zip archives of PDF files are accepted")
+
+    job = {
+        "id": job_id,
+        "status": "queued",
+        "created_at": str(datetime.now()),
+        "finished_at": None,
+        "total": len(staged),
+        "processed": 0,
+        "succeeded": 0,
+        "failed": 0,
+        "skipped": 0,
+        "results": []
+    }
+    ingest_jobs[job_id] = job
+    publish_job(job, force=True)
+
+    # Keep a reference to the task so it isn't garbage collected while running
+    task = asyncio.create_task(run_ingest_job(job, staged, metadata_dict, folder_id, override))
+    ingest_tasks.add(task)
+    task.add_done_callback(ingest_tasks.discard)
+
+    return {"job_id": job_id, "total": job["total"]}
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    """Get the progress of a background job"""
+    # Jobs started by another worker are read from the shared state
+    job = ingest_jobs.get(job_id) or shared_state.get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+# Reindexing: papers are rebuilt into shadow collections which are swapped in
+# once complete, so search keeps working off the live collections meanwhile.
+# The shadow collection names are kept in REINDEX_STATE_FILE so an interrupted
+# reindex picks up where it stopped.
+REINDEX_STATE_FILE = data_path("reindex_state.json")
+REINDEX_BATCH_SIZE = int(os.getenv("REINDEX_BATCH_SIZE", "50"))
+# Metadata maintained by the reindex itself rather than by users
+REINDEX_FIELDS = ("content_hash", "embedding_model", "extractor_version", "passage_count")
+
+REINDEX_LOCK_FILE = data_path("reindex.lock")
+
+reindex_task: Optional[asyncio.Task] = None
+
+def lock_reindex():
+    """Open and lock REINDEX_LOCK_FILE so only one worker process reindexes at a
+    time. Closing the returned file releases the lock. None if it is taken."""
+    return try_lock_file(REINDEX_LOCK_FILE)
+
+def try_lock_file(path: str):
+    """Open and exclusively lock a lock file without waiting, None if it is taken."""
+    lock_file = open(path, "a")
+    if fcntl is not None:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            lock_file.close()
+            return None
+    return lock_file
+
+def load_reindex_state() -> Optional[Dict[str, str]]:
+    try:
+        with open(REINDEX_STATE_FILE, "r") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+class ShadowWriter:
+    """Write rebuilt papers to the shadow collections in batches, passages before
+    paper records, so a paper record in the shadow means the paper is complete."""
+
+    def __init__(self, job: Dict[str, Any], papers_collection, passages_collection, batch_size: int = REINDEX_BATCH_SIZE):
+        self.job = job
+        self.papers_collection = papers_collection
+        self.passages_collection = passages_collection
+        self.batch_size = batch_size
+        self.lock = asyncio.Lock()
+        self.papers = []
+
+    async def add(
+        self,
+        filename: str,
+        metadata: Dict[str, Any],
+        texts: List[str],
+        embeddings: List[List[float]],
+        status: str
+    ):
+        async with self.lock:
+            self.papers.append((filename, metadata, texts, embeddings, status))
+            if len(self.papers) >= self.batch_size:
+                await self._flush()
+
+    async def flush(self):
+        async with self.lock:
+            await self._flush()
+
+    async def _flush(self):
+        papers, self.papers = self.papers, []
+        if not papers:
+            return
+
+        filenames = [filename for filename, _, _, _, _ in papers]
+        passage_ids, passage_docs, passage_embeddings, passage_metadatas = [], [], [], []
+        for filename, metadata, texts, embeddings, _ in papers:
+            records = passage_records(filename, 0, len(texts), metadata)
+            passage_ids.extend(records["ids"])
+            passage_metadatas.extend(records["metadatas"])
+            passage_docs.extend(texts)
+            passage_embeddings.extend(embeddings)
+
+        try:
+            # Passages of an interrupted earlier attempt would otherwise linger
+            await asyncio.to_thread(self.passages_collection.delete, where={"paper_id": {"$in": filenames}})
+            await asyncio.to_thread(
+                self.passages_collection.add,
+                ids=passage_ids,
+                documents=passage_docs,
+                embeddings=passage_embeddings,
+                metadatas=passage_metadatas
+            )
+            await asyncio.to_thread(
+                self.papers_collection.add,
+                ids=filenames,
+                documents=[texts[0] for _, _, texts, _, _ in papers],
+                embeddings=[mean_embedding(embeddings) for _, _, _, embeddings, _ in papers],
+                metadatas=[metadata for _, metadata, _, _, _ in papers]
+            )
+        except Exception as e:
+            for filename in filenames:
+                record_job_result(self.job, filename, "failed", str(e))
+            return
+
+        for filename, _, _, _, status in papers:
+            record_job_result(self.job, filename, status)
+
+def stored_passages(filename: str) -> Tuple[List[str], List[List[float]]]:
+    """A paper's passages and their embeddings from the live collections, in order.
+
+    Papers indexed before passages existed fall back to their paper record.
+    """
+    results = passages.get(where={"paper_id": filename}, include=["documents", "embeddings", "metadatas"])
+    if results["ids"]:
+        rows = sorted(
+            zip(results["metadatas"], results["documents"], results["embeddings"]),
+            key=lambda row: row[0].get("chunk_index", 0)
+        )
+        return [doc for _, doc, _ in rows], [embedding for _, _, embedding in rows]
+    results = collection.get(ids=[filename], include=["documents", "embeddings"])
+    return results["documents"], results["embeddings"]
+
+async def reindex_paper(
+    job: Dict[str, Any],
+    writer: ShadowWriter,
+    semaphore: asyncio.Semaphore,
+    filename: str,
+    metadata: Optional[Dict[str, Any]],
+    model: str
+):
+    """Rebuild one paper into the shadow collections, doing as little work as possible.
+
+    Papers whose file, extractor version and model are unchanged are copied
+    with their embeddings. If only the model changed, the stored passages are
+    embedded again. Otherwise the PDF is extracted again. `metadata` is None for
+    PDFs in UPLOAD_DIR that have no paper record.
+    """
+    async with semaphore:
+        try:
+            file_path = os.path.join(UPLOAD_DIR, filename)
+            has_file = os.path.exists(file_path)
+            if metadata is None:
+                content_hash = await asyncio.to_thread(file_sha256, file_path)
+                metadata = build_paper_metadata({"title": os.path.splitext(filename)[0]}, filename, "default", content_hash)
+                same_text = False
+            else:
+                indexed_hash = metadata.get("content_hash")
+                content_hash = await asyncio.to_thread(file_sha256, file_path) if has_file else indexed_hash or ""
+                # A paper whose file is gone can only be rebuilt from its stored text
+                same_text = not has_file or (
+                    content_hash == indexed_hash and metadata.get("extractor_version") == EXTRACTOR_VERSION
+                )
+                metadata = {
+                    **metadata,
+                    **tag_flags(parse_tags(metadata.get("tags", "[]"))),
+                    "content_hash": content_hash
+                }
+
+            if same_text:
+                texts, embeddings = await asyncio.to_thread(stored_passages, filename)
+                if metadata.get("embedding_model") == model and texts:
+                    status = "unchanged"
+                else:
+                    embeddings = await get_embeddings(texts, model)
+                    status = "reembedded"
+            else:
+                loop = asyncio.get_running_loop()
+                with stage_timer("pdf_extract"):
+                    texts, signature = await loop.run_in_executor(
+                        get_pdf_process_pool(), extract_passages_with_signature, file_path
+                    )
+                embeddings = await get_embeddings(texts, model)
+                if signature is not None:
+                    await asyncio.to_thread(near_duplicate_index.add, filename, signature)
+                metadata["extractor_version"] = EXTRACTOR_VERSION
+                status = "reextracted"
+            if not texts:
+                raise ValueError("No text could be extracted from the PDF file.")
+        except Exception as e:
+            record_job_result(job, filename, "failed", str(e))
+            return
+
+        metadata["embedding_model"] = model
+        metadata["passage_count"] = len(texts)
+        await writer.add(filename, metadata, texts, embeddings, status)
+
+def user_fields(metadata: Dict[str, Any]) -> Dict[str, Any]:
+    return {key: value for key, value in metadata.items() if key not in REINDEX_FIELDS}
+
+async def run_reindex(job: Dict[str, Any], model: str):
+    """Rebuild every paper into shadow collections and swap them in when done."""
+    global collection, passages, paper_index, lexical_index, vector_store, EMBEDDING_MODEL
+    job["status"] = "running"
+    publish_job(job, force=True)
+    try:
+        state = load_reindex_state()
+        if state and (state["embedding_model"] != model or state["extractor_version"] != EXTRACTOR_VERSION):
+            # A leftover reindex towards something else; start over
+            for name in (state["papers"], state["passages"]):
+                try:
+                    get_chroma_client().delete_collection(name)
+                except ValueError:
+                    pass
+            state = None
+        if state is None:
+            stamp = uuid.uuid4().hex[:12]
+            state = {
+                "papers": f"research_papers_{stamp}",
+                "passages": f"paper_passages_{stamp}",
+                "embedding_model": model,
+                "extractor_version": EXTRACTOR_VERSION
+            }
+            with open(REINDEX_STATE_FILE, "w") as f:
+                json.dump(state, f, indent=2)
+        shadow, shadow_passages = open_collections(state)
+
+        writer = ShadowWriter(job, shadow, shadow_passages)
+        semaphore = asyncio.Semaphore(INGEST_CONCURRENCY)
+        while True:
+            # Papers uploaded while a pass ran are picked up by the next one
+            await asyncio.to_thread(sync_worker_state)
+            done = set((await asyncio.to_thread(shadow.get, include=[]))["ids"])
+            live = get_paper_index()
+            todo = {filename: live.get(filename) for filename in list(live.papers) if filename not in done}
+            for name in os.listdir(UPLOAD_DIR):
+                if name.lower().endswith(".pdf") and name not in done and name not in todo:
+                    todo[name] = None
+            if not todo:
+                break
+            job["total"] = len(done) + len(todo)
+            job["processed"] = len(done)
+
+            items = list(todo.items())
+            for start in range(0, len(items), REINDEX_BATCH_SIZE * 10):
+                await asyncio.gather(*[
+                    reindex_paper(job, writer, semaphore, filename, metadata, model)
+                    for filename, metadata in items[start:start + REINDEX_BATCH_SIZE * 10]
+                ])
+            await writer.flush()
+            if job["failed"]:
+                raise RuntimeError(f"{job['failed']} papers could not be reindexed, the live collections are unchanged")
+
+        new_index = PaperIndex()
+        await asyncio.to_thread(new_index.build, shadow)
+        new_lexical_index = LexicalIndex()
+        await asyncio.to_thread(new_lexical_index.build, shadow_passages)
+        new_vector_store = open_vector_store(shadow_passages.name)
+        if new_vector_store is not None:
+            await asyncio.to_thread(new_vector_store.build, shadow_passages)
+
+        # Swap while no worker writes papers, then replay the metadata changes
+        # and deletions that happened while the reindex ran. The other workers
+        # switch over when they see the reset in the change log.
+        async with paper_write_lock():
+            live = get_paper_index()
+            # Papers uploaded while the indexes above were built
+            missed = [filename for filename in live.papers if filename not in new_index]
+            if missed:
+                job["total"] += len(missed)
+                await asyncio.gather(*[
+                    reindex_paper(job, writer, semaphore, filename, live.get(filename), model) for filename in missed
+                ])
+                await writer.flush()
+                if job["failed"]:
+                    raise RuntimeError(f"{job['failed']} papers could not be reindexed, the live collections are unchanged")
+                await asyncio.to_thread(
+                    index_shadow_papers, missed, shadow, shadow_passages, new_index, new_lexical_index, new_vector_store
+                )
+            old_names = (collection.name, passages.name)
+            old_vector_store = vector_store
+            changes = {
+                filename: user_fields(metadata)
+                for filename, metadata in live.papers.items()
+                if filename in new_index and user_fields(metadata) != user_fields(new_index.get(filename))
+            }
+            # Papers deleted meanwhile, as opposed to files that had no paper record before
+            removed = [
+                filename for filename in new_index.papers
+                if filename not in live and not os.path.exists(os.path.join(UPLOAD_DIR, filename))
+            ]
+            collection, passages = shadow, shadow_passages
+            new_index.generation = paper_index.generation + 1  # Invalidates cached searches
+            new_index.attach(stats_aggregates, shared_state)
+            paper_index, lexical_index, vector_store = new_index, new_lexical_index, new_vector_store
+            EMBEDDING_MODEL = model
+            save_active_collections({
+                "papers": shadow.name,
+                "passages": shadow_passages.name,
+                "embedding_model": model,
+                "dimensions": embedding_dimensions.get(model)
+            })
+            shared_state.record_changes([("", "reset")])
+            os.remove(REINDEX_STATE_FILE)
+            if changes:
+                save_paper_metadata(changes)
+            if removed:
+                hard_delete_papers(removed)
+
+        for name in old_names:
+            await asyncio.to_thread(get_chroma_client().delete_collection, name)
+        if old_vector_store is not None:
+            old_vector_store.destroy()
+        job["status"] = "completed"
+    except Exception as e:
+        print(f"Error in reindex job {job['id']}: {str(e)}")
+        job["status"] = "failed"
+        job["error"] = str(e)
+    finally:
+        job["finished_at"] = str(datetime.now())
+        publish_job(job, force=True)
+        prune_finished_jobs()
+
+def index_shadow_papers(
+    filenames: List[str],
+    papers_collection,
+    passages_collection,
+    index: "PaperIndex",
+    lexical: "LexicalIndex",
+    store: Optional["QuantizedVectorStore"]
+):
+    """Add papers written to the shadow collections to the indexes already built from them."""
+    results = papers_collection.get(ids=filenames, include=["metadatas"])
+    for paper_id, metadata in zip(results["ids"], results["metadatas"]):
+        index.upsert(paper_id, metadata, shared=False)
+    results = passages_collection.get(where={"paper_id": {"$in": filenames}}, include=["documents", "embeddings"])
+    lexical.add(results["ids"], results["documents"])
+    if store is not None:
+        store.add(results["ids"], results["embeddings"])
+
+def new_reindex_job() -> Dict[str, Any]:
+    return {
+        "id": str(uuid.uuid4()),
+        "type": "reindex",
+        "status": "queued",
+        "created_at": str(datetime.now()),
+        "finished_at": None,
+        "total": 0,
+        "processed": 0,
+        "unchanged": 0,
+        "reembedded": 0,
+        "reextracted": 0,
+        "failed": 0,
+        "results": []
+    }
+
+@app.post("/reindex")
+async def start_reindex(embedding_model: Optional[str] = None):
+    """Rebuild the index in the background, optionally with a new embedding model.
+
+    Only papers whose file, text extractor or embedding model changed are
+    processed again; search keeps using the current index until the new one
+    is swapped in. Progress is reported through /jobs/{job_id}. Calling this
+    again after an interruption resumes the unfinished reindex.
+    """
+    global reindex_task
+    try:
+        get_embedding_provider(embedding_model)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    lock_file = None if reindex_task is not None and not reindex_task.done() else lock_reindex()
+    if lock_file is None:
+        raise HTTPException(status_code=409, detail="A reindex is already running")
+
+    job = new_reindex_job()
+    ingest_jobs[job["id"]] = job
+    reindex_task = asyncio.create_task(run_reindex(job, embedding_model or EMBEDDING_MODEL))
+    reindex_task.add_done_callback(lambda _: lock_file.close())
+    return {"job_id": job["id"], "embedding_model": embedding_model or EMBEDDING_MODEL}
+
+@app.put("/papers/{filename}/metadata")
+async def update_paper_metadata(filename: str, metadata: Dict[str, Any]):
+    """Update paper metadata"""
+    try:
+        async with paper_write_lock():
+            # Get existing metadata
+            existing_metadata = get_paper_index().get(filename)
+        
+            if existing_metadata is None:
+                raise HTTPException(status_code=404, detail="Paper not found")
+        
+            # Update metadata while preserving existing data
+        
+            # Convert None values to appropriate types for ChromaDB
+            updated_metadata = {
+                "filename": filename,
+                "upload_date": existing_metadata["upload_date"],
+                "title": metadata.get("title") or existing_metadata.get("title", ""),
+                "authors": metadata.get("authors") or existing_metadata.get("authors", ""),
+                "year": metadata.get("year") if metadata.get("year") is not None else existing_metadata.get("year", ""),
+                "category": metadata.get("category") or existing_metadata.get("category", ""),
+                "tags": json.dumps(metadata.get("tags", [])),  # Convert tags list to JSON string
+                "abstract": metadata.get("abstract") or existing_metadata.get("abstract", ""),
+                "folder_id": metadata.get("folder_id") or existing_metadata.get("folder_id", "default")
+            }
+        
+            # Update in ChromaDB
+            save_paper_metadata({filename: updated_metadata})
+        
+            return {"message": "Metadata updated successfully"}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/papers/")
+async def list_papers(params: ListParams = Depends(), exclude_trash: bool = False):
+    """List all stored papers."""
+    try:
+        papers = get_paper_index().all()
+        if exclude_trash:
+            papers = [paper for paper in papers if paper.get("folder_id") != "trash"]
+    except Exception:
+        papers = []
+    return paginate_papers(papers, params)
+
+def is_not_modified(request: Request, etag: str, mtime: float) -> bool:
+    """Check If-None-Match, or failing that If-Modified-Since, against a file's validators."""
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+        return "*" in tags or etag in tags
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            return int(mtime) <= parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+    return False
+
+def parse_byte_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """Parse a single-range `bytes=` header into an inclusive (start, end).
+
+    Returns None for ranges we don't serve (multiple or malformed ranges), in
+    which case the whole file is sent, and raises 416 if the range lies
+    outside the file.
+    """
+    unit, _, spec = header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec:
+        return None
+    first, _, last = spec.strip().partition("-")
+    unsatisfiable = HTTPException(
+        status_code=416, detail="Range not satisfiable", headers={"Content-Range": f"bytes */{size}"}
+    )
+    try:
+        if first:
+            start = int(first)
+            end = int(last) if last else size - 1
+            if start < 0 or (last and start > end):
+                return None
+        else:
+            # Suffix range: the last N bytes
+            suffix = int(last)
+            if suffix < 0:
+                return None
+            if suffix == 0:
+                raise unsatisfiable
+            start, end = max(0, size - suffix), size - 1
+    except ValueError:
+        return None
+    if start >= size:
+        raise unsatisfiable
+    return start, min(end, size - 1)
+
+def iter_file_range(file_path: str, start: int, length: int) -> Iterator[bytes]:
+    with open(file_path, "rb") as f:
+        f.seek(start)
+        while length > 0:
+            chunk = f.read(min(DOWNLOAD_CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+def file_response(request: Request, file_path: str, media_type: str, etag: Optional[str] = None) -> Response:
+    """Serve a file with ETag / Last-Modified revalidation and single byte-range requests.
+
+    Without an explicit strong `etag`, one is derived from the file's
+    modification time and size.
+    """
+    stat = os.stat(file_path)
+    etag = etag or f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+    headers = {
+        "ETag": etag,
+        "Last-Modified": formatdate(stat.st_mtime, usegmt=True),
+        "Cache-Control": "no-cache",  # Cache, but revalidate since a file can be overridden
+        "Accept-Ranges": "bytes"
+    }
+    if is_not_modified(request, etag, stat.st_mtime):
+        return Response(status_code=304, headers=headers)
+
+    byte_range = None
+    range_header = request.headers.get("range")
+    # If-Range: only send part of the file if it is still the version the client has
+    if range_header and request.headers.get("if-range", etag) in (etag, headers["Last-Modified"]):
+        byte_range = parse_byte_range(range_header, stat.st_size)
+    if byte_range is None:
+        return FileResponse(file_path, media_type=media_type, headers=headers, stat_result=stat)
+
+    start, end = byte_range
+    headers["Content-Range"] = f"bytes {start}-{end}/{stat.st_size}"
+    headers["Content-Length"] = str(end - start + 1)
+    return StreamingResponse(
+        iter_file_range(file_path, start, end - start + 1),
+        status_code=206,
+        media_type=media_type,
+        headers=headers
+    )
+
+@app.get("/papers/{filename}")
+async def get_paper(request: Request, filename: str):
+    """Download a specific paper. Supports Range requests and conditional GETs."""
+    file_path = os.path.join(UPLOAD_DIR, filename)
+    if not os.path.exists(file_path):
+        raise HTTPException(status_code=404, detail="Paper not found")
+    # The content hash is a strong validator; papers uploaded before it existed use mtime and size
+    content_hash = (get_paper_index().get(filename) or {}).get("content_hash")
+    return file_response(
+        request,
+        file_path,
+        "application/pdf",
+        etag=f'"{content_hash}"' if content_hash else None
+    )
+
+def thumbnail_path(filename: str, width: int) -> str:
+    return os.path.join(THUMBNAIL_DIR, f"{filename}.{width}.png")
+
+def render_thumbnail(file_path: str, output_path: str, width: int):
+    """Render the first page of a PDF to a PNG `width` pixels wide.
+
+    PyMuPDF is imported here rather than at startup since only thumbnails need it.
+    """
+    import fitz  # PyMuPDF
+
+    with fitz.open(file_path) as document:
+        page = document[0]
+        zoom = width / page.rect.width
+        pixmap = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom), alpha=False)
+        image = pixmap.tobytes("png")
+    # Write to a temporary file first so concurrent requests never see a partial image
+    fd, temp_path = tempfile.mkstemp(suffix=".png", dir=THUMBNAIL_DIR)
+    with os.fdopen(fd, "wb") as f:
+        f.write(image)
+    os.replace(temp_path, output_path)
+
+def delete_thumbnails(filename: str):
+    """Remove every cached thumbnail of a paper."""
+    for path in glob.glob(os.path.join(THUMBNAIL_DIR, f"{glob.escape(filename)}.*.png")):
+        os.remove(path)
+
+@app.get("/papers/{filename}/thumbnail")
+async def get_paper_thumbnail(
+    request: Request,
+    filename: str,
+    width: int = Query(THUMBNAIL_WIDTH, ge=64, le=1024)
+):
+    """Get a PNG preview of a paper's first page, rendered on first request and then cached."""
+    file_path = os.path.join(UPLOAD_DIR, filename)
+    if not os.path.exists(file_path):
+        raise HTTPException(status_code=404, detail="Paper not found")
+
+    output_path = thumbnail_path(filename, width)
+    # Re-render if the paper was replaced after the thumbnail was made
+    if not os.path.exists(output_path) or os.stat(output_path).st_mtime_ns < os.stat(file_path).st_mtime_ns:
+        try:
+            await asyncio.to_thread(render_thumbnail, file_path, output_path, width)
+        except ImportError:
+            raise HTTPException(status_code=501, detail="Thumbnails require PyMuPDF to be installed")
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Error rendering thumbnail: {str(e)}")
+    return file_response(request, output_path, "image/png")
+
+@app.get("/papers/{filename}/metadata")
+async def get_paper_metadata(filename: str):
+    """Get metadata for a specific paper."""
+    metadata = get_paper_index().get(filename)
+    if metadata is None:
+        raise HTTPException(status_code=404, detail="Paper not found")
+    return metadata
+
+@app.get("/papers/{filename}/related")
+async def get_related_papers(filename: str, limit: int = Query(10, ge=1, le=RELATED_NEIGHBOURS)):
+    """Papers most similar to a paper, from the precomputed nearest-neighbour
+    graph over the stored paper embeddings. Papers in the trash are left out."""
+    index = get_paper_index()
+    if index.get(filename) is None:
+        raise HTTPException(status_code=404, detail="Paper not found")
+    with stage_timer("related"):
+        neighbours = await asyncio.to_thread(
+            related_papers.lookup,
+            filename,
+            collection,
+            limit,
+            lambda paper_id: (metadata := index.get(paper_id)) is not None and metadata.get("folder_id") != "trash"
+        )
+    results = []
+    for neighbour_id, distance in neighbours:
+        metadata = index.get(neighbour_id)
+        if metadata is not None:
+            results.append({"metadata": metadata, "distance": distance})
+    return {"results": results}
+
+@app.delete("/papers/{filename}")
+async def delete_paper(filename: str, soft_delete: bool = True):
+    """Delete a paper. If soft_delete=True, moves it to trash folder, otherwise permanently deletes it."""
+    try:
+        async with paper_write_lock():
+            # Get existing metadata first
+            current_metadata = get_paper_index().get(filename)
+        
+            if current_metadata is None:
+                raise HTTPException(status_code=404, detail="Paper not found")
+        
+            if soft_delete and current_metadata.get("folder_id") != "trash":
+                # Store original folder_id and move to trash
+                save_paper_metadata(folder_move_updates({filename: current_metadata}, "trash"))
+                return {"message": "Paper moved to trash"}
+            else:
+                # Hard delete - remove from database and file system
+                hard_delete_papers([filename])
+                return {"message": "Paper permanently deleted"}
+            
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+class SearchCache:
+    """Bounded LRU cache of search responses with a time to live.
+
+    Entries remember the metadata index generation they were computed at and
+    count as misses once the index has changed since.
+    """
+
+    def __init__(self, max_entries: int = SEARCH_CACHE_SIZE, ttl: float = SEARCH_CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.entries: "OrderedDict[Tuple, Tuple[float, int, Dict[str, Any]]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Tuple, generation: int) -> Optional[Dict[str, Any]]:
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or entry[1] != generation or time.monotonic() - entry[0] > self.ttl:
+                if entry is not None:
+                    del self.entries[key]
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[2]
+
+    def put(self, key: Tuple, generation: int, response: Dict[str, Any]):
+        if self.max_entries <= 0:
+            return
+        with self.lock:
+            self.entries[key] = (time.monotonic(), generation, response)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def stats(self) -> Dict[str, Any]:
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "entries": len(self.entries),
+                "max_entries": self.max_entries,
+                "ttl": self.ttl
+            }
+
+search_cache = SearchCache()
+
+async def vector_search(
+    query: str,
+    n_results: int,
+    filter_args: tuple,
+    contains: Optional[str]
+) -> List[Tuple[str, int, str, float]]:
+    """Semantic search over passages, collapsed to (paper id, chunk index, passage, distance)
+    for the best passage of each paper."""
+    query_embedding = await get_embedding(query)
+    if vector_store is not None:
+        return await asyncio.to_thread(exact_vector_search, query_embedding, n_results, filter_args, contains)
+    
+    # Handle empty collection gracefully
+    try:
+        # Over-fetch passages since several of them may belong to the same paper
+        results = passages.query(
+            query_embeddings=[query_embedding],
+            n_results=n_results * PASSAGE_OVERSAMPLE,
+            where=build_where(*filter_args),
+            where_document={"$contains": contains} if contains else None,
+            include=["metadatas", "documents", "distances"]
+        )
+    except Exception:
+        # If collection is empty or other error
+        return []
+    
+    # Collapse passage hits back to papers, keeping the best passage of each
+    best_hits = {}
+    for meta, doc, distance in zip(
+        results["metadatas"][0], results["documents"][0], results["distances"][0]
+    ):
+        paper_id = meta["paper_id"]
+        if paper_id not in best_hits:
+            best_hits[paper_id] = (paper_id, meta.get("chunk_index"), doc, distance)
+        if len(best_hits) == n_results:
+            break
+    return list(best_hits.values())
+
+def exact_vector_search(
+    query_embedding: List[float],
+    n_results: int,
+    filter_args: tuple,
+    contains: Optional[str]
+) -> List[Tuple[str, int, str, float]]:
+    """vector_search over the quantized vector store instead of the HNSW index."""
+    index = get_paper_index()
+    accept = paper_filter(*filter_args)
+    folder_id, category, _, _, _, tags, _ = filter_args
+    papers = index.candidates(folder_id, category, tags)
+    limit = n_results * PASSAGE_OVERSAMPLE
+    rerank = vector_store.dtype == np.int8
+    while True:
+        fetch = limit * VECTOR_RERANK_FACTOR if rerank else limit
+        with stage_timer("vector_scan"):
+            ranked = vector_store.search(
+                query_embedding,
+                fetch,
+                papers=papers,
+                accept=lambda paper_id: (metadata := index.get(paper_id)) is not None and accept(metadata)
+            )
+        if not ranked:
+            return []
+        exhausted = len(ranked) < fetch
+
+        results = passages.get(
+            ids=[doc_id for doc_id, _ in ranked],
+            include=["documents", "embeddings"] if rerank else ["documents"]
+        )
+        if rerank:
+            vectors = np.asarray(results["embeddings"], dtype=np.float32)
+            distances = ((vectors - np.asarray(query_embedding, dtype=np.float32)) ** 2).sum(axis=1)
+            ranked = sorted(zip(results["ids"], distances.tolist()), key=lambda item: item[1])
+        hits = best_passages(ranked, dict(zip(results["ids"], results["documents"])), n_results, contains)
+        # `contains` is checked on the passage text after ranking, so widen the
+        # scan until enough passages match or the store has no more to give
+        if not contains or len(hits) >= n_results or exhausted:
+            return hits
+        limit *= 4
+
+def best_passages(
+    ranked: List[Tuple[str, float]],
+    texts: Dict[str, str],
+    n_results: int,
+    contains: Optional[str]
+) -> List[Tuple[str, int, str, float]]:
+    """Collapse ranked passage ids to (paper id, chunk index, passage, score) for
+    the best passage of each paper."""
+    best_hits = {}
+    for doc_id, score in ranked:
+        doc = texts.get(doc_id)
+        if doc is None or (contains and contains not in doc):
+            continue
+        paper_id, chunk_index = parse_passage_id(doc_id)
+        if paper_id not in best_hits:
+            best_hits[paper_id] = (paper_id, chunk_index, doc, score)
+        if len(best_hits) == n_results:
+            break
+    return list(best_hits.values())
+
+def lexical_search(
+    query: str,
+    n_results: int,
+    accept,
+    contains: Optional[str]
+) -> List[Tuple[str, int, str, float]]:
+    """BM25 search over passages, collapsed to (paper id, chunk index, passage, score)
+    for the best passage of each paper."""
+    index = get_paper_index()
+    lexical_index.ensure_built()
+    ranked = lexical_index.search(
+        query,
+        n_results * PASSAGE_OVERSAMPLE,
+        accept=lambda paper_id: (metadata := index.get(paper_id)) is not None and accept(metadata)
+    )
+    if not ranked:
+        return []
+    
+    documents = passages.get(ids=[doc_id for doc_id, _ in ranked], include=["documents"])
+    return best_passages(ranked, dict(zip(documents["ids"], documents["documents"])), n_results, contains)
+
+def reciprocal_rank_fusion(*rankings: List[Tuple[str, int, str, float]]) -> List[Tuple[str, int, str, float]]:
+    """Fuse paper rankings by reciprocal rank. Each paper keeps the passage from
+    the ranking where it placed best."""
+    scores: Dict[str, float] = {}
+    best: Dict[str, Tuple[int, Tuple[str, int, str, float]]] = {}
+    for ranking in rankings:
+        for rank, hit in enumerate(ranking):
+            paper_id = hit[0]
+            scores[paper_id] = scores.get(paper_id, 0.0) + 1.0 / (RRF_K + rank + 1)
+            if paper_id not in best or rank < best[paper_id][0]:
+                best[paper_id] = (rank, hit)
+    fused = sorted(scores, key=lambda paper_id: scores[paper_id], reverse=True)
+    return [(paper_id, best[paper_id][1][1], best[paper_id][1][2], scores[paper_id]) for paper_id in fused]
+
+@app.get("/search/")
+async def search_papers(
+    query: str,
+    n_results: int = 5,
+    mode: str = "hybrid",
+    folder_id: Optional[str] = None,
+    category: Optional[str] = None,
+    year: Optional[int] = None,
+    year_from: Optional[int] = None,
+    year_to: Optional[int] = None,
+    tags: Optional[List[str]] = Query(None),
+    contains: Optional[str] = None,
+    include_trash: bool = False
+):
+    """Search papers, optionally restricted by folder, category, year, tags or a phrase.
+    
+    mode=vector ranks by embedding similarity, mode=lexical by BM25 over the
+    passage text (no embedding call), and mode=hybrid fuses both with
+    reciprocal rank fusion, falling back to lexical results if the embedding
+    endpoint is slow or failing.
+    """
+    if not query:
+        raise HTTPException(status_code=400, detail="Query cannot be empty")
+    if mode not in ("lexical", "vector", "hybrid"):
+        raise HTTPException(status_code=400, detail="mode must be one of lexical, vector, hybrid")
+        
+    filter_args = (folder_id, category, year, year_from, year_to, tags, include_trash)
+    cache_key = (
+        query, n_results, mode, folder_id, category, year, year_from, year_to,
+        tuple(sorted(set(tags))) if tags else None, contains, include_trash
+    )
+    # Taken before searching, so results racing with a write are cached as already stale
+    generation = get_paper_index().generation
+    cached = search_cache.get(cache_key, generation)
+    if cached is not None:
+        return cached
+
+    score_field = "distance" if mode == "vector" else "score"
+    degraded = False
+    try:
+        if mode == "vector":
+            with stage_timer("search_vector"):
+                hits = await vector_search(query, n_results, filter_args, contains)
+        elif mode == "lexical":
+            with stage_timer("search_lexical"):
+                hits = await asyncio.to_thread(lexical_search, query, n_results, paper_filter(*filter_args), contains)
+        else:
+            with stage_timer("search_lexical"):
+                lexical_hits = await asyncio.to_thread(
+                    lexical_search, query, n_results, paper_filter(*filter_args), contains
+                )
+            try:
+                with stage_timer("search_vector"):
+                    vector_hits = await asyncio.wait_for(
+                        vector_search(query, n_results, filter_args, contains),
+                        timeout=HYBRID_EMBEDDING_TIMEOUT
+                    )
+            except Exception as e:
+                # Degrade to lexical search when the embedding endpoint is slow or down
+                print(f"Warning: Vector search unavailable, using lexical results: {str(e)}")
+                vector_hits = []
+                degraded = True
+            hits = reciprocal_rank_fusion(vector_hits, lexical_hits)[:n_results]
+        
+        index = get_paper_index()
+        response = {
+            "results": [
+                {
+                    "metadata": index.get(paper_id),
+                    "content": doc[:1000] + "..." if len(doc) > 1000 else doc,
+                    "passage_index": chunk_index,
+                    score_field: score
+                }
+                for paper_id, chunk_index, doc, score in hits
+                if index.get(paper_id) is not None
+            ]
+        }
+        # Results computed without the vector half aren't worth keeping around
+        if not degraded:
+            search_cache.put(cache_key, generation, response)
+        return response
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/metrics")
+async def get_metrics():
+    """Prometheus metrics, of every worker process when there are several"""
+    registry = REGISTRY
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    # Passed as a header: media_type would get a second charset appended
+    return Response(content=generate_latest(registry), headers={"Content-Type": CONTENT_TYPE_LATEST})
+
+@app.get("/cache/stats")
+async def get_cache_stats():
+    """Get hit/miss counters and size of the embedding cache, plus those of the search cache"""
+    stats = await asyncio.to_thread(embedding_cache.stats)
+    stats["search"] = search_cache.stats()
+    return stats
+
+# Folder Management Endpoints
+@app.get("/folders/")
+async def list_folders():
+    """List all folders"""
+    folders_data = await asyncio.to_thread(load_folders)
+    return folders_data
+
+@app.post("/folders/", response_model=Folder)
+async def create_folder(folder: FolderCreate):
+    """Create a new folder"""
+    def write():
+        with folder_store.transaction() as folders_data:
+            # Check if folder with same name already exists at the same level
+            existing_folders = folders_data["folders"]
+            for existing_folder in existing_folders:
+                if existing_folder["name"].lower() == folder.name.lower() and existing_folder["parent_id"] == folder.parent_id:
+                    raise HTTPException(
+                        status_code=409,
+                        detail="A folder with this name already exists at this level"
+                    )
+        
+            # Create new folder with UUID
+            new_folder = {
+                "id": str(uuid.uuid4()),
+                "name": folder.name,
+                "parent_id": folder.parent_id,
+                "description": folder.description
+            }
+        
+            folders_data["folders"].append(new_folder)
+        return new_folder
+
+    # Another worker may hold the folder file lock, wait for it off the event loop
+    return await asyncio.to_thread(write)
+
+@app.put("/folders/{folder_id}", response_model=Folder)
+async def update_folder(folder_id: str, folder_update: FolderUpdate):
+    """Update a folder"""
+    if folder_id == "default":
+        raise HTTPException(status_code=400, detail="Cannot modify Default Library")
+        
+    def write():
+        with folder_store.transaction() as folders_data:
+            # Find the folder to update
+            folder_index = None
+            for i, folder in enumerate(folders_data["folders"]):
+                if folder["id"] == folder_id:
+                    folder_index = i
+                    break
+        
+            if folder_index is None:
+                raise HTTPException(status_code=404, detail="Folder not found")
+        
+            # Get folder's current state
+            current_folder = folders_data["folders"][folder_index]
+        
+            # Check for duplicate name only if name is being updated
+            if folder_update.name is not None and folder_update.name != current_folder["name"]:
+                parent_id = folder_update.parent_id if folder_update.parent_id is not None else current_folder["parent_id"]
+                for existing_folder in folders_data["folders"]:
+                    if (existing_folder["name"].lower() == folder_update.name.lower() and 
+                        existing_folder["parent_id"] == parent_id and 
+                        existing_folder["id"] != folder_id):
+                        raise HTTPException(
+                            status_code=409,
+                            detail="A folder with this name already exists at this level"
+                        )
+        
+            # Update folder fields
+            if folder_update.name is not None:
+                current_folder["name"] = folder_update.name
+        
+            if folder_update.description is not None:
+                current_folder["description"] = folder_update.description
+        
+            if folder_update.parent_id is not None:
+                # Validate parent folder if specified
+                if folder_update.parent_id:
+                    parent_exists = any(f["id"] == folder_update.parent_id for f in folders_data["folders"])
+                    if not parent_exists:
+                        raise HTTPException(status_code=404, detail="Parent folder not found")
+        
+                    # Check for circular reference
+                    if folder_update.parent_id == folder_id:
+                        raise HTTPException(status_code=400, detail="Folder cannot be its own parent")
+        
+                current_folder["parent_id"] = folder_update.parent_id
+        
+            folders_data["folders"][folder_index] = current_folder
+        return current_folder
+
+    return await asyncio.to_thread(write)
+
+@app.delete("/folders/{folder_id}")
+async def delete_folder(
+    folder_id: str, 
+    trash_folder_id: Optional[str] = Query(None),
+    move_papers: bool = True,
+    recursive: bool = False
+):
+    """Delete a folder and move its papers to the trash folder.
+    
+    With recursive=True its subfolders are deleted too and all of their papers
+    are moved, otherwise subfolders are moved under the destination folder.
+    """
+    if folder_id == "default":
+        raise HTTPException(status_code=400, detail="Cannot delete Default Library")
+    
+    if folder_id == "trash":
+        raise HTTPException(status_code=400, detail="Cannot delete the Trash folder")
+        
+    def write() -> int:
+        with folder_store.transaction() as folders_data:
+            # Check if folder exists
+            if not any(folder["id"] == folder_id for folder in folders_data["folders"]):
+                raise HTTPException(status_code=404, detail="Folder not found")
+    
+            # Collect the folders being deleted
+            deleted_ids = {folder_id}
+            if recursive:
+                deleted_ids.update(
+                    child_id for child_id in folder_store.descendants(folder_id)
+                    if child_id not in ("default", "trash")
+                )
+            folders_data["folders"] = [f for f in folders_data["folders"] if f["id"] not in deleted_ids]
+    
+            # Always use trash folder by default, override if specific trash_folder_id provided
+            destination_folder_id = "trash"
+            if trash_folder_id and trash_folder_id != "trash":
+                if any(f["id"] == trash_folder_id for f in folders_data["folders"]):
+                    destination_folder_id = trash_folder_id
+                else:
+                    raise HTTPException(status_code=404, detail="Specified destination folder not found")
+    
+            # Move papers to trash folder with a single metadata-only update
+            if move_papers:
+                try:
+                    # Only fetch the papers in the deleted folders
+                    results = collection.get(
+                        where={"folder_id": {"$in": sorted(deleted_ids)}},
+                        include=["metadatas"]
+                    )
+                    save_paper_metadata(folder_move_updates(
+                        dict(zip(results["ids"], results["metadatas"])),
+                        destination_folder_id
+                    ))
+                except Exception as e:
+                    print(f"Error moving papers: {str(e)}")
+                    raise HTTPException(status_code=500, detail=f"Failed to move papers: {str(e)}")
+    
+            # Update child folders to be under trash folder too
+            for folder in folders_data["folders"]:
+                if folder.get("parent_id") in deleted_ids:
+                    folder["parent_id"] = destination_folder_id
+        return len(deleted_ids)
+
+    # Papers are moved while the folder file is locked, so both change together
+    async with paper_write_lock():
+        deleted = await asyncio.to_thread(write)
+
+    return {"message": "Folder deleted successfully", "deleted_folders": deleted}
+
+@app.get("/papers/by-folder/{folder_id}")
+async def get_papers_by_folder(folder_id: str, params: ListParams = Depends()):
+    """Get papers in a specific folder"""
+    try:
+        papers = get_paper_index().find("folder_id", folder_id)
+    except Exception:
+        papers = []
+        
+    return paginate_papers(papers, params)
+
+@app.put("/papers/{filename}/move")
+async def move_paper(filename: str, folder_id: Optional[str] = None):
+    """Move a paper to a different folder"""
+    # Validate folder if specified
+    if folder_id:
+        if not await asyncio.to_thread(folder_store.exists, folder_id):
+            raise HTTPException(status_code=404, detail="Folder not found")
+    
+    try:
+        async with paper_write_lock():
+            # Get existing metadata
+            metadata = get_paper_index().get(filename)
+        
+            if metadata is None:
+                raise HTTPException(status_code=404, detail="Paper not found")
+        
+            # Update metadata with new folder
+            save_paper_metadata(folder_move_updates({filename: metadata}, folder_id))
+        
+            return {"message": "Paper moved successfully"}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/papers/batch/move")
+async def move_papers(batch: PaperBatchMove):
+    """Move many papers to a folder with a single metadata update"""
+    if not await asyncio.to_thread(folder_store.exists, batch.folder_id):
+        raise HTTPException(status_code=404, detail="Folder not found")
+    
+    async with paper_write_lock():
+        index = get_paper_index()
+        found = {filename: index.get(filename) for filename in batch.filenames if filename in index}
+        not_found = [filename for filename in batch.filenames if filename not in found]
+        
+        try:
+            save_paper_metadata(folder_move_updates(found, batch.folder_id))
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
+    
+    return {"message": "Papers moved successfully", "moved": len(found), "not_found": not_found}
+
+@app.post("/papers/batch/delete")
+async def delete_papers(batch: PaperBatch):
+    """Permanently delete many papers"""
+    async with paper_write_lock():
+        index = get_paper_index()
+        found = [filename for filename in dict.fromkeys(batch.filenames) if filename in index]
+        not_found = [filename for filename in batch.filenames if filename not in index]
+        
+        try:
+            hard_delete_papers(found)
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
+    
+    return {"message": "Papers permanently deleted", "deleted": len(found), "not_found": not_found}
+
+@app.delete("/trash/")
+async def empty_trash():
+    """Permanently delete every paper in the trash folder"""
+    async with paper_write_lock():
+        filenames = [paper["filename"] for paper in get_paper_index().find("folder_id", "trash")]
+        
+        try:
+            hard_delete_papers(filenames)
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
+    
+    return {"message": "Trash emptied successfully", "deleted": len(filenames)}
+
+def reindex_command(args: List[str]):
+    """`python main.py reindex [embedding_model]`, for when the server isn't running."""
+    lock_file = lock_reindex()
+    if lock_file is None:
+        print("A reindex is already running")
+        sys.exit(1)
+    job = new_reindex_job()
+    with lock_file:
+        asyncio.run(run_reindex(job, args[0] if args else EMBEDDING_MODEL))
+    print(json.dumps({key: value for key, value in job.items() if key != "results"}, indent=2))
+    if job["status"] != "completed":
+        sys.exit(1)
+
+def fit_encoder_command(args: List[str], max_passages: int = 20000):
+    """`python main.py fit-encoder <name> [dimensions]`: fit a local embedding model
+    on the library's passages, for use as EMBEDDING_MODEL=local:<name>."""
+    if not args:
+        print("Usage: python main.py fit-encoder <name> [dimensions]")
+        sys.exit(1)
+    name = args[0]
+    dimensions = int(args[1]) if len(args) > 1 else 256
+    if dimensions < 1:
+        print("dimensions must be at least 1")
+        sys.exit(1)
+    if EMBEDDING_MODEL == f"local:{name}":
+        # Refitting would change the vectors of queries but not of the stored passages
+        print(f"local:{name} is the live embedding model, fit under a new name and reindex with that")
+        sys.exit(1)
+    texts = []
+    while len(texts) < max_passages:
+        batch = passages.get(include=["documents"], limit=min(1000, max_passages - len(texts)), offset=len(texts))
+        if not batch["documents"]:
+            break
+        texts.extend(batch["documents"])
+    if not texts:
+        print("The library has no passages to fit on")
+        sys.exit(1)
+    encoder = HashedTfidfEncoder.fit(texts, dimensions)
+    os.makedirs(LOCAL_EMBEDDING_DIR, exist_ok=True)
+    encoder.save(local_encoder_path(name))
+    print(f"Fitted local:{name} with {encoder.dimensions} dimensions on {len(texts)} passages")
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ["reindex"]:
+        reindex_command(sys.argv[2:])
+    elif sys.argv[1:2] == ["fit-encoder"]:
+        fit_encoder_command(sys.argv[2:])
+    else:
+        import uvicorn
+        workers = WEB_CONCURRENCY
+        if workers > 1 and not CHROMA_HOST:
+            print("Warning: Several workers need a ChromaDB server, set CHROMA_HOST. Running a single worker.")
+            workers = 1
+        if workers > 1:
+            # Workers write their metrics to files in a shared directory, which
+            # must start out empty
+            metrics_dir = os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", tempfile.mkdtemp(prefix="paper-metrics-"))
+            for path in glob.glob(os.path.join(metrics_dir, "*.db")):
+                os.remove(path)
+            # Hand over to the uvicorn command line: workers spawned from this
+            # script would import it a second time as __mp_main__
+            os.execv(sys.executable, [
+                sys.executable, "-m", "uvicorn", "main:app", "--host", "0.0.0.0", "--port", "8000", "--workers", str(workers)
+            ])
+        else:
+            uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
@@ -1,1205 +1,1444 @@
-// API endpoint
-const API_URL = 'http://localhost:8000';
-
-// Global variables
-let allFolders = [];
-let currentFolderId = null;
-const TRASH_FOLDER_ID = "trash"; // Update to use correct trash folder ID
-
-// Initialize Select2 for tags
-$(document).ready(() => {
-    // Initialize tag filters with Select2
-    $('#tagFilter').select2({
-        width: '100%',
-        placeholder: 'Select tags to filter...',
-        allowClear: true
-    });
-    
-    $('#tags, #modal_tags').each(function() {
-        $(this).select2({
-            tags: true,
-            tokenSeparators: [',', ' '],
-            placeholder: 'Add tags...',
-            dropdownParent: $(this).closest('.modal') // For modal instances
-        });
-    });
-    
-    // Load both papers and folders when the app starts
-    Promise.all([loadFolders(), loadDashboard()]);
-
-    // Add click event listeners for navigation
-    $("a.nav-link").click(function(e) {
-        e.preventDefault(); // Prevent default anchor behavior
-        const action = $(this).text().trim();
-        if (action === "Dashboard") {
-            showDashboard();
-        } else if (action === "Upload Paper") {
-            showUploadForm();
-        }
-    });
-
-    // Set up the folder form submission
-    $('#folderForm').submit(function(e) {
-        e.preventDefault();
-        saveFolder();
-    });
-
-    // Set up the move paper form submission
-    $('#movePaperForm').submit(function(e) {
-        e.preventDefault();
-        movePaper();
-    });
-});
-
-// Navigation functions
-function showDashboard() {
-    console.log("Showing dashboard");
-    $('#dashboard').show();
-    $('#uploadForm').hide();
-    loadDashboard();
-}
-
-function showUploadForm() {
-    console.log("Showing upload form");
-    $('#dashboard').hide();
-    $('#uploadForm').show();
-    loadTags();
-    updateFolderSelects();
-}
-
-// Folder Functions
-async function loadFolders() {
-    try {
-        const response = await fetch(`${API_URL}/folders/`);
-        if (!response.ok) {
-            throw new Error("Failed to load folders");
-        }
-        
-        const data = await response.json();
-        allFolders = data.folders || [];
-        
-        // Add Default Library if it doesn't exist
-        if (!allFolders.find(f => f.id === 'default')) {
-            allFolders.unshift({
-                id: 'default',
-                name: 'Default Library',
-                parent_id: null,
-                description: 'Default folder for papers'
-            });
-        }
-        
-        renderFolderTree();
-        updateFolderSelects();
-        
-        return data;
-    } catch (error) {
-        console.error('Error loading folders:', error);
-    }
-}
-
-function renderFolderTree() {
-    const container = $('#foldersContainer');
-    container.empty();
-    
-    // Always show Default Library first
-    const defaultLibrary = allFolders.find(f => f.id === 'default');
-    if (defaultLibrary) {
-        container.append(renderFolder(defaultLibrary));
-    }
-    
-    // Find root level folders (no parent)
-    const rootFolders = allFolders.filter(folder => !folder.parent_id && folder.id !== 'default');
-    
-    // Render each root folder and its children
-    rootFolders.forEach(folder => {
-        container.append(renderFolder(folder));
-    });
-}
-
-function renderFolder(folder, isNested = false) {
-    // Find children of this folder
-    const children = allFolders.filter(f => f.parent_id === folder.id);
-    const hasChildren = children.length > 0;
-    
-    const folderHtml = $(`
-        <div class="folder-container" data-id="${folder.id}">
-            <div class="folder-item d-flex justify-content-between align-items-center" 
-                 data-id="${folder.id}"
-                 ondragover="handleDragOver(event)"
-                 ondragleave="handleDragLeave(event)"
-                 ondrop="handleDrop(event, '${folder.id}')">
-                <div onclick="openFolder('${folder.id}')" style="flex-grow: 1;">
-                    ${hasChildren ? 
-                      `<i class="bi bi-caret-right folder-toggle" onclick="toggleFolderChildren(event, '${folder.id}')"></i>` : 
-                      `<i class="bi bi-dash folder-toggle invisible"></i>`}
-                    <i class="bi bi-folder"></i>
-                    <span class="folder-name">${folder.name}</span>
-                </div>
-                <div class="folder-actions">
-                    <i class="bi bi-pencil-square mx-1" onclick="editFolder(event, '${folder.id}')"></i>
-                    <i class="bi bi-trash mx-1" onclick="deleteFolder(event, '${folder.id}')"></i>
-                </div>
-            </div>
-            ${hasChildren ? 
-              `<div class="nested-folders" id="children-${folder.id}" style="display: none;"></div>` : 
-              ''}
-        </div>
-    `);
-    
-    // Recursively add children
-    if (hasChildren) {
-        const childrenContainer = folderHtml.find(`#children-${folder.id}`);
-        children.forEach(child => {
-            childrenContainer.append(renderFolder(child, true));
-        });
-    }
-    
-    return folderHtml;
-}
-
-function toggleFolderChildren(event, folderId) {
-    event.stopPropagation();
-    const childrenContainer = $(`#children-${folderId}`);
-    const toggleIcon = $(event.target);
-    
-    if (childrenContainer.is(':visible')) {
-        childrenContainer.hide();
-        toggleIcon.removeClass('bi-caret-down').addClass('bi-caret-right');
-    } else {
-        childrenContainer.show();
-        toggleIcon.removeClass('bi-caret-right').addClass('bi-caret-down');
-    }
-}
-
-function openFolder(folderId) {
-    // Set active folder
-    $('.folder-item').removeClass('active');
-    $(`.folder-item[data-id="${folderId}"]`).addClass('active');
-    
-    currentFolderId = folderId;
-    
-    // Find the folder name
-    const folder = allFolders.find(f => f.id === folderId);
-    $('#currentViewTitle').text(folder ? folder.name : 'All Papers');
-    
-    // Show empty trash button if in trash folder, otherwise show upload button
-    const actionButton = folderId === TRASH_FOLDER_ID ? 
-        `<button class="btn btn-outline-danger" onclick="emptyTrash()">
-            <i class="bi bi-trash3"></i> Empty Trash
-        </button>` :
-        `<button class="btn btn-outline-primary" type="button" onclick="handleFileUpload()">
-            <i class="bi bi-upload"></i> Upload
-        </button>`;
-    
-    $('.col.text-end').html(actionButton);
-    
-    // Load papers in this folder
-    loadPapersInFolder(folderId);
-}
-
-// Add empty trash function
-async function emptyTrash() {
-    if (!confirm('Are you sure you want to empty the trash? This will permanently delete all papers in the trash folder. This action cannot be undone.')) {
-        return;
-    }
-    
-    try {
-        // Get all papers in trash
-        const response = await fetch(`${API_URL}/papers/by-folder/${TRASH_FOLDER_ID}`);
-        if (!response.ok) {
-            throw new Error("Failed to load papers from trash");
-        }
-        
-        const data = await response.json();
-        const papers = data.papers || [];
-        
-        // Delete each paper permanently
-        for (const paper of papers) {
-            await fetch(`${API_URL}/papers/${paper.filename}?soft_delete=false`, {
-                method: 'DELETE'
-            });
-        }
-        
-        // Refresh the current view
-        loadPapersInFolder(TRASH_FOLDER_ID);
-        
-        alert('Trash emptied successfully');
-    } catch (error) {
-        console.error('Error emptying trash:', error);
-        alert('Failed to empty trash: ' + error.message);
-    }
-}
-
-function showAllPapers() {
-    // Reset active folder
-    $('.folder-item').removeClass('active');
-    $('#allPapersFolder').addClass('active');
-    
-    currentFolderId = null;
-    $('#currentViewTitle').text('All Papers');
-    
-    // Load all papers
-    loadDashboard();
-}
-
-async function loadPapersInFolder(folderId) {
-    try {
-        const response = await fetch(`${API_URL}/papers/by-folder/${folderId}`);
-        if (!response.ok) {
-            throw new Error("Failed to load papers in folder");
-        }
-        
-        const data = await response.json();
-        updatePapersList(data.papers);
-    } catch (error) {
-        console.error('Error loading papers in folder:', error);
-    }
-}
-
-function showCreateFolderModal() {
-    // Reset the form
-    $('#folderForm')[0].reset();
-    $('#folderId').val('');
-    $('#folderModalTitle').text('Create New Folder');
-    
-    // Update parent folder select
-    updateParentFolderSelect();
-    
-    // Show the modal
-    new bootstrap.Modal('#folderModal').show();
-}
-
-function editFolder(event, folderId) {
-    event.stopPropagation();
-    
-    // Find the folder data
-    const folder = allFolders.find(f => f.id === folderId);
-    if (!folder) return;
-    
-    // Fill the form
-    $('#folderId').val(folder.id);
-    $('#folderName').val(folder.name);
-    $('#folderDescription').val(folder.description);
-    $('#folderModalTitle').text('Edit Folder');
-    
-    // Update parent folder select, excluding self and children
-    updateParentFolderSelect(folderId);
-    $('#parentFolder').val(folder.parent_id || '');
-    
-    // Show the modal
-    new bootstrap.Modal('#folderModal').show();
-}
-
-function updateParentFolderSelect(excludeFolderId = null) {
-    const select = $('#parentFolder');
-    select.find('option:not(:first)').remove();
-    
-    // Function to check if a folder is a child of another
-    function isChildOf(childId, parentId) {
-        if (childId === parentId) return true;
-        
-        const folder = allFolders.find(f => f.id === childId);
-        if (!folder || !folder.parent_id) return false;
-        
-        return isChildOf(folder.parent_id, parentId);
-    }
-    
-    // Add all folders except the one being edited and its children
-    allFolders.forEach(folder => {
-        if (!excludeFolderId || !isChildOf(folder.id, excludeFolderId)) {
-            select.append(`<option value="${folder.id}">${folder.name}</option>`);
-        }
-    });
-}
-
-function updateFolderSelects() {
-    // Update folder selects in forms
-    const selects = ['#folderSelect', '#movePaperFolder', '#modal_folderSelect'];
-    
-    selects.forEach(selector => {
-        const select = $(selector);
-        select.empty();
-        
-        // Add "Default Library" as the first option, this is the true default folder
-        select.append(`<option value="default">Default Library</option>`);
-        
-        // Add "Current Folder" option if we have a current folder that's not default or trash
-        if (currentFolderId && currentFolderId !== 'default' && currentFolderId !== TRASH_FOLDER_ID) {
-            const currentFolder = allFolders.find(f => f.id === currentFolderId);
-            if (currentFolder) {
-                select.append(`<option value="${currentFolderId}">Current Folder (${currentFolder.name})</option>`);
-            }
-        }
-        
-        // Add all folders except trash
-        allFolders.forEach(folder => {
-            // Skip default (already added), trash, and the current folder (already added if applicable)
-            if (folder.id !== 'default' && folder.id !== TRASH_FOLDER_ID && folder.id !== currentFolderId) {
-                select.append(`<option value="${folder.id}">${folder.name}</option>`);
-            }
-        });
-    });
-}
-
-async function saveFolder() {
-    const folderId = $('#folderId').val();
-    const isNew = !folderId;
-    
-    const folderData = {
-        name: $('#folderName').val(),
-        parent_id: $('#parentFolder').val() || null,
-        description: $('#folderDescription').val() || ""
-    };
-    
-    try {
-        let response;
-        
-        if (isNew) {
-            // Create new folder
-            response = await fetch(`${API_URL}/folders/`, {
-                method: 'POST',
-                headers: {
-                    'Content-Type': 'application/json'
-                },
-                body: JSON.stringify(folderData)
-            });
-        } else {
-            // Update existing folder
-            response = await fetch(`${API_URL}/folders/${folderId}`, {
-                method: 'PUT',
-                headers: {
-                    'Content-Type': 'application/json'
-                },
-                body: JSON.stringify(folderData)
-            });
-        }
-
-        if (response.status === 409) {
-            // Handle duplicate folder name error
-            alert('A folder with this name already exists. Please choose a different name.');
-            return;
-        }
-        
-        if (!response.ok) {
-            const errorData = await response.json();
-            throw new Error(errorData.detail || (isNew ? "Failed to create folder" : "Failed to update folder"));
-        }
-        
-        // Reload folders
-        await loadFolders();
-        
-        // Close the modal
-        bootstrap.Modal.getInstance('#folderModal').hide();
-        
-        // Show success message
-        alert(isNew ? "Folder created successfully" : "Folder updated successfully");
-    } catch (error) {
-        console.error('Error saving folder:', error);
-        alert('Failed to save folder: ' + error.message);
-    }
-}
-
-async function deleteFolder(event, folderId) {
-    event.stopPropagation();
-    
-    if (!confirm("Are you sure you want to delete this folder? Papers inside will be moved to Trash folder.")) {
-        return;
-    }
-    
-    try {
-        // First, get all papers in the folder
-        const papersResponse = await fetch(`${API_URL}/papers/by-folder/${folderId}`);
-        if (!papersResponse.ok) {
-            throw new Error("Failed to get papers in folder");
-        }
-        
-        const papersData = await papersResponse.json();
-        const papers = papersData.papers || [];
-        
-        // Move each paper to trash while preserving original folder info
-        for (const paper of papers) {
-            const moveResponse = await fetch(`${API_URL}/papers/${paper.filename}/move?folder_id=${TRASH_FOLDER_ID}&original_folder_id=${folderId}`, {
-                method: 'PUT',
-                headers: {
-                    'Content-Type': 'application/json'
-                }
-            });
-            
-            if (!moveResponse.ok) {
-                throw new Error(`Failed to move paper ${paper.filename} to trash`);
-            }
-        }
-        
-        // Now delete the folder
-        const response = await fetch(`${API_URL}/folders/${folderId}`, {
-            method: 'DELETE'
-        });
-        
-        if (!response.ok) {
-            throw new Error("Failed to delete folder");
-        }
-        
-        // Reload folders
-        await loadFolders();
-        
-        // If deleted folder was current folder, show all papers
-        if (currentFolderId === folderId) {
-            showAllPapers();
-        }
-        
-        // Show success message
-        alert("Folder deleted successfully");
-    } catch (error) {
-        console.error('Error deleting folder:', error);
-        alert('Failed to delete folder: ' + error.message);
-    }
-}
-
-function showMovePaperModal(filename) {
-    $('#movePaperFilename').val(filename);
-    updateFolderSelects();
-    new bootstrap.Modal('#movePaperModal').show();
-}
-
-async function movePaper() {
-    const filename = $('#movePaperFilename').val();
-    const folderId = $('#movePaperFolder').val() || null;
-    
-    console.log("Moving paper:", filename, "to folder:", folderId);
-    
-    try {
-        // Construct URL with folder_id as a query parameter
-        let url = `${API_URL}/papers/${filename}/move`;
-        if (folderId !== null) {
-            url += `?folder_id=${folderId}`;
-        }
-        
-        console.log("Request URL:", url);
-        
-        const response = await fetch(url, {
-            method: 'PUT',
-            headers: {
-                'Content-Type': 'application/json'
-            }
-        });
-        
-        if (!response.ok) {
-            const errorData = await response.text();
-            console.error("Server response:", errorData);
-            throw new Error(`Failed to move paper: ${errorData}`);
-        }
-        
-        // Close the modal
-        bootstrap.Modal.getInstance('#movePaperModal').hide();
-        
-        // Refresh the current view
-        if (currentFolderId) {
-            loadPapersInFolder(currentFolderId);
-        } else {
-            loadDashboard();
-        }
-        
-        // Show success message
-        alert("Paper moved successfully");
-    } catch (error) {
-        console.error('Error moving paper:', error);
-        alert('Failed to move paper: ' + error.message);
-    }
-}
-
-// Drag and drop functions
-function handleDragOver(event) {
-    event.preventDefault();
-    $(event.currentTarget).addClass('drag-over');
-}
-
-function handleDragLeave(event) {
-    $(event.currentTarget).removeClass('drag-over');
-}
-
-function handleDrop(event, folderId) {
-    event.preventDefault();
-    $(event.currentTarget).removeClass('drag-over');
-    
-    const filename = event.dataTransfer.getData("text");
-    if (filename) {
-        movePaperToFolder(filename, folderId);
-    }
-}
-
-async function movePaperToFolder(filename, folderId) {
-    try {
-        // Get the paper's current metadata to check if it's being restored from trash
-        const metadataResponse = await fetch(`${API_URL}/papers/${filename}/metadata`);
-        const metadata = await metadataResponse.json();
-        
-        // If restoring from trash, try to use original folder, otherwise show warning
-        let targetFolderId = folderId;
-        if (metadata.folder_id === 'trash') {
-            // Check if original folder still exists
-            const foldersResponse = await fetch(`${API_URL}/folders/`);
-            const foldersData = await foldersResponse.json();
-            const originalFolderExists = foldersData.folders.some(f => f.id === metadata.original_folder_id);
-            
-            if (metadata.original_folder_id && originalFolderExists) {
-                targetFolderId = metadata.original_folder_id;
-            } else {
-                // Show warning confirmation dialog before moving to Default folder
-                const paperTitle = metadata.title || filename;
-                const confirmMove = confirm(`The original folder for "${paperTitle}" no longer exists. Do you want to restore it to Default Library instead? Click Cancel to abort restoration.`);
-                
-                if (!confirmMove) {
-                    return; // User cancelled the operation
-                }
-                targetFolderId = 'default';
-            }
-        }
-
-        // Construct URL with folder_id as a query parameter
-        let url = `${API_URL}/papers/${filename}/move`;
-        if (targetFolderId !== null) {
-            url += `?folder_id=${targetFolderId}`;
-        }
-        
-        const response = await fetch(url, {
-            method: 'PUT',
-            headers: {
-                'Content-Type': 'application/json'
-            }
-        });
-        
-        if (!response.ok) {
-            throw new Error("Failed to move paper");
-        }
-        
-        // Refresh the current view
-        if (currentFolderId) {
-            loadPapersInFolder(currentFolderId);
-        } else {
-            loadDashboard();
-        }
-    } catch (error) {
-        console.error('Error moving paper:', error);
-        alert('Failed to move paper: ' + error.message);
-    }
-}
-
-// Load dashboard data
-async function loadDashboard() {
-    try {
-        const [statsResponse, papersResponse] = await Promise.all([
-            fetch(`${API_URL}/stats`),
-            fetch(`${API_URL}/papers/`)
-        ]);
-        
-        if (!statsResponse.ok || !papersResponse.ok) {
-            throw new Error("Failed to fetch data");
-        }
-        
-        const stats = await statsResponse.json();
-        const papers = await papersResponse.json();
-        
-        console.log("Dashboard data loaded:", { stats, papers });
-        
-        updateStats(stats);
-        // Filter out papers that are in the trash folder
-        const nonTrashedPapers = papers.papers.filter(paper => paper.folder_id !== TRASH_FOLDER_ID);
-        updatePapersList(nonTrashedPapers);
-        updateFilters(stats);
-    } catch (error) {
-        console.error('Error loading dashboard:', error);
-        // Continue showing the page with empty data rather than alerting
-    }
-}
-
-// Update statistics
-function updateStats(stats) {
-    $('#totalPapers').text(stats.total_papers);
-    $('#totalCategories').text(Object.keys(stats.categories).length);
-    $('#totalTags').text(stats.tags.length);
-    
-    const years = Object.keys(stats.years).map(Number).sort();
-    if (years.length > 0) {
-        $('#yearsSpan').text(`${Math.min(...years)} - ${Math.max(...years)}`);
-    }
-}
-
-// Update papers list
-function updatePapersList(papers) {
-    const papersList = $('#papersList');
-    papersList.empty();
-    
-    if (!papers || papers.length === 0) {
-        papersList.append('<div class="col-12"><p class="text-muted">No papers found</p></div>');
-        return;
-    }
-    
-    papers.forEach(paper => {
-        // Parse tags if they're stored as JSON string
-        let tags = [];
-        if (typeof paper.tags === 'string') {
-            try {
-                tags = JSON.parse(paper.tags);
-            } catch (e) {
-                console.warn('Error parsing tags:', e);
-            }
-        } else if (Array.isArray(paper.tags)) {
-            tags = paper.tags;
-        }
-        
-        const isInTrash = paper.folder_id === TRASH_FOLDER_ID;
-        
-        // Create card HTML
-        const card = $(`
-            <div class="col-md-4 mb-4">
-                <div class="card paper-card h-100" draggable="true" ondragstart="event.dataTransfer.setData('text', '${paper.filename}')">
-                    <div class="card-body">
-                        <h5 class="card-title">${paper.title || paper.filename}</h5>
-                        <p class="card-text">
-                            <small class="text-muted">${paper.authors || ''}</small><br>
-                            <small class="text-muted">${paper.year || 'Year not specified'}</small>
-                        </p>
-                        <div class="tags-container mb-2">
-                            ${tags.map(tag => `<span class="badge bg-secondary me-1">${tag}</span>`).join('')}
-                        </div>
-                        ${paper.category ? `<span class="badge bg-primary">${paper.category}</span>` : ''}
-                        
-                        ${paper.folder_id ? `
-                        <br><small class="mt-2 d-block">
-                            <i class="bi bi-folder-fill"></i> ${getFolderName(paper.folder_id)}
-                        </small>` : ''}
-                    </div>
-                    <div class="card-footer">
-                        <button class="btn btn-sm btn-primary" onclick="viewPaper('${paper.filename}')">View</button>
-                        <button class="btn btn-sm btn-secondary" onclick="editMetadata('${paper.filename}')">Edit</button>
-                        ${!isInTrash ? `
-                            <button class="btn btn-sm btn-info" onclick="showMovePaperModal('${paper.filename}')">Move</button>
-                            <button class="btn btn-sm btn-danger" onclick="deletePaper('${paper.filename}', false)">Delete</button>
-                        ` : `
-                            <button class="btn btn-sm btn-info" onclick="movePaperToFolder('${paper.filename}', null)">Restore</button>
-                            <button class="btn btn-sm btn-danger" onclick="deletePaper('${paper.filename}', true)">Delete Permanently</button>
-                        `}
-                    </div>
-                </div>
-            </div>
-        `);
-        
-        papersList.append(card);
-    });
-}
-
-function getFolderName(folderId) {
-    const folder = allFolders.find(f => f.id === folderId);
-    // If no folder is found, check if it's the Trash folder
-    if (!folder) {
-        if (folderId === TRASH_FOLDER_ID) {
-            return 'Trash';
-        }
-        if (!folderId) {
-            return 'Default Library';
-        }
-    }
-    return folder ? folder.name : 'Default Library';
-}
-
-// Update filters
-function updateFilters(stats) {
-    const categorySelect = $('#categoryFilter');
-    const tagSelect = $('#tagFilter');
-    
-    categorySelect.empty().append('<option value="">All Categories</option>');
-    Object.keys(stats.categories).forEach(category => {
-        categorySelect.append(`<option value="${category}">${category} (${stats.categories[category]})</option>`);
-    });
-    
-    tagSelect.empty();
-    stats.tags.forEach(tag => {
-        tagSelect.append(`<option value="${tag}">${tag}</option>`);
-    });
-}
-
-// Load existing tags for the upload form
-async function loadTags() {
-    try {
-        const response = await fetch(`${API_URL}/stats`);
-        const stats = await response.json();
-        
-        const tagsSelect = $('#tags');
-        tagsSelect.empty();
-        stats.tags.forEach(tag => {
-            tagsSelect.append(new Option(tag, tag));
-        });
-    } catch (error) {
-        console.error('Error loading tags:', error);
-    }
-}
-
-// Handle paper upload
-$('#modalUploadForm').submit(async function(e) {
-    e.preventDefault();
-    
-    // Get file specifically from the modal form
-    const files = $('#modal_pdfFile')[0].files;
-    
-    if (!files || files.length === 0) {
-        alert('Please select a file to upload');
-        return;
-    }
-    
-    // Show loading spinner and disable submit button
-    $('#uploadSpinner').show();
-    $('#uploadFormFields').css('opacity', '0.5');
-    $('#uploadSubmitBtn').prop('disabled', true);
-    
-    // Get folder ID from the hidden field (fix: was getting from wrong field)
-    const folderId = $('#modal_uploadFolderId').val();
-    
-    try {
-        // Handle multiple files (folder upload)
-        if (files.length > 1) {
-            for (let i = 0; i < files.length; i++) {
-                const file = files[i];
-                if (file.type === 'application/pdf') {
-                    await uploadSingleFile(file, folderId);
-                }
-            }
-        } else {
-            // Single file upload
-            await uploadSingleFile(files[0], folderId);
-        }
-        
-        // Close modal and refresh view
-        bootstrap.Modal.getInstance('#uploadModal').hide();
-        if (currentFolderId) {
-            loadPapersInFolder(currentFolderId);
-        } else {
-            loadDashboard();
-        }
-        
-        // Show success message
-        alert('Upload completed successfully');
-    } catch (error) {
-        console.error('Error during upload:', error);
-        alert('Upload failed: ' + error.message);
-    } finally {
-        // Hide loading spinner and enable submit button
-        $('#uploadSpinner').hide();
-        $('#uploadFormFields').css('opacity', '1');
-        $('#uploadSubmitBtn').prop('disabled', false);
-    }
-});
-
-async function uploadSingleFile(file, folderId) {
-    if (!file) {
-        throw new Error('No file selected');
-    }
-
-    const formData = new FormData();
-    formData.append('file', file);
-    
-    // Get values from the modal form specifically using the new IDs
-    const metadata = {
-        title: $('#modal_title').val() || file.name,
-        authors: $('#modal_authors').val(),
-        year: $('#modal_year').val() ? parseInt($('#modal_year').val()) : null,
-        category: $('#modal_category').val() || null,
-        tags: $('#modal_tags').val() || [],
-        abstract: $('#modal_abstract').val() || ""
-    };
-    
-    formData.append('metadata', JSON.stringify(metadata));
-    
-    // Add folder_id
-    if (folderId) {
-        formData.append('folder_id', folderId);
-    }
-
-    try {
-        const response = await fetch(`${API_URL}/papers/`, {
-            method: 'POST',
-            body: formData
-        });
-
-        if (response.status === 409) {
-            // File exists conflict
-            const error = await response.json();
-            
-            // Ask user for confirmation
-            const confirmOverride = confirm(
-                `A file with the name "${error.detail.filename}" already exists. Do you want to override it?\n\n` +
-                `Note: This will completely replace the existing file and its metadata.`
-            );
-            
-            if (confirmOverride) {
-                // Retry with override flag
-                formData.append('override', 'true');
-                const retryResponse = await fetch(`${API_URL}/papers/`, {
-                    method: 'POST',
-                    body: formData
-                });
-                
-                if (!retryResponse.ok) {
-                    const retryError = await retryResponse.json();
-                    throw new Error(retryError.detail || 'Upload failed');
-                }
-                
-                return retryResponse.json();
-            } else {
-                throw new Error('Upload cancelled by user');
-            }
-        }
-        
-        if (!response.ok) {
-            const error = await response.json();
-            throw new Error(error.detail || 'Upload failed');
-        }
-        
-        return response.json();
-    } catch (error) {
-        throw error;
-    }
-}
-
-// View paper
-async function viewPaper(filename) {
-    window.open(`${API_URL}/papers/${filename}`, '_blank');
-}
-
-// Edit metadata
-async function editMetadata(filename) {
-    try {
-        console.log('Fetching paper details for:', filename);
-        const response = await fetch(`${API_URL}/papers/${filename}/metadata`);
-        
-        if (!response.ok) {
-            const errorText = await response.text();
-            console.error('Server response:', response.status, errorText);
-            throw new Error(`Server returned ${response.status}: ${errorText}`);
-        }
-        
-        const paper = await response.json();
-        console.log('Received paper data:', paper);
-        
-        // Parse tags if they're stored as JSON string
-        let tags = [];
-        if (typeof paper.tags === 'string') {
-            try {
-                tags = JSON.parse(paper.tags);
-            } catch (e) {
-                console.warn('Error parsing tags:', e);
-            }
-        } else if (Array.isArray(paper.tags)) {
-            tags = paper.tags;
-        }
-        
-        // Load all available tags from stats
-        const statsResponse = await fetch(`${API_URL}/stats`);
-        const stats = await statsResponse.json();
-        const allTags = stats.tags;
-        
-        // Populate modal with paper details
-        $('#paperTitle').text(paper.title || filename);
-        
-        // Update the folder options
-        updateFolderSelects();
-        
-        // Add form for editing metadata
-        $('#paperDetails').html(`
-            <form id="editMetadataForm">
-                <input type="hidden" id="editFilename" value="${filename}">
-                <div class="mb-3">
-                    <label class="form-label">Title</label>
-                    <input type="text" class="form-control" id="editTitle" value="${paper.title || ''}">
-                </div>
-                <div class="mb-3">
-                    <label class="form-label">Authors</label>
-                    <input type="text" class="form-control" id="editAuthors" value="${paper.authors || ''}">
-                </div>
-                <div class="mb-3">
-                    <label class="form-label">Year</label>
-                    <input type="number" class="form-control" id="editYear" value="${paper.year || ''}">
-                </div>
-                <div class="mb-3">
-                    <label class="form-label">Folder</label>
-                    <select class="form-control" id="editFolder">
-                        <option value="">No folder</option>
-                        ${allFolders.map(folder => 
-                            `<option value="${folder.id}" ${paper.folder_id === folder.id ? 'selected' : ''}>
-                                ${folder.name}
-                            </option>`
-                        ).join('')}
-                    </select>
-                </div>
-                <div class="mb-3">
-                    <label class="form-label">Category</label>
-                    <input type="text" class="form-control" id="editCategory" value="${paper.category || ''}">
-                </div>
-                <div class="mb-3">
-                    <label class="form-label">Tags</label>
-                    <select class="form-control" id="editTags" multiple>
-                        ${allTags.map(tag => 
-                            `<option value="${tag}" ${tags.includes(tag) ? 'selected' : ''}>${tag}</option>`
-                        ).join('')}
-                    </select>
-                </div>
-                <div class="mb-3">
-                    <label class="form-label">Abstract</label>
-                    <textarea class="form-control" id="editAbstract" rows="3">${paper.abstract || ''}</textarea>
-                </div>
-                <button type="submit" class="btn btn-primary">Save Changes</button>
-            </form>
-        `);
-        
-        // Initialize Select2 for tags in modal with all existing tags
-        $('#editTags').select2({
-            tags: true,
-            tokenSeparators: [',', ' '],
-            dropdownParent: $('#paperDetailsModal')
-        });
-        
-        // Set up form submission handler
-        $('#editMetadataForm').submit(async function(e) {
-            e.preventDefault();
-            
-            const updatedMetadata = {
-                title: $('#editTitle').val(),
-                authors: $('#editAuthors').val(),
-                year: $('#editYear').val() ? parseInt($('#editYear').val()) : null,
-                category: $('#editCategory').val() || null,
-                tags: $('#editTags').val() || [],
-                abstract: $('#editAbstract').val() || "",
-                folder_id: $('#editFolder').val() || null
-            };
-            
-            try {
-                const response = await fetch(`${API_URL}/papers/${filename}/metadata`, {
-                    method: 'PUT',
-                    headers: {
-                        'Content-Type': 'application/json'
-                    },
-                    body: JSON.stringify(updatedMetadata)
-                });
-                
-                if (!response.ok) {
-                    const errorData = await response.text();
-                    console.error('Update response:', response.status, errorData);
-                    throw new Error(`Update failed: ${errorData}`);
-                }
-                
-                alert('Metadata updated successfully');
-                bootstrap.Modal.getInstance('#paperDetailsModal').hide();
-                
-                // Refresh the current view
-                if (currentFolderId) {
-                    loadPapersInFolder(currentFolderId);
-                } else {
-                    loadDashboard();
-                }
-            } catch (error) {
-                console.error('Error updating metadata:', error);
-                alert('Failed to update metadata: ' + error.message);
-            }
-        });
-        
-        // Show modal
-        new bootstrap.Modal('#paperDetailsModal').show();
-    } catch (error) {
-        console.error('Error loading paper details:', error);
-        alert('Failed to load paper details: ' + error.message);
-    }
-}
-
-// Delete paper
-async function deletePaper(filename, isTrashItem = false) {
-    const message = isTrashItem 
-        ? 'Are you sure you want to permanently delete this paper? This action cannot be undone.'
-        : 'Move this paper to trash?';
-        
-    if (!confirm(message)) {
-        return;
-    }
-    
-    try {
-        const response = await fetch(`${API_URL}/papers/${filename}?soft_delete=${!isTrashItem}`, {
-            method: 'DELETE'
-        });
-        
-        if (response.ok) {
-            alert(isTrashItem ? 'Paper permanently deleted' : 'Paper moved to trash');
-            
-            // Refresh the current view
-            if (currentFolderId) {
-                loadPapersInFolder(currentFolderId);
-            } else {
-                loadDashboard();
-            }
-        } else {
-            throw new Error('Delete failed');
-        }
-    } catch (error) {
-        console.error('Error deleting paper:', error);
-        alert('Failed to delete paper');
-    }
-}
-
-// Search functionality
-$('#searchInput').on('input', function() {
-    const query = $(this).val();
-    if (query.length >= 3) {
-        searchPapers(query);
-    } else if (query.length === 0) {
-        // Refresh the current view
-        if (currentFolderId) {
-            loadPapersInFolder(currentFolderId);
-        } else {
-            loadDashboard();
-        }
-    }
-});
-
-async function searchPapers(query) {
-    try {
-        const response = await fetch(`${API_URL}/search/?query=${encodeURIComponent(query)}`);
-        const results = await response.json();
-        // Filter out papers that are in trash before updating the display
-        const nonTrashedResults = results.results.filter(r => r.metadata.folder_id !== TRASH_FOLDER_ID);
-        updatePapersList(nonTrashedResults.map(r => r.metadata));
-    } catch (error) {
-        console.error('Error searching papers:', error);
-    }
-}
-
-// Filter handlers
-$('#categoryFilter').change(function() {
-    const category = $(this).val();
-    if (category) {
-        filterByCategory(category);
-    } else {
-        // Refresh the current view
-        if (currentFolderId) {
-            loadPapersInFolder(currentFolderId);
-        } else {
-            loadDashboard();
-        }
-    }
-});
-
-$('#tagFilter').change(function() {
-    const selectedTags = $(this).val();
-    if (selectedTags && selectedTags.length > 0) {
-        filterByMultipleTags(selectedTags);
-    } else {
-        // Refresh the current view
-        if (currentFolderId) {
-            loadPapersInFolder(currentFolderId);
-        } else {
-            loadDashboard();
-        }
-    }
-});
-
-async function filterByCategory(category) {
-    try {
-        const response = await fetch(`${API_URL}/papers/by-category/${encodeURIComponent(category)}`);
-        const results = await response.json();
-        // Filter out papers that are in trash folder
-        const nonTrashedPapers = results.papers.filter(paper => paper.folder_id !== TRASH_FOLDER_ID);
-        updatePapersList(nonTrashedPapers);
-    } catch (error) {
-        console.error('Error filtering by category:', error);
-    }
-}
-
-async function filterByMultipleTags(tags) {
-    try {
-        // Get all papers first
-        const response = await fetch(`${API_URL}/papers/`);
-        const data = await response.json();
-        
-        // Filter papers that have ANY of the selected tags (OR logic) and are not in trash
-        const filteredPapers = data.papers.filter(paper => {
-            // Skip papers in trash
-            if (paper.folder_id === TRASH_FOLDER_ID) {
-                return false;
-            }
-            
-            let paperTags = [];
-            try {
-                paperTags = typeof paper.tags === 'string' ? JSON.parse(paper.tags) : paper.tags;
-            } catch (e) {
-                console.warn('Error parsing tags:', e);
-                return false;
-            }
-            return tags.some(tag => paperTags.includes(tag)); // Changed from every() to some()
-        });
-        
-        updatePapersList(filteredPapers);
-    } catch (error) {
-        console.error('Error filtering by tags:', error);
-    }
-}
-
-// Reset all filters
-$('#resetFilters').click(function() {
-    // Reset search input
-    $('#searchInput').val('');
-    
-    // Reset category filter
-    $('#categoryFilter').val('').trigger('change');
-    
-    // Reset tag filter
-    $('#tagFilter').val('').trigger('change');
-    
-    // Refresh the current view
-    if (currentFolderId) {
-        loadPapersInFolder(currentFolderId);
-    } else {
-        loadDashboard();
-    }
-});
-
-// Upload handling functions
-function handleFileUpload() {
-    // Clear the form
-    $('#modalUploadForm')[0].reset();
-    
-    // Store the current folder ID in the hidden input
-    const folderToUse = currentFolderId || 'default';
-    $('#modal_uploadFolderId').val(folderToUse);
-    
-    // Update folder select options
-    updateFolderSelects();
-    
-    // Now set the selected option to match the current folder
-    $('#modal_folderSelect').val(folderToUse);
-    
-    // Initialize Select2 for tags
-    $('#modal_tags').select2({
-        tags: true,
-        tokenSeparators: [',', ' '],
-        dropdownParent: $('#uploadModal'),
-        placeholder: 'Add tags...'
-    });
-    
-    // Load existing tags
-    loadTagsForModal();
-    
-    // Show the upload modal
-    new bootstrap.Modal('#uploadModal').show();
-}
-
-// New function to load tags specifically for the modal
-async function loadTagsForModal() {
-    try {
-        const response = await fetch(`${API_URL}/stats`);
-        const stats = await response.json();
-        
-        const tagsSelect = $('#modal_tags');
-        tagsSelect.empty();
-        stats.tags.forEach(tag => {
-            tagsSelect.append(new Option(tag, tag));
-        });
-    } catch (error) {
-        console.error('Error loading tags:', error);
-    }
+// API endpoint
+const API_URL = 'http://localhost:8000';
+
+// Global variables
+let allFolders = [];
+let currentFolderId = null;
+const TRASH_FOLDER_ID = "trash"; // Update to use correct trash folder ID
+
+// Paper lists are fetched a page at a time, with only the fields the cards render
+const PAGE_SIZE = 60;
+const LIST_FIELDS = 'filename,title,authors,year,tags,category,folder_id';
+let currentListUrl = null;
+let nextOffset = null;
+// Which papers belong in the current listing and the stats shown with it, so
+// changes can be applied in place (no filter for search and related results)
+let currentListFilter = null;
+let currentStatsParams = {};
+
+// Version of the library the page shows. The change feed advances it with the
+// papers and folders changed since, pushed by the server or fetched after our
+// own writes, instead of reloading the listing, stats and folders
+let libraryVersion = null;
+let statsRefreshTimer = null;
+
+// Initialize Select2 for tags
+$(document).ready(() => {
+    // Initialize tag filters with Select2
+    $('#tagFilter').select2({
+        width: '100%',
+        placeholder: 'Select tags to filter...',
+        allowClear: true
+    });
+    
+    $('#tags, #modal_tags').each(function() {
+        $(this).select2({
+            tags: true,
+            tokenSeparators: [',', ' '],
+            placeholder: 'Add tags...',
+            dropdownParent: $(this).closest('.modal') // For modal instances
+        });
+    });
+    
+    // Load both papers and folders when the app starts, then follow their changes
+    startChangeFeed();
+
+    // Add click event listeners for navigation
+    $("a.nav-link").click(function(e) {
+        e.preventDefault(); // Prevent default anchor behavior
+        const action = $(this).text().trim();
+        if (action === "Dashboard") {
+            showDashboard();
+        } else if (action === "Upload Paper") {
+            showUploadForm();
+        }
+    });
+
+    // Set up the folder form submission
+    $('#folderForm').submit(function(e) {
+        e.preventDefault();
+        saveFolder();
+    });
+
+    // Set up the move paper form submission
+    $('#movePaperForm').submit(function(e) {
+        e.preventDefault();
+        movePaper();
+    });
+});
+
+// Navigation functions
+function showDashboard() {
+    console.log("Showing dashboard");
+    $('#dashboard').show();
+    $('#uploadForm').hide();
+    loadDashboard();
+}
+
+function showUploadForm() {
+    console.log("Showing upload form");
+    $('#dashboard').hide();
+    $('#uploadForm').show();
+    loadTags();
+    updateFolderSelects();
+}
+
+// Folder Functions
+async function loadFolders() {
+    try {
+        const response = await fetch(`${API_URL}/folders/`);
+        if (!response.ok) {
+            throw new Error("Failed to load folders");
+        }
+        
+        const data = await response.json();
+        allFolders = data.folders || [];
+        
+        // Add Default Library if it doesn't exist
+        if (!allFolders.find(f => f.id === 'default')) {
+            allFolders.unshift({
+                id: 'default',
+                name: 'Default Library',
+                parent_id: null,
+                description: 'Default folder for papers'
+            });
+        }
+        
+        renderFolderTree();
+        updateFolderSelects();
+        
+        return data;
+    } catch (error) {
+        console.error('Error loading folders:', error);
+    }
+}
+
+function renderFolderTree() {
+    const container = $('#foldersContainer');
+    container.empty();
+    
+    // Always show Default Library first
+    const defaultLibrary = allFolders.find(f => f.id === 'default');
+    if (defaultLibrary) {
+        container.append(renderFolder(defaultLibrary));
+    }
+    
+    // Find root level folders (no parent)
+    const rootFolders = allFolders.filter(folder => !folder.parent_id && folder.id !== 'default');
+    
+    // Render each root folder and its children
+    rootFolders.forEach(folder => {
+        container.append(renderFolder(folder));
+    });
+}
+
+function renderFolder(folder, isNested = false) {
+    // Find children of this folder
+    const children = allFolders.filter(f => f.parent_id === folder.id);
+    const hasChildren = children.length > 0;
+    
+    const folderHtml = $(`
+        <div class="folder-container" data-id="${folder.id}">
+            <div class="folder-item d-flex justify-content-between align-items-center" 
+                 data-id="${folder.id}"
+                 ondragover="handleDragOver(event)"
+                 ondragleave="handleDragLeave(event)"
+                 ondrop="handleDrop(event, '${folder.id}')">
+                <div onclick="openFolder('${folder.id}')" style="flex-grow: 1;">
+                    ${hasChildren ? 
+                      `<i class="bi bi-caret-right folder-toggle" onclick="toggleFolderChildren(event, '${folder.id}')"></i>` : 
+                      `<i class="bi bi-dash folder-toggle invisible"></i>`}
+                    <i class="bi bi-folder"></i>
+                    <span class="folder-name">${folder.name}</span>
+                </div>
+                <div class="folder-actions">
+                    <i class="bi bi-pencil-square mx-1" onclick="editFolder(event, '${folder.id}')"></i>
+                    <i class="bi bi-trash mx-1" onclick="deleteFolder(event, '${folder.id}')"></i>
+                </div>
+            </div>
+            ${hasChildren ? 
+              `<div class="nested-folders" id="children-${folder.id}" style="display: none;"></div>` : 
+              ''}
+        </div>
+    `);
+    
+    // Recursively add children
+    if (hasChildren) {
+        const childrenContainer = folderHtml.find(`#children-${folder.id}`);
+        children.forEach(child => {
+            childrenContainer.append(renderFolder(child, true));
+        });
+    }
+    
+    return folderHtml;
+}
+
+function toggleFolderChildren(event, folderId) {
+    event.stopPropagation();
+    const childrenContainer = $(`#children-${folderId}`);
+    const toggleIcon = $(event.target);
+    
+    if (childrenContainer.is(':visible')) {
+        childrenContainer.hide();
+        toggleIcon.removeClass('bi-caret-down').addClass('bi-caret-right');
+    } else {
+        childrenContainer.show();
+        toggleIcon.removeClass('bi-caret-right').addClass('bi-caret-down');
+    }
+}
+
+function openFolder(folderId) {
+    // Set active folder
+    $('.folder-item').removeClass('active');
+    $(`.folder-item[data-id="${folderId}"]`).addClass('active');
+    
+    currentFolderId = folderId;
+    
+    // Find the folder name
+    const folder = allFolders.find(f => f.id === folderId);
+    $('#currentViewTitle').text(folder ? folder.name : 'All Papers');
+    
+    // Show empty trash button if in trash folder, otherwise show upload button
+    const actionButton = folderId === TRASH_FOLDER_ID ? 
+        `<button class="btn btn-outline-danger" onclick="emptyTrash()">
+            <i class="bi bi-trash3"></i> Empty Trash
+        </button>` :
+        `<button class="btn btn-outline-primary" type="button" onclick="handleFileUpload()">
+            <i class="bi bi-upload"></i> Upload
+        </button>`;
+    
+    $('.col.text-end').html(actionButton);
+    
+    // Load papers in this folder
+    loadPapersInFolder(folderId);
+}
+
+// Add empty trash function
+async function emptyTrash() {
+    if (!confirm('Are you sure you want to empty the trash? This will permanently delete all papers in the trash folder. This action cannot be undone.')) {
+        return;
+    }
+    
+    try {
+        // Permanently delete every paper in the trash with one request
+        const response = await fetch(`${API_URL}/trash/`, {
+            method: 'DELETE'
+        });
+        if (!response.ok) {
+            throw new Error("Failed to empty trash");
+        }
+        
+        // Remove the deleted papers from the view
+        await syncChanges();
+        
+        alert('Trash emptied successfully');
+    } catch (error) {
+        console.error('Error emptying trash:', error);
+        alert('Failed to empty trash: ' + error.message);
+    }
+}
+
+function showAllPapers() {
+    // Reset active folder
+    $('.folder-item').removeClass('active');
+    $('#allPapersFolder').addClass('active');
+    
+    currentFolderId = null;
+    $('#currentViewTitle').text('All Papers');
+    
+    // Load all papers
+    loadDashboard();
+}
+
+async function loadPapersInFolder(folderId) {
+    try {
+        currentStatsParams = { folder_id: folderId };
+        const [stats] = await Promise.all([
+            fetchStats(currentStatsParams),
+            loadPaperPage(`${API_URL}/papers/by-folder/${folderId}`, false, paper => paper.folder_id === folderId)
+        ]);
+        updateStats(stats);
+    } catch (error) {
+        console.error('Error loading papers in folder:', error);
+    }
+}
+
+// Fetch the first page of a paper listing, or the next page when appending.
+// `includes` tells which papers belong in the listing as they change
+async function loadPaperPage(listUrl, append = false, includes = null) {
+    const offset = append ? nextOffset : 0;
+    const separator = listUrl.includes('?') ? '&' : '?';
+    const response = await fetch(`${listUrl}${separator}offset=${offset}&limit=${PAGE_SIZE}&fields=${LIST_FIELDS}`);
+    if (!response.ok) {
+        throw new Error("Failed to load papers");
+    }
+    
+    const data = await response.json();
+    currentListUrl = listUrl;
+    if (!append) {
+        currentListFilter = includes;
+    }
+    nextOffset = data.next_offset;
+    updatePapersList(data.papers, append);
+    return data;
+}
+
+async function loadMorePapers() {
+    if (currentListUrl === null || nextOffset === null) {
+        return;
+    }
+    try {
+        await loadPaperPage(currentListUrl, true);
+    } catch (error) {
+        console.error('Error loading more papers:', error);
+    }
+}
+
+function showCreateFolderModal() {
+    // Reset the form
+    $('#folderForm')[0].reset();
+    $('#folderId').val('');
+    $('#folderModalTitle').text('Create New Folder');
+    
+    // Update parent folder select
+    updateParentFolderSelect();
+    
+    // Show the modal
+    new bootstrap.Modal('#folderModal').show();
+}
+
+function editFolder(event, folderId) {
+    event.stopPropagation();
+    
+    // Find the folder data
+    const folder = allFolders.find(f => f.id === folderId);
+    if (!folder) return;
+    
+    // Fill the form
+    $('#folderId').val(folder.id);
+    $('#folderName').val(folder.name);
+    $('#folderDescription').val(folder.description);
+    $('#folderModalTitle').text('Edit Folder');
+    
+    // Update parent folder select, excluding self and children
+    updateParentFolderSelect(folderId);
+    $('#parentFolder').val(folder.parent_id || '');
+    
+    // Show the modal
+    new bootstrap.Modal('#folderModal').show();
+}
+
+function updateParentFolderSelect(excludeFolderId = null) {
+    const select = $('#parentFolder');
+    select.find('option:not(:first)').remove();
+    
+    // Function to check if a folder is a child of another
+    function isChildOf(childId, parentId) {
+        if (childId === parentId) return true;
+        
+        const folder = allFolders.find(f => f.id === childId);
+        if (!folder || !folder.parent_id) return false;
+        
+        return isChildOf(folder.parent_id, parentId);
+    }
+    
+    // Add all folders except the one being edited and its children
+    allFolders.forEach(folder => {
+        if (!excludeFolderId || !isChildOf(folder.id, excludeFolderId)) {
+            select.append(`<option value="${folder.id}">${folder.name}</option>`);
+        }
+    });
+}
+
+function updateFolderSelects() {
+    // Update folder selects in forms
+    const selects = ['#folderSelect', '#movePaperFolder', '#modal_folderSelect'];
+    
+    selects.forEach(selector => {
+        const select = $(selector);
+        select.empty();
+        
+        // Add "Default Library" as the first option, this is the true default folder
+        select.append(`<option value="default">Default Library</option>`);
+        
+        // Add "Current Folder" option if we have a current folder that's not default or trash
+        if (currentFolderId && currentFolderId !== 'default' && currentFolderId !== TRASH_FOLDER_ID) {
+            const currentFolder = allFolders.find(f => f.id === currentFolderId);
+            if (currentFolder) {
+                select.append(`<option value="${currentFolderId}">Current Folder (${currentFolder.name})</option>`);
+            }
+        }
+        
+        // Add all folders except trash
+        allFolders.forEach(folder => {
+            // Skip default (already added), trash, and the current folder (already added if applicable)
+            if (folder.id !== 'default' && folder.id !== TRASH_FOLDER_ID && folder.id !== currentFolderId) {
+                select.append(`<option value="${folder.id}">${folder.name}</option>`);
+            }
+        });
+    });
+}
+
+async function saveFolder() {
+    const folderId = $('#folderId').val();
+    const isNew = !folderId;
+    
+    const folderData = {
+        name: $('#folderName').val(),
+        parent_id: $('#parentFolder').val() || null,
+        description: $('#folderDescription').val() || ""
+    };
+    
+    try {
+        let response;
+        
+        if (isNew) {
+            // Create new folder
+            response = await fetch(`${API_URL}/folders/`, {
+                method: 'POST',
+                headers: {
+                    'Content-Type': 'application/json'
+                },
+                body: JSON.stringify(folderData)
+            });
+        } else {
+            // Update existing folder
+            response = await fetch(`${API_URL}/folders/${folderId}`, {
+                method: 'PUT',
+                headers: {
+                    'Content-Type': 'application/json'
+                },
+                body: JSON.stringify(folderData)
+            });
+        }
+
+        if (response.status === 409) {
+            // Handle duplicate folder name error
+            alert('A folder with this name already exists. Please choose a different name.');
+            return;
+        }
+        
+        if (!response.ok) {
+            const errorData = await response.json();
+            throw new Error(errorData.detail || (isNew ? "Failed to create folder" : "Failed to update folder"));
+        }
+        
+        // Apply the new or renamed folder
+        await syncChanges();
+        
+        // Close the modal
+        bootstrap.Modal.getInstance('#folderModal').hide();
+        
+        // Show success message
+        alert(isNew ? "Folder created successfully" : "Folder updated successfully");
+    } catch (error) {
+        console.error('Error saving folder:', error);
+        alert('Failed to save folder: ' + error.message);
+    }
+}
+
+async function deleteFolder(event, folderId) {
+    event.stopPropagation();
+    
+    if (!confirm("Are you sure you want to delete this folder and its subfolders? Papers inside will be moved to Trash folder.")) {
+        return;
+    }
+    
+    try {
+        // Delete the folder and its subfolders, the server moves their papers to trash
+        // (remembering their original folders) in a single update
+        const response = await fetch(`${API_URL}/folders/${folderId}?recursive=true`, {
+            method: 'DELETE'
+        });
+        
+        if (!response.ok) {
+            throw new Error("Failed to delete folder");
+        }
+        
+        // Apply the deleted folders and moved papers, leaving the folder if it was open
+        await syncChanges();
+        
+        // Show success message
+        alert("Folder deleted successfully");
+    } catch (error) {
+        console.error('Error deleting folder:', error);
+        alert('Failed to delete folder: ' + error.message);
+    }
+}
+
+function showMovePaperModal(filename) {
+    $('#movePaperFilename').val(filename);
+    updateFolderSelects();
+    new bootstrap.Modal('#movePaperModal').show();
+}
+
+async function movePaper() {
+    const filename = $('#movePaperFilename').val();
+    const folderId = $('#movePaperFolder').val() || null;
+    
+    console.log("Moving paper:", filename, "to folder:", folderId);
+    
+    try {
+        // Construct URL with folder_id as a query parameter
+        let url = `${API_URL}/papers/${filename}/move`;
+        if (folderId !== null) {
+            url += `?folder_id=${folderId}`;
+        }
+        
+        console.log("Request URL:", url);
+        
+        const response = await fetch(url, {
+            method: 'PUT',
+            headers: {
+                'Content-Type': 'application/json'
+            }
+        });
+        
+        if (!response.ok) {
+            const errorData = await response.text();
+            console.error("Server response:", errorData);
+            throw new Error(`Failed to move paper: ${errorData}`);
+        }
+        
+        // Close the modal
+        bootstrap.Modal.getInstance('#movePaperModal').hide();
+        
+        // Apply the move to the current view
+        await syncChanges();
+        
+        // Show success message
+        alert("Paper moved successfully");
+    } catch (error) {
+        console.error('Error moving paper:', error);
+        alert('Failed to move paper: ' + error.message);
+    }
+}
+
+// Drag and drop functions
+function handleDragOver(event) {
+    event.preventDefault();
+    $(event.currentTarget).addClass('drag-over');
+}
+
+function handleDragLeave(event) {
+    $(event.currentTarget).removeClass('drag-over');
+}
+
+function handleDrop(event, folderId) {
+    event.preventDefault();
+    $(event.currentTarget).removeClass('drag-over');
+    
+    const filename = event.dataTransfer.getData("text");
+    if (filename) {
+        movePaperToFolder(filename, folderId);
+    }
+}
+
+async function movePaperToFolder(filename, folderId) {
+    try {
+        // Get the paper's current metadata to check if it's being restored from trash
+        const metadataResponse = await fetch(`${API_URL}/papers/${filename}/metadata`);
+        const metadata = await metadataResponse.json();
+        
+        // If restoring from trash, try to use original folder, otherwise show warning
+        let targetFolderId = folderId;
+        if (metadata.folder_id === 'trash') {
+            // Check if original folder still exists, the change feed keeps allFolders current
+            const originalFolderExists = allFolders.some(f => f.id === metadata.original_folder_id);
+            
+            if (metadata.original_folder_id && originalFolderExists) {
+                targetFolderId = metadata.original_folder_id;
+            } else {
+                // Show warning confirmation dialog before moving to Default folder
+                const paperTitle = metadata.title || filename;
+                const confirmMove = confirm(`The original folder for "${paperTitle}" no longer exists. Do you want to restore it to Default Library instead? Click Cancel to abort restoration.`);
+                
+                if (!confirmMove) {
+                    return; // User cancelled the operation
+                }
+                targetFolderId = 'default';
+            }
+        }
+
+        // Construct URL with folder_id as a query parameter
+        let url = `${API_URL}/papers/${filename}/move`;
+        if (targetFolderId !== null) {
+            url += `?folder_id=${targetFolderId}`;
+        }
+        
+        const response = await fetch(url, {
+            method: 'PUT',
+            headers: {
+                'Content-Type': 'application/json'
+            }
+        });
+        
+        if (!response.ok) {
+            throw new Error("Failed to move paper");
+        }
+        
+        // Apply the move to the current view
+        await syncChanges();
+    } catch (error) {
+        console.error('Error moving paper:', error);
+        alert('Failed to move paper: ' + error.message);
+    }
+}
+
+// Load dashboard data
+async function loadDashboard() {
+    try {
+        // Papers in the trash folder are filtered out by the server
+        currentStatsParams = { exclude_trash: true };
+        const [stats, papers] = await Promise.all([
+            fetchStats(currentStatsParams),
+            loadPaperPage(`${API_URL}/papers/?exclude_trash=true`, false, paper => paper.folder_id !== TRASH_FOLDER_ID)
+        ]);
+        
+        console.log("Dashboard data loaded:", { stats, papers });
+        
+        updateStats(stats);
+        updateFilters(stats);
+    } catch (error) {
+        console.error('Error loading dashboard:', error);
+        // Continue showing the page with empty data rather than alerting
+    }
+}
+
+// Fetch paper counts, for the whole library or with the given filters
+async function fetchStats(params = {}) {
+    const response = await fetch(`${API_URL}/stats?${new URLSearchParams(params)}`);
+    if (!response.ok) {
+        throw new Error("Failed to fetch statistics");
+    }
+    return response.json();
+}
+
+// Update statistics
+function updateStats(stats) {
+    $('#totalPapers').text(stats.total_papers);
+    $('#totalCategories').text(Object.keys(stats.categories).length);
+    $('#totalTags').text(stats.tags.length);
+    
+    const years = Object.keys(stats.years).map(Number).sort();
+    if (years.length > 0) {
+        $('#yearsSpan').text(`${Math.min(...years)} - ${Math.max(...years)}`);
+    } else {
+        $('#yearsSpan').text('-');
+    }
+}
+
+// Update papers list
+function updatePapersList(papers, append = false) {
+    const papersList = $('#papersList');
+    papersList.find('.load-more-container').remove();
+    if (!append) {
+        papersList.empty();
+    }
+    
+    if (!append && (!papers || papers.length === 0)) {
+        papersList.append('<div class="col-12 no-papers"><p class="text-muted">No papers found</p></div>');
+        return;
+    }
+    
+    papers.forEach(paper => {
+        // Pages of a listing that changed since may repeat a paper
+        if (append && findPaperCard(paper.filename).length > 0) {
+            return;
+        }
+        papersList.append(paperCard(paper));
+    });
+    
+    // Offer the next page of the current listing, if there is one
+    if (nextOffset !== null && currentListUrl !== null) {
+        papersList.append(`
+            <div class="col-12 text-center mb-4 load-more-container">
+                <button class="btn btn-outline-secondary" onclick="loadMorePapers()">Load more</button>
+            </div>
+        `);
+    }
+}
+
+function findPaperCard(filename) {
+    return $('#papersList').children().filter((_, element) => element.dataset.filename === filename);
+}
+
+// Card for a paper in the listing
+function paperCard(paper) {
+    // Parse tags if they're stored as JSON string
+    let tags = [];
+    if (typeof paper.tags === 'string') {
+        try {
+            tags = JSON.parse(paper.tags);
+        } catch (e) {
+            console.warn('Error parsing tags:', e);
+        }
+    } else if (Array.isArray(paper.tags)) {
+        tags = paper.tags;
+    }
+    
+    const isInTrash = paper.folder_id === TRASH_FOLDER_ID;
+    
+    // Create card HTML
+    return $(`
+        <div class="col-md-4 mb-4" data-filename="${paper.filename}">
+            <div class="card paper-card h-100" draggable="true" ondragstart="event.dataTransfer.setData('text', '${paper.filename}')">
+                <img class="card-img-top paper-thumbnail" loading="lazy" alt="" src="${API_URL}/papers/${paper.filename}/thumbnail" onerror="this.remove()">
+                <div class="card-body">
+                    <h5 class="card-title">${paper.title || paper.filename}</h5>
+                    <p class="card-text">
+                        <small class="text-muted">${paper.authors || ''}</small><br>
+                        <small class="text-muted">${paper.year || 'Year not specified'}</small>
+                    </p>
+                    <div class="tags-container mb-2">
+                        ${tags.map(tag => `<span class="badge bg-secondary me-1">${tag}</span>`).join('')}
+                    </div>
+                    ${paper.category ? `<span class="badge bg-primary">${paper.category}</span>` : ''}
+                    
+                    ${paper.folder_id ? `
+                    <br><small class="mt-2 d-block">
+                        <i class="bi bi-folder-fill"></i> ${getFolderName(paper.folder_id)}
+                    </small>` : ''}
+                </div>
+                <div class="card-footer">
+                    <button class="btn btn-sm btn-primary" onclick="viewPaper('${paper.filename}')">View</button>
+                    <button class="btn btn-sm btn-secondary" onclick="editMetadata('${paper.filename}')">Edit</button>
+                    <button class="btn btn-sm btn-outline-primary" onclick="showRelatedPapers('${paper.filename}')">Related</button>
+                    ${!isInTrash ? `
+                        <button class="btn btn-sm btn-info" onclick="showMovePaperModal('${paper.filename}')">Move</button>
+                        <button class="btn btn-sm btn-danger" onclick="deletePaper('${paper.filename}', false)">Delete</button>
+                    ` : `
+                        <button class="btn btn-sm btn-info" onclick="movePaperToFolder('${paper.filename}', null)">Restore</button>
+                        <button class="btn btn-sm btn-danger" onclick="deletePaper('${paper.filename}', true)">Delete Permanently</button>
+                    `}
+                </div>
+            </div>
+        </div>
+    `);
+}
+
+function getFolderName(folderId) {
+    const folder = allFolders.find(f => f.id === folderId);
+    // If no folder is found, check if it's the Trash folder
+    if (!folder) {
+        if (folderId === TRASH_FOLDER_ID) {
+            return 'Trash';
+        }
+        if (!folderId) {
+            return 'Default Library';
+        }
+    }
+    return folder ? folder.name : 'Default Library';
+}
+
+// Update filters
+function updateFilters(stats) {
+    const categorySelect = $('#categoryFilter');
+    const tagSelect = $('#tagFilter');
+    
+    categorySelect.empty().append('<option value="">All Categories</option>');
+    Object.keys(stats.categories).forEach(category => {
+        categorySelect.append(`<option value="${category}">${category} (${stats.categories[category]})</option>`);
+    });
+    
+    tagSelect.empty();
+    stats.tags.forEach(tag => {
+        tagSelect.append(`<option value="${tag}">${tag}</option>`);
+    });
+}
+
+// Get the library's version, load the page, then apply the changes the server pushes
+async function startChangeFeed() {
+    try {
+        const response = await fetch(`${API_URL}/changes`);
+        if (response.ok) {
+            libraryVersion = (await response.json()).version;
+        }
+    } catch (error) {
+        console.error('Error starting the change feed:', error);
+    }
+    
+    await Promise.all([loadFolders(), loadDashboard()]);
+    
+    if (libraryVersion !== null) {
+        // EventSource reconnects by itself and resumes from the last version it got
+        const stream = new EventSource(`${API_URL}/changes/stream?since=${libraryVersion}&fields=${LIST_FIELDS}`);
+        stream.addEventListener('changes', event => applyChanges(JSON.parse(event.data)));
+    }
+}
+
+// Fetch and apply the changes since our version, e.g. right after a write
+async function syncChanges() {
+    if (libraryVersion === null) {
+        await loadFolders();
+        reloadCurrentView();
+        return;
+    }
+    try {
+        let feed;
+        do {
+            const response = await fetch(`${API_URL}/changes?since=${libraryVersion}&fields=${LIST_FIELDS}`);
+            if (!response.ok) {
+                throw new Error("Failed to fetch changes");
+            }
+            feed = await response.json();
+            applyChanges(feed);
+        } while (feed.more);
+    } catch (error) {
+        console.error('Error syncing changes:', error);
+    }
+}
+
+function reloadCurrentView() {
+    if (currentFolderId) {
+        loadPapersInFolder(currentFolderId);
+    } else {
+        loadDashboard();
+    }
+}
+
+function applyChanges(feed) {
+    if (feed.reset) {
+        // The server can't tell what changed since our version
+        libraryVersion = feed.version;
+        loadFolders();
+        reloadCurrentView();
+        return;
+    }
+    if (feed.version <= libraryVersion) {
+        return;
+    }
+    libraryVersion = feed.version;
+    
+    let foldersChanged = false;
+    let papersChanged = false;
+    feed.changes.forEach(change => {
+        if (change.type === 'folder') {
+            applyFolderChange(change.id, change.folder);
+            foldersChanged = true;
+        } else {
+            applyPaperChange(change.id, change.paper);
+            papersChanged = true;
+        }
+    });
+    
+    if (foldersChanged) {
+        renderFolderTree();
+        updateFolderSelects();
+        if (currentFolderId && currentFolderId !== TRASH_FOLDER_ID && !allFolders.find(f => f.id === currentFolderId)) {
+            showAllPapers();
+        } else if (currentFolderId) {
+            $(`.folder-item[data-id="${currentFolderId}"]`).addClass('active');
+        }
+    }
+    if (papersChanged) {
+        scheduleStatsRefresh();
+    }
+}
+
+function applyFolderChange(folderId, folder) {
+    const index = allFolders.findIndex(f => f.id === folderId);
+    if (folder === null) {
+        if (index >= 0) {
+            allFolders.splice(index, 1);
+        }
+    } else if (index >= 0) {
+        allFolders[index] = folder;
+    } else {
+        allFolders.push(folder);
+    }
+}
+
+// Update, add or remove a paper's card; `paper` is null once it was deleted
+function applyPaperChange(filename, paper) {
+    const papersList = $('#papersList');
+    const card = findPaperCard(filename);
+    const belongs = paper !== null && (currentListFilter !== null ? currentListFilter(paper) : card.length > 0);
+    
+    if (card.length > 0) {
+        if (belongs) {
+            card.replaceWith(paperCard(paper));
+            return;
+        }
+        card.remove();
+        // The papers after it moved up a place in the server's listing
+        if (nextOffset !== null) {
+            nextOffset -= 1;
+        }
+        if (papersList.children('[data-filename]').length === 0 && nextOffset === null) {
+            papersList.append('<div class="col-12 no-papers"><p class="text-muted">No papers found</p></div>');
+        }
+    } else if (belongs && nextOffset === null) {
+        // Listings are in upload order, so with more pages to load it shows up on a later one
+        papersList.find('.no-papers').remove();
+        papersList.append(paperCard(paper));
+    }
+}
+
+// Stats come from the server's aggregates, refreshed once per burst of changes
+function scheduleStatsRefresh() {
+    clearTimeout(statsRefreshTimer);
+    statsRefreshTimer = setTimeout(async () => {
+        try {
+            updateStats(await fetchStats(currentStatsParams));
+        } catch (error) {
+            console.error('Error refreshing statistics:', error);
+        }
+    }, 300);
+}
+
+// Load existing tags for the upload form
+async function loadTags() {
+    try {
+        const stats = await fetchStats();
+        
+        const tagsSelect = $('#tags');
+        tagsSelect.empty();
+        stats.tags.forEach(tag => {
+            tagsSelect.append(new Option(tag, tag));
+        });
+    } catch (error) {
+        console.error('Error loading tags:', error);
+    }
+}
+
+// Handle paper upload
+$('#modalUploadForm').submit(async function(e) {
+    e.preventDefault();
+    
+    // Get file specifically from the modal form
+    const files = $('#modal_pdfFile')[0].files;
+    
+    if (!files || files.length === 0) {
+        alert('Please select a file to upload');
+        return;
+    }
+    
+    // Show loading spinner and disable submit button
+    $('#uploadSpinner').show();
+    $('#uploadFormFields').css('opacity', '0.5');
+    $('#uploadSubmitBtn').prop('disabled', true);
+    
+    // Get folder ID from the hidden field (fix: was getting from wrong field)
+    const folderId = $('#modal_uploadFolderId').val();
+    
+    try {
+        let message = 'Upload completed successfully';
+        
+        // Handle multiple files (folder upload) with a single background ingestion job
+        if (files.length > 1 || files[0].name.toLowerCase().endsWith('.zip')) {
+            const job = await uploadBulkFiles(files, folderId);
+            if (job.failed > 0 || job.skipped > 0) {
+                message = `${job.succeeded} of ${job.total} papers uploaded (${job.failed} failed, ${job.skipped} skipped as duplicates)`;
+            }
+        } else {
+            // Single file upload, an identical paper is not stored twice
+            const result = await uploadSingleFile(files[0], folderId);
+            if (result.duplicate) {
+                message = `This paper already exists in the library as "${result.filename}"`;
+            }
+        }
+        
+        // Close modal and show the new papers
+        bootstrap.Modal.getInstance('#uploadModal').hide();
+        await syncChanges();
+        
+        // Show the outcome
+        alert(message);
+    } catch (error) {
+        console.error('Error during upload:', error);
+        alert('Upload failed: ' + error.message);
+    } finally {
+        // Hide loading spinner and enable submit button
+        $('#uploadSpinner').hide();
+        $('#uploadFormFields').css('opacity', '1');
+        $('#uploadSubmitBtn').prop('disabled', false);
+    }
+});
+
+async function uploadSingleFile(file, folderId) {
+    if (!file) {
+        throw new Error('No file selected');
+    }
+
+    const formData = new FormData();
+    formData.append('file', file);
+    
+    // Get values from the modal form specifically using the new IDs
+    const metadata = {
+        title: $('#modal_title').val() || file.name,
+        authors: $('#modal_authors').val(),
+        year: $('#modal_year').val() ? parseInt($('#modal_year').val()) : null,
+        category: $('#modal_category').val() || null,
+        tags: $('#modal_tags').val() || [],
+        abstract: $('#modal_abstract').val() || ""
+    };
+    
+    formData.append('metadata', JSON.stringify(metadata));
+    
+    // Add folder_id
+    if (folderId) {
+        formData.append('folder_id', folderId);
+    }
+
+    try {
+        const response = await fetch(`${API_URL}/papers/`, {
+            method: 'POST',
+            body: formData
+        });
+
+        if (response.status === 409) {
+            // File exists conflict
+            const error = await response.json();
+            
+            // Ask user for confirmation
+            const confirmOverride = error.detail.near_duplicate
+                ? confirm(
+                    `This paper looks like a near-duplicate of "${error.detail.filename}" ` +
+                    `(${Math.round(error.detail.similarity * 100)}% similar). Do you want to upload it anyway?`
+                )
+                : confirm(
+                    `A file with the name "${error.detail.filename}" already exists. Do you want to override it?\n\n` +
+                    `Note: This will completely replace the existing file and its metadata.`
+                );
+            
+            if (confirmOverride) {
+                // Retry with override flag
+                formData.append('override', 'true');
+                const retryResponse = await fetch(`${API_URL}/papers/`, {
+                    method: 'POST',
+                    body: formData
+                });
+                
+                if (!retryResponse.ok) {
+                    const retryError = await retryResponse.json();
+                    throw new Error(retryError.detail || 'Upload failed');
+                }
+                
+                return retryResponse.json();
+            } else {
+                throw new Error('Upload cancelled by user');
+            }
+        }
+        
+        if (!response.ok) {
+            const error = await response.json();
+            throw new Error(error.detail || 'Upload failed');
+        }
+        
+        return response.json();
+    } catch (error) {
+        throw error;
+    }
+}
+
+async function uploadBulkFiles(files, folderId) {
+    const formData = new FormData();
+    for (const file of files) {
+        if (file.type === 'application/pdf' || file.name.toLowerCase().endsWith('.zip')) {
+            formData.append('files', file);
+        }
+    }
+    
+    // Shared metadata for every paper, titles come from the file names
+    const metadata = {
+        authors: $('#modal_authors').val(),
+        year: $('#modal_year').val() ? parseInt($('#modal_year').val()) : null,
+        category: $('#modal_category').val() || null,
+        tags: $('#modal_tags').val() || [],
+        abstract: $('#modal_abstract').val() || ""
+    };
+    formData.append('metadata', JSON.stringify(metadata));
+    
+    if (folderId) {
+        formData.append('folder_id', folderId);
+    }
+    
+    const response = await fetch(`${API_URL}/papers/bulk`, {
+        method: 'POST',
+        body: formData
+    });
+    
+    if (!response.ok) {
+        const error = await response.json();
+        throw new Error(error.detail || 'Upload failed');
+    }
+    
+    const { job_id } = await response.json();
+    return waitForJob(job_id);
+}
+
+async function waitForJob(jobId) {
+    // Poll the ingestion job until it finishes
+    while (true) {
+        const response = await fetch(`${API_URL}/jobs/${jobId}`);
+        if (!response.ok) {
+            throw new Error('Failed to get upload progress');
+        }
+        
+        const job = await response.json();
+        $('#uploadProgress').text(`Processed ${job.processed} of ${job.total} papers`);
+        
+        if (job.status === 'completed') {
+            $('#uploadProgress').text('');
+            return job;
+        }
+        if (job.status === 'failed') {
+            $('#uploadProgress').text('');
+            throw new Error(job.error || 'Upload job failed');
+        }
+        
+        await new Promise(resolve => setTimeout(resolve, 1000));
+    }
+}
+
+// View paper
+async function viewPaper(filename) {
+    window.open(`${API_URL}/papers/${filename}`, '_blank');
+}
+
+// Edit metadata
+async function editMetadata(filename) {
+    try {
+        console.log('Fetching paper details for:', filename);
+        const response = await fetch(`${API_URL}/papers/${filename}/metadata`);
+        
+        if (!response.ok) {
+            const errorText = await response.text();
+            console.error('Server response:', response.status, errorText);
+            throw new Error(`Server returned ${response.status}: ${errorText}`);
+        }
+        
+        const paper = await response.json();
+        console.log('Received paper data:', paper);
+        
+        // Parse tags if they're stored as JSON string
+        let tags = [];
+        if (typeof paper.tags === 'string') {
+            try {
+                tags = JSON.parse(paper.tags);
+            } catch (e) {
+                console.warn('Error parsing tags:', e);
+            }
+        } else if (Array.isArray(paper.tags)) {
+            tags = paper.tags;
+        }
+        
+        // Load all available tags from stats
+        const stats = await fetchStats();
+        const allTags = stats.tags;
+        
+        // Populate modal with paper details
+        $('#paperTitle').text(paper.title || filename);
+        
+        // Update the folder options
+        updateFolderSelects();
+        
+        // Add form for editing metadata
+        $('#paperDetails').html(`
+            <form id="editMetadataForm">
+                <input type="hidden" id="editFilename" value="${filename}">
+                <div class="mb-3">
+                    <label class="form-label">Title</label>
+                    <input type="text" class="form-control" id="editTitle" value="${paper.title || ''}">
+                </div>
+                <div class="mb-3">
+                    <label class="form-label">Authors</label>
+                    <input type="text" class="form-control" id="editAuthors" value="${paper.authors || ''}">
+                </div>
+                <div class="mb-3">
+                    <label class="form-label">Year</label>
+                    <input type="number" class="form-control" id="editYear" value="${paper.year || ''}">
+                </div>
+                <div class="mb-3">
+                    <label class="form-label">Folder</label>
+                    <select class="form-control" id="editFolder">
+                        <option value="">No folder</option>
+                        ${allFolders.map(folder => 
+                            `<option value="${folder.id}" ${paper.folder_id === folder.id ? 'selected' : ''}>
+                                ${folder.name}
+                            </option>`
+                        ).join('')}
+                    </select>
+                </div>
+                <div class="mb-3">
+                    <label class="form-label">Category</label>
+                    <input type="text" class="form-control" id="editCategory" value="${paper.category || ''}">
+                </div>
+                <div class="mb-3">
+                    <label class="form-label">Tags</label>
+                    <select class="form-control" id="editTags" multiple>
+                        ${allTags.map(tag => 
+                            `<option value="${tag}" ${tags.includes(tag) ? 'selected' : ''}>${tag}</option>`
+                        ).join('')}
+                    </select>
+                </div>
+                <div class="mb-3">
+                    <label class="form-label">Abstract</label>
+                    <textarea class="form-control" id="editAbstract" rows="3">${paper.abstract || ''}</textarea>
+                </div>
+                <button type="submit" class="btn btn-primary">Save Changes</button>
+            </form>
+        `);
+        
+        // Initialize Select2 for tags in modal with all existing tags
+        $('#editTags').select2({
+            tags: true,
+            tokenSeparators: [',', ' '],
+            dropdownParent: $('#paperDetailsModal')
+        });
+        
+        // Set up form submission handler
+        $('#editMetadataForm').submit(async function(e) {
+            e.preventDefault();
+            
+            const updatedMetadata = {
+                title: $('#editTitle').val(),
+                authors: $('#editAuthors').val(),
+                year: $('#editYear').val() ? parseInt($('#editYear').val()) : null,
+                category: $('#editCategory').val() || null,
+                tags: $('#editTags').val() || [],
+                abstract: $('#editAbstract').val() || "",
+                folder_id: $('#editFolder').val() || null
+            };
+            
+            try {
+                const response = await fetch(`${API_URL}/papers/${filename}/metadata`, {
+                    method: 'PUT',
+                    headers: {
+                        'Content-Type': 'application/json'
+                    },
+                    body: JSON.stringify(updatedMetadata)
+                });
+                
+                if (!response.ok) {
+                    const errorData = await response.text();
+                    console.error('Update response:', response.status, errorData);
+                    throw new Error(`Update failed: ${errorData}`);
+                }
+                
+                alert('Metadata updated successfully');
+                bootstrap.Modal.getInstance('#paperDetailsModal').hide();
+                
+                // Apply the update to the current view
+                await syncChanges();
+            } catch (error) {
+                console.error('Error updating metadata:', error);
+                alert('Failed to update metadata: ' + error.message);
+            }
+        });
+        
+        // Show modal
+        new bootstrap.Modal('#paperDetailsModal').show();
+    } catch (error) {
+        console.error('Error loading paper details:', error);
+        alert('Failed to load paper details: ' + error.message);
+    }
+}
+
+// Delete paper
+async function deletePaper(filename, isTrashItem = false) {
+    const message = isTrashItem 
+        ? 'Are you sure you want to permanently delete this paper? This action cannot be undone.'
+        : 'Move this paper to trash?';
+        
+    if (!confirm(message)) {
+        return;
+    }
+    
+    try {
+        const response = await fetch(`${API_URL}/papers/${filename}?soft_delete=${!isTrashItem}`, {
+            method: 'DELETE'
+        });
+        
+        if (response.ok) {
+            alert(isTrashItem ? 'Paper permanently deleted' : 'Paper moved to trash');
+            
+            // Apply the deletion to the current view
+            await syncChanges();
+        } else {
+            throw new Error('Delete failed');
+        }
+    } catch (error) {
+        console.error('Error deleting paper:', error);
+        alert('Failed to delete paper');
+    }
+}
+
+// Search functionality
+$('#searchInput').on('input', function() {
+    const query = $(this).val();
+    if (query.length >= 3) {
+        searchPapers(query);
+    } else if (query.length === 0) {
+        // Refresh the current view
+        if (currentFolderId) {
+            loadPapersInFolder(currentFolderId);
+        } else {
+            loadDashboard();
+        }
+    }
+});
+
+async function searchPapers(query) {
+    try {
+        const response = await fetch(`${API_URL}/search/?query=${encodeURIComponent(query)}`);
+        const results = await response.json();
+        // Filter out papers that are in trash before updating the display
+        const nonTrashedResults = results.results.filter(r => r.metadata.folder_id !== TRASH_FOLDER_ID);
+        currentListUrl = null;
+        currentListFilter = null;
+        nextOffset = null;
+        updatePapersList(nonTrashedResults.map(r => r.metadata));
+    } catch (error) {
+        console.error('Error searching papers:', error);
+    }
+}
+
+// Show the papers most similar to a paper
+async function showRelatedPapers(filename) {
+    try {
+        const response = await fetch(`${API_URL}/papers/${filename}/related`);
+        const results = await response.json();
+        currentListUrl = null;
+        currentListFilter = null;
+        nextOffset = null;
+        updatePapersList(results.results.map(r => r.metadata));
+    } catch (error) {
+        console.error('Error loading related papers:', error);
+    }
+}
+
+// Filter handlers
+$('#categoryFilter').change(function() {
+    const category = $(this).val();
+    if (category) {
+        filterByCategory(category);
+    } else {
+        // Refresh the current view
+        if (currentFolderId) {
+            loadPapersInFolder(currentFolderId);
+        } else {
+            loadDashboard();
+        }
+    }
+});
+
+$('#tagFilter').change(function() {
+    const selectedTags = $(this).val();
+    if (selectedTags && selectedTags.length > 0) {
+        filterByMultipleTags(selectedTags);
+    } else {
+        // Refresh the current view
+        if (currentFolderId) {
+            loadPapersInFolder(currentFolderId);
+        } else {
+            loadDashboard();
+        }
+    }
+});
+
+async function filterByCategory(category) {
+    try {
+        // Papers in the trash folder are filtered out by the server
+        await loadPaperPage(
+            `${API_URL}/papers/by-category/${encodeURIComponent(category)}`,
+            false,
+            paper => paper.category === category && paper.folder_id !== TRASH_FOLDER_ID
+        );
+    } catch (error) {
+        console.error('Error filtering by category:', error);
+    }
+}
+
+async function filterByMultipleTags(tags) {
+    try {
+        // Get all papers outside the trash first
+        const response = await fetch(`${API_URL}/papers/?exclude_trash=true&fields=${LIST_FIELDS}`);
+        const data = await response.json();
+        
+        // Filter papers that have ANY of the selected tags (OR logic)
+        const filteredPapers = data.papers.filter(paper => {
+            
+            let paperTags = [];
+            try {
+                paperTags = typeof paper.tags === 'string' ? JSON.parse(paper.tags) : paper.tags;
+            } catch (e) {
+                console.warn('Error parsing tags:', e);
+                return false;
+            }
+            return tags.some(tag => paperTags.includes(tag)); // Changed from every() to some()
+        });
+        
+        currentListUrl = null;
+        currentListFilter = null;
+        nextOffset = null;
+        updatePapersList(filteredPapers);
+    } catch (error) {
+        console.error('Error filtering by tags:', error);
+    }
+}
+
+// Reset all filters
+$('#resetFilters').click(function() {
+    // Reset search input
+    $('#searchInput').val('');
+    
+    // Reset category filter
+    $('#categoryFilter').val('').trigger('change');
+    
+    // Reset tag filter
+    $('#tagFilter').val('').trigger('change');
+    
+    // Refresh the current view
+    if (currentFolderId) {
+        loadPapersInFolder(currentFolderId);
+    } else {
+        loadDashboard();
+    }
+});
+
+// Upload handling functions
+function handleFileUpload() {
+    // Clear the form
+    $('#modalUploadForm')[0].reset();
+    
+    // Store the current folder ID in the hidden input
+    const folderToUse = currentFolderId || 'default';
+    $('#modal_uploadFolderId').val(folderToUse);
+    
+    // Update folder select options
+    updateFolderSelects();
+    
+    // Now set the selected option to match the current folder
+    $('#modal_folderSelect').val(folderToUse);
+    
+    // Initialize Select2 for tags
+    $('#modal_tags').select2({
+        tags: true,
+        tokenSeparators: [',', ' '],
+        dropdownParent: $('#uploadModal'),
+        placeholder: 'Add tags...'
+    });
+    
+    // Load existing tags
+    loadTagsForModal();
+    
+    // Show the upload modal
+    new bootstrap.Modal('#uploadModal').show();
+}
+
+// New function to load tags specifically for the modal
+async function loadTagsForModal() {
+    try {
+        const stats = await fetchStats();
+        
+        const tagsSelect = $('#modal_tags');
+        tagsSelect.empty();
+        stats.tags.forEach(tag => {
+            tagsSelect.append(new Option(tag, tag));
+        });
+    } catch (error) {
+        console.error('Error loading tags:', error);
+    }
 }
\ No newline at end of file
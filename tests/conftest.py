@@ -0,0 +1,76 @@
+import json
+import os
+import sys
+import textwrap
+import time
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+@pytest.fixture(scope="session")
+def main(tmp_path_factory):
+    """The app module, imported inside a scratch directory since it keeps the
+    library (db/, research_papers/, folders.json and data/) in the working directory."""
+    os.chdir(tmp_path_factory.mktemp("library"))
+    # Local embeddings, so nothing calls the OpenAI API
+    os.environ["EMBEDDING_MODEL"] = "hashing:64"
+    os.environ.pop("CHROMA_HOST", None)
+    os.environ["ANONYMIZED_TELEMETRY"] = "False"
+    import main
+    return main
+
+
+@pytest.fixture(scope="session")
+def client(main):
+    from fastapi.testclient import TestClient
+    with TestClient(main.app) as client:
+        # Startup builds the indexes in the background
+        deadline = time.monotonic() + 60
+        while client.get("/readyz").status_code != 200:
+            assert time.monotonic() < deadline, client.get("/readyz").json()
+            time.sleep(0.1)
+        yield client
+
+
+def make_pdf(pages):
+    """A minimal PDF with one page of Helvetica text per string in `pages`."""
+    objects = [b"<< /Type /Catalog /Pages 2 0 R >>", None, b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    kids = []
+    for text in pages:
+        lines = textwrap.wrap(text.replace("\\", "").replace("(", "").replace(")", ""), 80) or [""]
+        stream = b"BT /F1 10 Tf 40 800 Td 12 TL " + b" ".join(b"(" + line.encode("latin-1") + b") '" for line in lines) + b" ET"
+        page = len(objects) + 1
+        objects.append(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 842] "
+            f"/Resources << /Font << /F1 3 0 R >> >> /Contents {page + 1} 0 R >>".encode()
+        )
+        objects.append(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+        kids.append(page)
+    objects[1] = f"<< /Type /Pages /Kids [{' '.join(f'{kid} 0 R' for kid in kids)}] /Count {len(kids)} >>".encode()
+    pdf = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(pdf))
+        pdf += f"{number} 0 obj\n".encode() + body + b"\nendobj\n"
+    xref = len(pdf)
+    pdf += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    pdf += b"".join(f"{offset:010d} 00000 n \n".encode() for offset in offsets)
+    pdf += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode()
+    return bytes(pdf)
+
+
+@pytest.fixture
+def upload(client):
+    """Upload a paper with the given page texts and metadata, returning its filename."""
+    def upload(pages, **metadata):
+        response = client.post(
+            "/papers/",
+            files={"file": ("paper.pdf", make_pdf(pages), "application/pdf")},
+            data={"metadata": json.dumps({"authors": "", **metadata})}
+        )
+        assert response.status_code == 200, response.text
+        return response.json()["filename"]
+    return upload
@@ -0,0 +1,39 @@
+def folder_of(client, filename):
+    return client.get(f"/papers/{filename}/metadata").json()["folder_id"]
+
+
+def test_batch_move_reports_missing_papers(client, upload):
+    folder = client.post("/folders/", json={"name": "Batch move", "parent_id": None, "description": ""}).json()
+    first = upload(["simulated annealing schedules " * 30], title="Batch move first")
+    second = upload(["tabu search neighbourhoods " * 30], title="Batch move second")
+
+    response = client.post("/papers/batch/move", json={
+        "filenames": [first, "Batch_missing.pdf", second, "Batch_gone.pdf"], "folder_id": folder["id"]
+    })
+
+    assert response.status_code == 200, response.text
+    assert response.json()["moved"] == 2
+    assert response.json()["not_found"] == ["Batch_missing.pdf", "Batch_gone.pdf"]
+    assert folder_of(client, first) == folder_of(client, second) == folder["id"]
+
+
+def test_batch_move_to_a_missing_folder_moves_nothing(client, upload):
+    filename = upload(["genetic programming bloat " * 30], title="Batch move nowhere")
+
+    response = client.post("/papers/batch/move", json={"filenames": [filename], "folder_id": "no-such-folder"})
+
+    assert response.status_code == 404
+    assert folder_of(client, filename) == "default"
+
+
+def test_batch_delete_reports_missing_papers(client, upload):
+    kept = upload(["ant colony optimisation " * 30], title="Batch kept")
+    deleted = upload(["particle swarm optimisation " * 30], title="Batch deleted")
+
+    response = client.post("/papers/batch/delete", json={"filenames": [deleted, "Batch_missing.pdf", deleted]})
+
+    assert response.status_code == 200, response.text
+    assert response.json()["deleted"] == 1
+    assert response.json()["not_found"] == ["Batch_missing.pdf"]
+    assert client.get(f"/papers/{deleted}/metadata").status_code == 404
+    assert client.get(f"/papers/{kept}/metadata").status_code == 200
@@ -0,0 +1,68 @@
+import io
+import os
+import time
+import zipfile
+
+from conftest import make_pdf
+
+
+def make_zip(members):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as archive:
+        for name, content in members.items():
+            archive.writestr(name, content)
+    return buffer.getvalue()
+
+
+def wait_for_job(client, job_id, timeout=60):
+    deadline = time.monotonic() + timeout
+    while True:
+        job = client.get(f"/jobs/{job_id}").json()
+        if job["status"] in ("completed", "failed"):
+            return job
+        assert time.monotonic() < deadline, job
+        time.sleep(0.05)
+
+
+def test_bulk_upload_reports_each_file(client):
+    bayes = make_pdf(["bayesian optimisation acquisition functions " * 30])
+    archive = make_zip({
+        "Bulk bayes.pdf": bayes,
+        "papers/Bulk graphs.pdf": make_pdf(["graph neural networks message passing " * 30]),
+        "Bulk broken.pdf": b"%PDF-1.4 this is not really a pdf",
+        "Bulk bayes copy.pdf": bayes,
+        "README.txt": b"not a paper",
+        "__MACOSX/._Bulk bayes.pdf": b"resource fork",
+    })
+
+    response = client.post("/papers/bulk", files=[
+        ("files", ("papers.zip", archive, "application/zip")),
+        ("files", ("Bulk sorting.pdf", make_pdf(["cache oblivious sorting algorithms " * 30]), "application/pdf")),
+    ])
+
+    assert response.status_code == 200, response.text
+    assert response.json()["total"] == 5
+    job = wait_for_job(client, response.json()["job_id"])
+    assert job["status"] == "completed", job
+    assert (job["processed"], job["succeeded"], job["failed"], job["skipped"]) == (5, 3, 1, 1)
+    statuses = {result["filename"]: result["status"] for result in job["results"]}
+    assert statuses["Bulk_broken.pdf"] == "failed"
+    assert statuses["Bulk bayes copy.pdf"] == "skipped"
+    for filename in ("Bulk_bayes.pdf", "Bulk_graphs.pdf", "Bulk_sorting.pdf"):
+        assert statuses[filename] == "succeeded"
+        assert client.get(f"/papers/{filename}/metadata").status_code == 200
+    assert client.get("/papers/Bulk_broken.pdf/metadata").status_code == 404
+
+
+def test_bulk_upload_size_limit(client, main, monkeypatch):
+    monkeypatch.setattr(main, "MAX_BULK_UPLOAD_BYTES", 20000)
+    staging = set(os.listdir(main.INGEST_STAGING_DIR))
+    # Small compressed, but larger than the limit once decompressed
+    archive = make_zip({"Bulk large.pdf": make_pdf(["transformer language models " * 2000])})
+    assert len(archive) < 20000
+
+    response = client.post("/papers/bulk", files=[("files", ("large.zip", archive, "application/zip"))])
+
+    assert response.status_code == 413, response.text
+    assert set(os.listdir(main.INGEST_STAGING_DIR)) == staging
+    assert client.get("/papers/Bulk_large.pdf/metadata").status_code == 404
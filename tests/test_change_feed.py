@@ -0,0 +1,75 @@
+FIELDS = "filename,title,folder_id"
+
+
+def snapshot(client):
+    """What a client loads in full: the feed version, then the papers and folders."""
+    version = client.get("/changes").json()["version"]
+    papers = client.get("/papers/", params={"fields": FIELDS}).json()["papers"]
+    folders = client.get("/folders/").json()["folders"]
+    return version, {paper["filename"]: paper for paper in papers}, {folder["id"]: folder for folder in folders}
+
+
+def replay(client, version, papers, folders, limit=2):
+    """Apply the change feed to a copy of the library, a page of `limit` changes at a time."""
+    papers, folders = dict(papers), dict(folders)
+    while True:
+        feed = client.get("/changes", params={"since": version, "limit": limit, "fields": FIELDS}).json()
+        assert not feed["reset"]
+        for change in feed["changes"]:
+            assert change["version"] > version
+            items, state = (papers, change["paper"]) if change["type"] == "paper" else (folders, change["folder"])
+            if state is None:
+                items.pop(change["id"], None)
+            else:
+                items[change["id"]] = state
+        version = feed["version"]
+        if not feed["more"]:
+            return version, papers, folders
+
+
+def test_replaying_the_feed_matches_a_full_reload(client, upload):
+    version, papers, folders = snapshot(client)
+
+    folder = client.post("/folders/", json={"name": "Feed", "parent_id": None, "description": ""}).json()
+    kept = upload(["attention is all you need " * 30], title="Feed kept")
+    deleted = upload(["convolutional networks for images " * 30], title="Feed deleted")
+    client.put(f"/papers/{kept}/metadata", json={"title": "Feed renamed"})
+    client.put(f"/papers/{kept}/move", params={"folder_id": folder["id"]})
+    client.delete(f"/papers/{deleted}", params={"soft_delete": False})
+    client.put(f"/folders/{folder['id']}", json={"name": "Feed renamed"})
+
+    version, papers, folders = replay(client, version, papers, folders)
+
+    assert (version, papers, folders) == snapshot(client)
+    assert papers[kept] == {"filename": kept, "title": "Feed renamed", "folder_id": folder["id"]}
+    assert deleted not in papers
+    assert folders[folder["id"]]["name"] == "Feed renamed"
+
+
+def test_each_item_appears_once_with_its_latest_version(client, upload):
+    version = client.get("/changes").json()["version"]
+    filename = upload(["recurrent networks and sequences " * 30], title="Feed twice")
+    client.put(f"/papers/{filename}/metadata", json={"title": "Feed twice renamed"})
+
+    feed = client.get("/changes", params={"since": version, "fields": "title"}).json()
+
+    changes = [change for change in feed["changes"] if change["id"] == filename]
+    assert len(changes) == 1
+    assert changes[0]["paper"] == {"filename": filename, "title": "Feed twice renamed"}
+    assert changes[0]["version"] == feed["version"]
+
+
+def test_no_changes_keeps_the_version(client):
+    version = client.get("/changes").json()["version"]
+
+    assert client.get("/changes", params={"since": version}).json() == {
+        "version": version, "reset": False, "more": False, "changes": []
+    }
+
+
+def test_unknown_versions_ask_for_a_reload(client):
+    version = client.get("/changes").json()["version"]
+
+    feed = client.get("/changes", params={"since": version + 1000}).json()
+
+    assert feed == {"version": version, "reset": True, "more": False, "changes": []}
@@ -0,0 +1,84 @@
+import pytest
+from fastapi import HTTPException
+from starlette.requests import Request
+
+
+def request(**headers):
+    return Request({
+        "type": "http",
+        "method": "GET",
+        "path": "/",
+        "headers": [(name.replace("_", "-").encode(), value.encode()) for name, value in headers.items()],
+    })
+
+
+@pytest.mark.parametrize("header, expected", [
+    ("bytes=0-99", (0, 99)),
+    ("bytes=100-", (100, 999)),
+    ("bytes=-100", (900, 999)),
+    ("bytes=-5000", (0, 999)),
+    ("bytes=990-5000", (990, 999)),
+    (" Bytes = 5-9", (5, 9)),
+])
+def test_parse_byte_range(main, header, expected):
+    assert main.parse_byte_range(header, 1000) == expected
+
+
+@pytest.mark.parametrize("header", ["items=0-9", "bytes=0-9,20-29", "bytes=9-0", "bytes=a-b", "bytes=-", "bytes=--5"])
+def test_ranges_not_served_get_the_whole_file(main, header):
+    assert main.parse_byte_range(header, 1000) is None
+
+
+@pytest.mark.parametrize("header", ["bytes=1000-", "bytes=5000-6000", "bytes=-0"])
+def test_unsatisfiable_ranges(main, header):
+    with pytest.raises(HTTPException) as raised:
+        main.parse_byte_range(header, 1000)
+
+    assert raised.value.status_code == 416
+    assert raised.value.headers == {"Content-Range": "bytes */1000"}
+
+
+def test_if_none_match(main):
+    etag = '"abc-10"'
+
+    assert main.is_not_modified(request(if_none_match=etag), etag, 0)
+    assert main.is_not_modified(request(if_none_match=f'"other", W/{etag}'), etag, 0)
+    assert main.is_not_modified(request(if_none_match="*"), etag, 0)
+    assert not main.is_not_modified(request(if_none_match='"other"'), etag, 0)
+
+
+def test_if_modified_since(main):
+    mtime = 1700000000.5
+    since = "Tue, 14 Nov 2023 22:13:20 GMT"  # int(mtime)
+
+    assert main.is_not_modified(request(if_modified_since=since), '"e"', mtime)
+    assert not main.is_not_modified(request(if_modified_since=since), '"e"', mtime + 1)
+    assert not main.is_not_modified(request(if_modified_since="yesterday"), '"e"', mtime)
+    assert not main.is_not_modified(request(), '"e"', mtime)
+
+
+def test_if_none_match_takes_precedence(main):
+    headers = {"if_none_match": '"other"', "if_modified_since": "Tue, 14 Nov 2023 22:13:20 GMT"}
+
+    assert not main.is_not_modified(request(**headers), '"e"', 1700000000)
+
+
+def test_file_response_revalidation_and_ranges(main, tmp_path):
+    path = tmp_path / "paper.pdf"
+    path.write_bytes(bytes(range(256)) * 4)
+
+    full = main.file_response(request(), str(path), "application/pdf")
+    etag = full.headers["etag"]
+    assert full.status_code == 200
+    assert full.headers["accept-ranges"] == "bytes"
+
+    assert main.file_response(request(if_none_match=etag), str(path), "application/pdf").status_code == 304
+
+    partial = main.file_response(request(range="bytes=10-19", if_range=etag), str(path), "application/pdf")
+    assert partial.status_code == 206
+    assert partial.headers["content-range"] == "bytes 10-19/1024"
+    assert b"".join(main.iter_file_range(str(path), 10, 10)) == bytes(range(10, 20))
+
+    # A stale If-Range gets the whole current file
+    stale = main.file_response(request(range="bytes=10-19", if_range='"old"'), str(path), "application/pdf")
+    assert stale.status_code == 200
@@ -0,0 +1,110 @@
+import asyncio
+import json
+
+import httpx
+import pytest
+
+
+class FakeEmbeddingsAPI:
+    """An OpenAI-compatible /embeddings endpoint. Each input is embedded as
+    [len(text), 1.0], and the first responses can be replaced by errors."""
+
+    def __init__(self, failures=()):
+        self.requests = []
+        self.failures = list(failures)
+
+    def __call__(self, request):
+        inputs = json.loads(request.content)["input"]
+        self.requests.append(inputs)
+        if self.failures:
+            status = self.failures.pop(0)
+            return httpx.Response(status, json={"error": {"message": f"status {status}", "type": "server_error"}})
+        return httpx.Response(200, json={
+            "object": "list",
+            "model": "text-embedding-3-small",
+            # Out of order, as the API does not promise otherwise
+            "data": [
+                {"object": "embedding", "index": i, "embedding": [float(len(text)), 1.0]}
+                for i, text in reversed(list(enumerate(inputs)))
+            ],
+            "usage": {"prompt_tokens": 1, "total_tokens": 1},
+        })
+
+
+@pytest.fixture
+def api(main, monkeypatch):
+    from openai import OpenAI
+    api = FakeEmbeddingsAPI()
+    monkeypatch.setattr(main, "client", OpenAI(
+        api_key="test",
+        base_url="http://embeddings.test/v1",
+        max_retries=0,
+        http_client=httpx.Client(transport=httpx.MockTransport(api))
+    ))
+    return api
+
+
+def batcher(main, **kwargs):
+    provider = main.OpenAIEmbeddingProvider("openai:text-embedding-3-small")
+    return main.EmbeddingBatcher(embed_fn=provider.embed, **{"window": 0.05, **kwargs})
+
+
+def run(*coroutines):
+    async def gather():
+        return await asyncio.gather(*coroutines, return_exceptions=True)
+    return asyncio.run(gather())
+
+
+def test_concurrent_callers_share_one_request(main, api):
+    embedder = batcher(main)
+
+    first, second = run(embedder.embed(["a", "bb"]), embedder.embed(["ccc"]))
+
+    assert api.requests == [["a", "bb", "ccc"]]
+    assert first == [[1.0, 1.0], [2.0, 1.0]]
+    assert second == [[3.0, 1.0]]
+
+
+def test_large_inputs_are_split(main, api):
+    embedder = batcher(main, max_batch_size=3, max_batch_tokens=9)
+    # About 2 tokens each, then 8 and 1
+    texts = ["x" * 7] * 7 + ["y" * 30, "z"]
+
+    embeddings, = run(embedder.embed(texts))
+
+    assert embeddings == [[float(len(text)), 1.0] for text in texts]
+    # Three inputs at most, and 9 tokens at most
+    assert sorted(api.requests) == sorted([texts[0:3], texts[3:6], texts[6:7], texts[7:9]])
+
+
+def test_transient_errors_are_retried(main, api):
+    api.failures = [429, 500]
+    embedder = batcher(main)
+    retries = main.REGISTRY.get_sample_value("papers_embedding_retries_total")
+
+    embeddings, = run(embedder.embed(["a", "bb"]))
+
+    assert embeddings == [[1.0, 1.0], [2.0, 1.0]]
+    assert api.requests == [["a", "bb"]] * 3
+    assert main.REGISTRY.get_sample_value("papers_embedding_retries_total") == retries + 2
+
+
+def test_errors_reach_every_caller(main, api):
+    from openai import BadRequestError, InternalServerError
+    api.failures = [400]
+    embedder = batcher(main)
+
+    first, second = run(embedder.embed(["a"]), embedder.embed(["b"]))
+
+    # Not retried, and both callers of the failed request get the error
+    assert api.requests == [["a", "b"]]
+    assert isinstance(first, BadRequestError) and isinstance(second, BadRequestError)
+
+    api.requests.clear()
+    api.failures = [503, 503]
+    embedder = batcher(main, max_retries=1)
+
+    first, second = run(embedder.embed(["a"]), embedder.embed(["b"]))
+
+    assert len(api.requests) == 2
+    assert isinstance(first, InternalServerError) and isinstance(second, InternalServerError)
@@ -0,0 +1,76 @@
+import json
+import os
+
+import pytest
+
+
+@pytest.fixture
+def store(main, tmp_path):
+    return main.FolderStore(str(tmp_path / "folders.json"), str(tmp_path / "folders.json.lock"))
+
+
+def add_folder(folders_data, folder_id, parent_id=None):
+    folders_data["folders"].append({"id": folder_id, "name": folder_id, "parent_id": parent_id, "description": ""})
+
+
+def test_new_store_has_the_default_and_trash_folders(store):
+    assert {folder["id"] for folder in store.load()["folders"]} == {"default", "trash"}
+    assert os.path.exists(store.path)
+
+
+def test_transaction_is_written_and_reloaded(main, store, tmp_path):
+    with store.transaction() as folders_data:
+        add_folder(folders_data, "papers")
+        add_folder(folders_data, "drafts", parent_id="papers")
+
+    # Replaced in one rename, so no temp files are left behind
+    assert sorted(os.listdir(tmp_path)) == ["folders.json", "folders.json.lock"]
+    with open(store.path) as f:
+        assert {folder["id"] for folder in json.load(f)["folders"]} == {"default", "trash", "papers", "drafts"}
+
+    # Another process sees the change, and this one sees the other's
+    other = main.FolderStore(store.path, store.lock_path)
+    assert other.exists("drafts")
+    assert other.descendants("papers") == ["drafts"]
+    with other.transaction() as folders_data:
+        add_folder(folders_data, "notes", parent_id="drafts")
+    assert store.exists("notes")
+    assert store.descendants("papers") == ["drafts", "notes"]
+
+
+def test_failed_transaction_is_discarded(store):
+    with store.transaction() as folders_data:
+        add_folder(folders_data, "papers")
+    with open(store.path) as f:
+        saved = f.read()
+
+    with pytest.raises(RuntimeError):
+        with store.transaction() as folders_data:
+            folders_data["folders"] = [folder for folder in folders_data["folders"] if folder["id"] != "papers"]
+            add_folder(folders_data, "drafts")
+            raise RuntimeError("interrupted")
+
+    assert store.exists("papers")
+    assert not store.exists("drafts")
+    with open(store.path) as f:
+        assert f.read() == saved
+
+
+def test_recursive_delete_moves_papers_to_the_trash(client, upload):
+    parent = client.post("/folders/", json={"name": "Folder parent", "parent_id": None, "description": ""}).json()
+    child = client.post("/folders/", json={"name": "Folder child", "parent_id": parent["id"], "description": ""}).json()
+    in_parent = upload(["monte carlo tree search " * 30], title="Folder paper parent")
+    in_child = upload(["policy gradient methods " * 30], title="Folder paper child")
+    client.put(f"/papers/{in_parent}/move", params={"folder_id": parent["id"]})
+    client.put(f"/papers/{in_child}/move", params={"folder_id": child["id"]})
+
+    response = client.delete(f"/folders/{parent['id']}", params={"recursive": True})
+
+    assert response.status_code == 200, response.text
+    assert response.json()["deleted_folders"] == 2
+    folder_ids = {folder["id"] for folder in client.get("/folders/").json()["folders"]}
+    assert parent["id"] not in folder_ids and child["id"] not in folder_ids
+    for filename, original in ((in_parent, parent), (in_child, child)):
+        metadata = client.get(f"/papers/{filename}/metadata").json()
+        assert metadata["folder_id"] == "trash"
+        assert metadata["original_folder_id"] == original["id"]
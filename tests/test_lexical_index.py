@@ -0,0 +1,55 @@
+import pytest
+
+
+@pytest.fixture
+def index(main):
+    index = main.LexicalIndex()
+    index.add(
+        ["a.pdf#0", "a.pdf#1", "b.pdf#0", "c.pdf#0"],
+        [
+            "transformers use attention over tokens",
+            "training data and evaluation",
+            "attention attention attention is all you need",
+            "convolutional networks for images",
+        ]
+    )
+    return index
+
+
+def test_ranks_by_term_frequency(index):
+    ranked = index.search("attention", 10)
+
+    assert [doc_id for doc_id, _ in ranked] == ["b.pdf#0", "a.pdf#0"]
+    assert ranked[0][1] > ranked[1][1] > 0
+
+
+def test_rare_terms_weigh_more(index):
+    ranked = dict(index.search("attention images", 10))
+
+    # Both match one query term once, but "images" occurs in fewer passages
+    assert ranked["c.pdf#0"] > ranked["a.pdf#0"]
+
+
+def test_limit_and_accept(index):
+    assert len(index.search("attention images", 1)) == 1
+    assert [doc_id for doc_id, _ in index.search("attention", 10, accept=lambda paper_id: paper_id != "b.pdf")] == ["a.pdf#0"]
+
+
+def test_unknown_terms_match_nothing(index):
+    assert index.search("quantum", 10) == []
+
+
+def test_remove_paper(index):
+    index.remove_paper("b.pdf")
+
+    assert [doc_id for doc_id, _ in index.search("attention", 10)] == ["a.pdf#0"]
+    assert "b.pdf#0" not in index.doc_lengths
+    assert index.total_length == sum(index.doc_lengths.values())
+
+
+def test_re_adding_a_passage_replaces_it(index):
+    index.add(["c.pdf#0"], ["recurrent networks"])
+
+    assert index.search("images", 10) == []
+    assert [doc_id for doc_id, _ in index.search("recurrent", 10)] == ["c.pdf#0"]
+    assert index.total_length == sum(index.doc_lengths.values())
@@ -0,0 +1,90 @@
+import random
+
+import pytest
+
+WORDS = [f"word{i}" for i in range(2000)]
+
+
+def text(seed, length=400):
+    rng = random.Random(seed)
+    return " ".join(rng.choice(WORDS) for _ in range(length))
+
+
+def edit(original, fraction, seed):
+    """Replace a fraction of the words of a text."""
+    rng = random.Random(seed)
+    words = original.split()
+    for i in rng.sample(range(len(words)), int(len(words) * fraction)):
+        words[i] = rng.choice(WORDS)
+    return " ".join(words)
+
+
+def test_signature_is_deterministic(main):
+    signature = main.minhash_signature([text(1)])
+
+    assert len(signature) == main.MINHASH_SIZE
+    assert signature == main.minhash_signature([text(1)])
+
+
+def test_no_signature_without_words(main):
+    assert main.minhash_signature(["", " \n"]) is None
+
+
+def test_short_texts_fill_every_bucket(main):
+    signature = main.minhash_signature(["a few words only"])
+
+    assert all(value < 1 << 64 for value in signature)
+    assert main.signature_similarity(signature, main.minhash_signature(["a few words only"])) == 1.0
+
+
+def test_similarity_tracks_how_much_text_is_shared(main):
+    original = text(1)
+    signature = main.minhash_signature([original])
+
+    close = main.signature_similarity(signature, main.minhash_signature([edit(original, 0.02, 2)]))
+    far = main.signature_similarity(signature, main.minhash_signature([edit(original, 0.5, 3)]))
+    unrelated = main.signature_similarity(signature, main.minhash_signature([text(4)]))
+
+    assert close > main.NEAR_DUPLICATE_THRESHOLD > far > unrelated
+    assert unrelated < 0.1
+
+
+@pytest.fixture
+def near_duplicates(main, tmp_path):
+    index = main.NearDuplicateIndex(str(tmp_path / "near_duplicates.sqlite3"))
+    yield index
+    index.conn.close()
+
+
+def test_claim_finds_near_duplicates_through_the_bands(main, near_duplicates):
+    original = text(1)
+    assert near_duplicates.claim("original.pdf", main.minhash_signature([original])) is None
+    assert near_duplicates.claim("other.pdf", main.minhash_signature([text(5)])) is None
+
+    paper_id, similarity = near_duplicates.claim("copy.pdf", main.minhash_signature([edit(original, 0.02, 2)]))
+
+    assert paper_id == "original.pdf"
+    assert similarity >= main.NEAR_DUPLICATE_THRESHOLD
+    assert "copy.pdf" not in near_duplicates.signatures
+
+
+def test_removed_signatures_leave_the_bands(main, near_duplicates):
+    signature = main.minhash_signature([text(1)])
+    near_duplicates.add("original.pdf", signature)
+    assert near_duplicates.find(signature) == ("original.pdf", 1.0)
+
+    near_duplicates.remove(["original.pdf"])
+
+    assert near_duplicates.find(signature) is None
+    assert all(not bucket for bucket in near_duplicates.buckets)
+
+
+def test_loading_drops_signatures_of_papers_not_in_the_library(main, near_duplicates, tmp_path):
+    near_duplicates.add("gone.pdf", main.minhash_signature([text(1)]))
+
+    reopened = main.NearDuplicateIndex(str(tmp_path / "near_duplicates.sqlite3"))
+    reopened.ensure_loaded()
+
+    assert reopened.signatures == {}
+    assert reopened.conn.execute("SELECT COUNT(*) FROM signatures").fetchone()[0] == 0
+    reopened.conn.close()
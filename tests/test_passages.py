@@ -0,0 +1,36 @@
+def words(start, stop):
+    return [f"w{i}" for i in range(start, stop)]
+
+
+def test_passages_overlap_and_cover_every_word(main):
+    passages = list(main.iter_passages([" ".join(words(0, 25))], max_tokens=10, overlap=3))
+
+    assert [passage.split() for passage in passages] == [words(0, 10), words(7, 17), words(14, 24), words(21, 25)]
+
+
+def test_passages_span_page_boundaries(main):
+    pages = [" ".join(words(0, 4)), "", " ".join(words(4, 9))]
+
+    assert list(main.iter_passages(pages, max_tokens=6, overlap=0)) == [" ".join(words(0, 6)), " ".join(words(6, 9))]
+
+
+def test_no_trailing_passage_of_overlap_only(main):
+    passages = list(main.iter_passages([" ".join(words(0, 10))], max_tokens=10, overlap=3))
+
+    assert passages == [" ".join(words(0, 10))]
+
+
+def test_overlap_is_capped_below_the_passage_size(main):
+    passages = list(main.iter_passages([" ".join(words(0, 6))], max_tokens=3, overlap=5))
+
+    assert [passage.split() for passage in passages] == [words(0, 3), words(1, 4), words(2, 5), words(3, 6)]
+
+
+def test_empty_text_has_no_passages(main):
+    assert list(main.iter_passages(["", "   \n"], max_tokens=10, overlap=2)) == []
+
+
+def test_passage_ids_round_trip(main):
+    passage_id = main.passage_id("notes#2.pdf", 7)
+
+    assert main.parse_passage_id(passage_id) == ("notes#2.pdf", 7)
@@ -0,0 +1,172 @@
+import json
+import os
+import threading
+import time
+
+import pytest
+
+from conftest import make_pdf
+
+TOPICS = {
+    "Reindex galaxies": "galaxy formation dark matter halo cosmology redshift",
+    "Reindex proteins": "protein folding molecular chaperone amino acid",
+    "Reindex compilers": "compiler register allocation parser bytecode",
+}
+
+
+def wait_for_job(client, job_id, timeout=60):
+    deadline = time.monotonic() + timeout
+    while True:
+        job = client.get(f"/jobs/{job_id}").json()
+        if job["status"] in ("completed", "failed"):
+            return job
+        assert time.monotonic() < deadline, job
+        time.sleep(0.05)
+
+
+def reindex(client, model):
+    response = client.post("/reindex", params={"embedding_model": model})
+    assert response.status_code == 200, response.text
+    return wait_for_job(client, response.json()["job_id"])
+
+
+def top_titles(client, query, mode):
+    results = client.get("/search/", params={"query": query, "mode": mode, "n_results": 1}).json()["results"]
+    return [result["metadata"]["title"] for result in results]
+
+
+def assert_library_consistent(main):
+    """Every paper's passage_count matches its passages in the live collection,
+    embedded with the live model."""
+    dimensions = int(main.EMBEDDING_MODEL.split(":")[1])
+    for filename, metadata in main.get_paper_index().papers.items():
+        stored = main.passages.get(where={"paper_id": filename}, include=["embeddings"])
+        assert len(stored["ids"]) == metadata["passage_count"], filename
+        assert {len(embedding) for embedding in stored["embeddings"]} == {dimensions}, filename
+
+
+@pytest.fixture(scope="module")
+def library(client, main):
+    filenames = {}
+    for title, text in TOPICS.items():
+        response = client.post(
+            "/papers/",
+            files={"file": ("paper.pdf", make_pdf([(text + " ") * 150]), "application/pdf")},
+            data={"metadata": json.dumps({"title": title, "authors": ""})}
+        )
+        assert response.status_code == 200, response.text
+        filenames[title] = response.json()["filename"]
+    return filenames
+
+
+def test_reindex_to_a_new_model_keeps_search_and_passages(client, main, library):
+    before = {title: top_titles(client, text, "vector") for title, text in TOPICS.items()}
+    old_collections = (main.collection.name, main.passages.name)
+
+    job = reindex(client, "hashing:48")
+
+    assert job["status"] == "completed", job
+    assert job["failed"] == 0
+    assert main.EMBEDDING_MODEL == "hashing:48"
+    assert (main.collection.name, main.passages.name) != old_collections
+    with open(main.COLLECTIONS_FILE) as f:
+        assert json.load(f)["embedding_model"] == "hashing:48"
+    assert not os.path.exists(main.REINDEX_STATE_FILE)
+    assert_library_consistent(main)
+    for title, text in TOPICS.items():
+        assert before[title] == [title]
+        assert top_titles(client, text, "vector") == [title]
+        assert top_titles(client, text, "lexical") == [title]
+
+
+def test_unchanged_papers_are_copied(client, main, library):
+    job = reindex(client, main.EMBEDDING_MODEL)
+
+    assert job["status"] == "completed", job
+    assert job["unchanged"] == job["total"] > 0
+    assert_library_consistent(main)
+
+
+def test_interrupted_reindex_resumes(client, main, library, monkeypatch):
+    reindex_paper = main.reindex_paper
+    failing = library["Reindex proteins"]
+
+    async def fail_one(job, writer, semaphore, filename, metadata, model):
+        if filename == failing:
+            main.record_job_result(job, filename, "failed", "interrupted")
+            return
+        await reindex_paper(job, writer, semaphore, filename, metadata, model)
+
+    monkeypatch.setattr(main, "reindex_paper", fail_one)
+    live = main.collection.name
+    job = reindex(client, "hashing:40")
+    assert job["status"] == "failed"
+    assert main.collection.name == live
+    assert main.EMBEDDING_MODEL == "hashing:48"
+    assert os.path.exists(main.REINDEX_STATE_FILE)
+
+    monkeypatch.setattr(main, "reindex_paper", reindex_paper)
+    job = reindex(client, "hashing:40")
+
+    assert job["status"] == "completed", job
+    # Only the paper that failed is left to do, the others are in the shadow collections
+    assert job["reembedded"] + job["reextracted"] + job["unchanged"] == 1
+    assert job["processed"] == job["total"] == len(main.get_paper_index().papers)
+    assert main.EMBEDDING_MODEL == "hashing:40"
+    assert_library_consistent(main)
+    assert top_titles(client, TOPICS["Reindex proteins"], "vector") == ["Reindex proteins"]
+
+
+def test_paper_uploaded_while_the_indexes_are_built_survives_the_swap(client, main, library, monkeypatch):
+    build = main.LexicalIndex.build
+    uploaded = {}
+
+    def build_and_upload(self, source_collection, *args, **kwargs):
+        build(self, source_collection, *args, **kwargs)
+        if source_collection is not main.passages and not uploaded:
+            # The shadow collections are complete, the live ones are still in use
+            response = client.post(
+                "/papers/",
+                files={"file": ("late.pdf", make_pdf(["quantum error correction surface code " * 150]), "application/pdf")},
+                data={"metadata": json.dumps({"title": "Reindex late", "authors": ""})}
+            )
+            uploaded.update(response.json())
+
+    monkeypatch.setattr(main.LexicalIndex, "build", build_and_upload)
+    job = reindex(client, "hashing:56")
+
+    assert job["status"] == "completed", job
+    assert uploaded["filename"] in main.get_paper_index()
+    assert_library_consistent(main)
+    assert top_titles(client, "quantum error correction surface code", "vector") == ["Reindex late"]
+
+
+def test_upload_embedding_when_the_collections_are_swapped(client, main, library, monkeypatch):
+    get_embeddings = main.get_embeddings
+    swapped = threading.Event()
+
+    async def swap_first(texts, model=None):
+        if not swapped.is_set() and texts and texts[0].startswith("topological"):
+            # Reindex to another model while this upload has embedded its first batch
+            embeddings = await get_embeddings(texts, model)
+            swapped.set()
+            job = main.new_reindex_job()
+            await main.run_reindex(job, "hashing:24")
+            assert job["status"] == "completed", job
+            return embeddings
+        return await get_embeddings(texts, model)
+
+    monkeypatch.setattr(main, "get_embeddings", swap_first)
+    monkeypatch.setattr(main, "EMBEDDING_BATCH_SIZE", 4)
+    response = client.post(
+        "/papers/",
+        files={"file": ("mid.pdf", make_pdf(["topological insulators band structure " * 600]), "application/pdf")},
+        data={"metadata": json.dumps({"title": "Reindex midway", "authors": ""})}
+    )
+
+    assert response.status_code == 200, response.text
+    assert swapped.is_set()
+    assert main.EMBEDDING_MODEL == "hashing:24"
+    assert main.get_paper_index().get(response.json()["filename"])["passage_count"] > 1
+    assert_library_consistent(main)
+    assert top_titles(client, "topological insulators band structure", "vector") == ["Reindex midway"]
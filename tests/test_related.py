@@ -0,0 +1,72 @@
+import uuid
+
+import pytest
+
+
+@pytest.fixture
+def papers(main):
+    """A papers collection of its own, with embeddings whose distances are easy to reason about."""
+    client = main.get_chroma_client()
+    papers = client.create_collection(f"related_{uuid.uuid4().hex[:8]}")
+    yield papers
+    client.delete_collection(papers.name)
+
+
+def add_papers(papers, positions):
+    papers.add(
+        ids=list(positions),
+        embeddings=[[float(x), 0.0] for x in positions.values()],
+        documents=list(positions),
+    )
+
+
+@pytest.fixture
+def related(main, tmp_path):
+    related = main.RelatedPapers(str(tmp_path / "related.sqlite3"), neighbours=2)
+    yield related
+    related.conn.close()
+
+
+def test_neighbours_nearest_first(papers, related):
+    add_papers(papers, {"a": 0, "b": 1, "c": 3, "d": 6})
+
+    assert [paper_id for paper_id, _ in related.lookup("a", papers, 2, lambda paper_id: True)] == ["b", "c"]
+    assert [paper_id for paper_id, _ in related.lookup("a", papers, 1, lambda paper_id: True)] == ["b"]
+
+
+def test_rejected_neighbours_do_not_take_up_slots(papers, related):
+    add_papers(papers, {"a": 0, "b": 1, "c": 2, "d": 3, "e": 4, "f": 5})
+    related.link(["a"], papers)
+    trash = {"b", "c", "d"}
+
+    neighbours = related.lookup("a", papers, 2, lambda paper_id: paper_id not in trash)
+
+    assert [paper_id for paper_id, _ in neighbours] == ["e", "f"]
+    assert neighbours[0][1] == pytest.approx(16)
+
+
+def test_fewer_neighbours_than_the_limit_when_the_library_runs_out(papers, related):
+    add_papers(papers, {"a": 0, "b": 1, "c": 2})
+
+    assert [paper_id for paper_id, _ in related.lookup("a", papers, 2, lambda paper_id: paper_id != "b")] == ["c"]
+
+
+def test_a_paper_without_neighbours_is_linked_once(papers, related, monkeypatch):
+    add_papers(papers, {"alone": 0})
+    link = related.link
+    linked = []
+    monkeypatch.setattr(related, "link", lambda paper_ids, source: linked.append(paper_ids) or link(paper_ids, source))
+
+    assert related.lookup("alone", papers, 2, lambda paper_id: True) == []
+    assert related.lookup("alone", papers, 2, lambda paper_id: True) == []
+    assert linked == [["alone"]]
+
+
+def test_new_papers_join_the_lists_of_their_neighbours(papers, related):
+    add_papers(papers, {"alone": 0})
+    related.lookup("alone", papers, 2, lambda paper_id: True)
+
+    add_papers(papers, {"new": 1})
+    related.link(["new"], papers)
+
+    assert [paper_id for paper_id, _ in related.lookup("alone", papers, 2, lambda paper_id: True)] == ["new"]
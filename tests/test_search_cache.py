@@ -0,0 +1,26 @@
+QUERY = "hydrothermal vent chemosynthesis"
+
+
+def search(client, **params):
+    response = client.get("/search/", params={"query": QUERY, "mode": "lexical", **params})
+    assert response.status_code == 200, response.text
+    return [result["metadata"] for result in response.json()["results"]]
+
+
+def test_cached_results_follow_edits_and_the_trash(client, main, upload):
+    filename = upload([(QUERY + " deep sea ") * 30], title="Cache vents", category="Cache oceans")
+    assert [paper["title"] for paper in search(client)] == ["Cache vents"]
+    hits = main.search_cache.hits
+    assert [paper["title"] for paper in search(client)] == ["Cache vents"]
+    assert main.search_cache.hits == hits + 1
+    assert [paper["filename"] for paper in search(client, category="Cache oceans")] == [filename]
+
+    client.put(f"/papers/{filename}/metadata", json={"title": "Cache vents renamed", "category": "Cache geology"})
+
+    assert [paper["title"] for paper in search(client)] == ["Cache vents renamed"]
+    assert search(client, category="Cache oceans") == []
+
+    client.delete(f"/papers/{filename}")
+
+    assert search(client) == []
+    assert [paper["folder_id"] for paper in search(client, include_trash=True)] == ["trash"]
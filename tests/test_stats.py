@@ -0,0 +1,46 @@
+import json
+from collections import Counter
+
+
+def recount(client, exclude_trash=False):
+    """The statistics computed from scratch from the paper listing."""
+    papers = client.get("/papers/", params={"exclude_trash": exclude_trash}).json()["papers"]
+    categories, tags, years = Counter(), set(), Counter()
+    for paper in papers:
+        if paper.get("category"):
+            categories[paper["category"]] += 1
+        tags.update(json.loads(paper.get("tags") or "[]"))
+        if paper.get("year"):
+            years[str(paper["year"])] += 1
+    return {"total_papers": len(papers), "categories": dict(categories), "tags": sorted(tags), "years": dict(years)}
+
+
+def assert_stats_match(client):
+    assert client.get("/stats").json() == recount(client)
+    assert client.get("/stats", params={"exclude_trash": True}).json() == recount(client, exclude_trash=True)
+
+
+def test_stats_follow_every_change(client, upload):
+    first = upload(["stellar nucleosynthesis " * 30], title="Stats first", category="Stats physics", year=2001, tags=["stats-a", "stats-b"])
+    second = upload(["enzyme kinetics " * 30], title="Stats second", category="Stats biology", year=2002, tags=["stats-b"])
+    assert_stats_match(client)
+
+    client.put(f"/papers/{first}/metadata", json={"category": "Stats chemistry", "year": 2003, "tags": ["stats-c"]})
+    assert_stats_match(client)
+    stats = client.get("/stats").json()
+    assert "stats-a" not in stats["tags"] and "stats-c" in stats["tags"]
+    assert stats["categories"]["Stats chemistry"] >= 1
+
+    client.delete(f"/papers/{second}")
+    assert_stats_match(client)
+    assert "Stats biology" in client.get("/stats").json()["categories"]
+    assert "Stats biology" not in client.get("/stats", params={"exclude_trash": True}).json()["categories"]
+    assert client.get("/stats", params={"folder_id": "trash"}).json()["categories"].get("Stats biology") == 1
+
+    client.put(f"/papers/{second}/move", params={"folder_id": "default"})
+    assert_stats_match(client)
+    assert "Stats biology" in client.get("/stats", params={"exclude_trash": True}).json()["categories"]
+
+    client.delete(f"/papers/{second}", params={"soft_delete": False})
+    assert_stats_match(client)
+    assert "Stats biology" not in client.get("/stats").json()["categories"]
@@ -0,0 +1,83 @@
+import numpy as np
+import pytest
+
+
+def embeddings(count, dimensions=16, seed=0):
+    return np.random.default_rng(seed).normal(size=(count, dimensions)).astype(np.float32)
+
+
+@pytest.fixture(params=["float16", "int8"])
+def store(main, tmp_path, request):
+    store = main.QuantizedVectorStore(str(tmp_path / "vectors" / "passages.f"), request.param)
+    yield store
+    store.conn.close()
+
+
+def test_round_trip(main, store):
+    vectors = embeddings(3)
+    store.add([main.passage_id("a.pdf", i) for i in (2, 0, 1)], vectors.tolist())
+
+    restored = store.paper_embeddings("a.pdf")
+
+    # In chunk order, within the precision of the store's dtype
+    tolerance = 0.02 if store.dtype == np.int8 else 0.002
+    np.testing.assert_allclose(restored, vectors[[1, 2, 0]], atol=tolerance * np.abs(vectors).max())
+    assert len(store) == 3
+
+
+def test_search_finds_the_nearest_passages(main, store):
+    vectors = embeddings(50)
+    store.add([main.passage_id(f"p{i // 5}.pdf", i % 5) for i in range(50)], vectors.tolist())
+
+    ranked = store.search(vectors[17].tolist(), 3)
+    exact = np.argsort(((vectors - vectors[17]) ** 2).sum(axis=1))[:3]
+
+    assert ranked[0][0] == main.passage_id("p3.pdf", 2)
+    assert ranked[0][1] == pytest.approx(0, abs=0.05)
+    assert [doc_id for doc_id, _ in ranked] == [main.passage_id(f"p{i // 5}.pdf", i % 5) for i in exact]
+
+
+def test_search_filters(main, store):
+    vectors = embeddings(20)
+    store.add([main.passage_id(f"p{i // 5}.pdf", i % 5) for i in range(20)], vectors.tolist())
+
+    restricted = store.search(vectors[0].tolist(), 20, papers=["p2.pdf"])
+    accepted = store.search(vectors[0].tolist(), 3, accept=lambda paper_id: paper_id == "p3.pdf")
+
+    assert {main.parse_passage_id(doc_id)[0] for doc_id, _ in restricted} == {"p2.pdf"}
+    assert len(restricted) == 5
+    assert {main.parse_passage_id(doc_id)[0] for doc_id, _ in accepted} == {"p3.pdf"}
+    assert len(accepted) == 3
+
+
+def test_removed_papers_are_not_found(main, store):
+    vectors = embeddings(10)
+    store.add([main.passage_id(f"p{i // 5}.pdf", i % 5) for i in range(10)], vectors.tolist())
+
+    store.remove_papers(["p0.pdf"])
+
+    assert len(store) == 5
+    assert all(doc_id.startswith("p1.pdf") for doc_id, _ in store.search(vectors[0].tolist(), 10))
+    assert store.paper_embeddings("p0.pdf").shape == (0, 16)
+
+
+def test_another_process_sees_appended_rows(main, store):
+    path = store.path
+    store.add([main.passage_id("a.pdf", 0)], embeddings(1).tolist())
+    reader = main.QuantizedVectorStore(path, store.dtype.name)
+    assert len(reader) == 1
+
+    store.add([main.passage_id("b.pdf", 0)], embeddings(1, seed=1).tolist())
+    reader.refresh()
+
+    assert len(reader) == 2
+    np.testing.assert_array_equal(reader.paper_embeddings("b.pdf"), store.paper_embeddings("b.pdf"))
+    reader.conn.close()
+
+
+def test_dimensions_are_fixed_by_the_first_rows(main, store):
+    store.add([main.passage_id("a.pdf", 0)], embeddings(1).tolist())
+
+    with pytest.raises(ValueError):
+        store.add([main.passage_id("b.pdf", 0)], embeddings(1, dimensions=8).tolist())
+    assert len(store) == 1